@@ -0,0 +1,64 @@
+"""
+Run all benchmarks, optionally saving or comparing with a baseline
+
+    python -m benchmarks --save benchmarks/baseline.json
+    python -m benchmarks --compare benchmarks/baseline.json --threshold 0.25
+
+With --compare the exit status is 1 when any benchmark is slower than
+the baseline by more than the threshold.
+"""
+from __future__ import print_function
+
+import argparse
+import importlib
+import sys
+
+from benchmarks import harness
+
+MODULES = (
+    'benchmarks.bench_schemas',
+    'benchmarks.bench_validate',
+    'benchmarks.bench_subfields',
+    'benchmarks.bench_composite',
+    'benchmarks.bench_datetime',
+    'benchmarks.bench_language_text',
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('-k', '--match',
+                        help='only run benchmarks with this text in their name')
+    parser.add_argument('--save', metavar='PATH',
+                        help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare the results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown before failing, '
+                             'default 0.25 (25%%)')
+    args = parser.parse_args(argv)
+
+    calibration = harness.calibrate()
+    print('{0:<60} {1:>12.2f} us'.format('calibration', calibration * 1e6))
+    results = {}
+    for name in MODULES:
+        module = importlib.import_module(name)
+        results.update(harness.run(module.BENCHMARKS, match=args.match))
+
+    if args.save:
+        harness.save_baseline(args.save, results, calibration)
+    if args.compare:
+        baseline, baseline_calibration = harness.load_baseline(args.compare)
+        regressions = harness.compare(
+            results, calibration, baseline, baseline_calibration,
+            args.threshold)
+        for name, ratio in regressions:
+            print('REGRESSION {0:<49} {1:>11.2f}x'.format(name, ratio))
+        if regressions:
+            return 1
+        print('No regressions over {0:.0%}'.format(args.threshold))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
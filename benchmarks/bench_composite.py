@@ -0,0 +1,86 @@
+"""
+Store and read 200 entry repeating subfield groups as package extras:
+the previous json.dumps encoding against ckanext.scheming.composite,
+with and without key compression, and the package_show path decoding
+them.
+
+    python -m benchmarks.bench_composite
+"""
+import json
+
+from ckantoolkit import missing
+
+from ckanext.scheming import composite
+
+from benchmarks import harness
+from benchmarks.bench_subfields import contacts
+from benchmarks.bench_validate import (
+    make_plugin, base_schema, stored_dataset_dict)
+
+ENTRY_COUNT = 200
+
+
+def _json_dumps_setup():
+    entries = contacts(ENTRY_COUNT)
+    return lambda: json.dumps(
+        entries, default=lambda x: None if x == missing else x)
+
+
+def _encode_setup(compact_keys):
+    def setup():
+        entries = contacts(ENTRY_COUNT)
+        return lambda: composite.encode(entries, compact_keys)
+    return setup
+
+
+def _json_loads_setup():
+    text = json.dumps(contacts(ENTRY_COUNT))
+    return lambda: json.loads(text)
+
+
+def _decode_setup(compact_keys):
+    def setup():
+        text = composite.encode(contacts(ENTRY_COUNT), compact_keys)
+        return lambda: composite.decode(text)
+    return setup
+
+
+def _show_setup(compact_keys):
+    def setup():
+        plugin = make_plugin()
+        data = stored_dataset_dict(1)
+        for ex in data['extras']:
+            if ex['key'] == 'contacts':
+                ex['value'] = composite.encode(
+                    contacts(ENTRY_COUNT), compact_keys)
+
+        def validate():
+            data_dict, errors = plugin.validate(
+                {}, dict(data, extras=[dict(ex) for ex in data['extras']]),
+                base_schema(), 'package_show')
+            assert not errors, errors
+            assert len(data_dict['contacts']) == ENTRY_COUNT
+        return validate
+    return setup
+
+
+BENCHMARKS = [
+    ('composite encode json.dumps: %d entries' % ENTRY_COUNT,
+        _json_dumps_setup),
+    ('composite encode: %d entries' % ENTRY_COUNT, _encode_setup(False)),
+    ('composite encode compact keys: %d entries' % ENTRY_COUNT,
+        _encode_setup(True)),
+    ('composite decode json.loads: %d entries' % ENTRY_COUNT,
+        _json_loads_setup),
+    ('composite decode: %d entries' % ENTRY_COUNT, _decode_setup(False)),
+    ('composite decode compact keys: %d entries' % ENTRY_COUNT,
+        _decode_setup(True)),
+    ('validate show composite: %d entries' % ENTRY_COUNT,
+        _show_setup(False)),
+    ('validate show composite compact keys: %d entries' % ENTRY_COUNT,
+        _show_setup(True)),
+]
+
+
+if __name__ == '__main__':
+    harness.run(BENCHMARKS)
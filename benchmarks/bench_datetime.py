@@ -0,0 +1,76 @@
+"""
+Parse naive, Z and +-hh:mm ISO 8601 datetime strings with the fast
+path used by the datetime validators and with the general parser, and
+run the datetime validators on API values and form inputs.
+
+    python -m benchmarks.bench_datetime
+"""
+from collections import defaultdict
+
+from ckanext.scheming.helpers import (
+    date_tz_str_to_datetime,
+    _date_tz_str_to_datetime,
+    iso_str_to_datetime,
+)
+from ckanext.scheming.validation import (
+    scheming_isodatetime,
+    scheming_isodatetime_tz,
+)
+
+from benchmarks import harness
+
+VALUES = {
+    'naive': '2014-01-01T12:35:00',
+    'naive_us': '2014-01-01T12:35:00.123456',
+    'zulu': '2014-01-01T12:35:00Z',
+    'offset': '2014-01-01T12:35:00-05:00',
+}
+
+
+FORM_INPUTS = {
+    'when_date': '2014-01-01',
+    'when_time': '12:35',
+    'when_tz': 'Europe/Berlin',
+}
+
+
+def _setup(parse, value):
+    return lambda: lambda: parse(value)
+
+
+def _validator_setup(factory, value, extras=None):
+    def setup():
+        validator = factory({'field_name': 'when'}, {})
+
+        def validate():
+            data = {('when',): value}
+            if extras:
+                data[('__extras',)] = dict(extras)
+            validator(('when',), data, defaultdict(list), {})
+        return validate
+    return setup
+
+
+BENCHMARKS = [
+    ('datetime_tz: %s (fast)' % name, _setup(date_tz_str_to_datetime, value))
+    for name, value in sorted(VALUES.items())
+] + [
+    ('datetime_tz: %s (general)' % name,
+        _setup(_date_tz_str_to_datetime, value))
+    for name, value in sorted(VALUES.items())
+] + [
+    ('isodatetime: naive', _setup(iso_str_to_datetime, VALUES['naive'])),
+    ('isodatetime: date only', _setup(iso_str_to_datetime, '2014-01-01')),
+    ('scheming_isodatetime: api value',
+        _validator_setup(scheming_isodatetime, VALUES['naive'])),
+    ('scheming_isodatetime: form inputs',
+        _validator_setup(scheming_isodatetime, '', FORM_INPUTS)),
+    ('scheming_isodatetime_tz: api value',
+        _validator_setup(scheming_isodatetime_tz, VALUES['offset'])),
+    ('scheming_isodatetime_tz: form inputs',
+        _validator_setup(scheming_isodatetime_tz, '', FORM_INPUTS)),
+]
+
+
+if __name__ == '__main__':
+    harness.run(BENCHMARKS, number=20000)
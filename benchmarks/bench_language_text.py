@@ -0,0 +1,79 @@
+"""
+Render the labels, placeholders, help text and choice labels of a
+60-field form in three locales, with and without the multilingual
+values resolved at schema load time.
+
+    python -m benchmarks.bench_language_text
+"""
+from jinja2 import Environment
+from mock import patch
+
+from ckanext.scheming import helpers
+from ckanext.scheming.plugins import _SchemingMixin, _expand_schemas
+
+from benchmarks import harness
+
+LOCALES = ('en', 'fr', 'de')
+FIELD_COUNT = 60
+
+FORM_TEMPLATE = u'''
+{%- for field in schema.dataset_fields -%}
+<label>{{ h.scheming_language_text(field.label) }}</label>
+<input placeholder="{{ h.scheming_language_text(field.form_placeholder) }}">
+<span>{{ h.scheming_language_text(field.help_text) }}</span>
+{%- for c in field.choices -%}
+<option value="{{ c.value }}">{{ h.scheming_language_text(c.label) }}</option>
+{%- endfor -%}
+{%- endfor -%}
+'''
+
+
+class _Helpers(object):
+    scheming_language_text = staticmethod(helpers.scheming_language_text)
+
+
+def synthetic_schema(field_count=FIELD_COUNT):
+    fields = []
+    for i in range(field_count):
+        fields.append({
+            'field_name': 'field_%d' % i,
+            'label': {'en': 'Field %d' % i, 'fr': 'Champ %d' % i},
+            'form_placeholder': {'en': 'value %d' % i, 'fr': 'valeur %d' % i},
+            'help_text': {'en': 'Help %d' % i, 'fr': 'Aide %d' % i},
+            'choices': [
+                {'value': str(j),
+                 'label': {'en': 'Choice %d' % j, 'fr': 'Choix %d' % j}}
+                for j in range(5)
+            ],
+        })
+    return {'dataset_type': 'bench', 'dataset_fields': fields,
+            'resource_fields': []}
+
+
+def _render_setup(resolved):
+    def setup():
+        if _SchemingMixin._presets is None:
+            _SchemingMixin._presets = {}
+        schema = synthetic_schema()
+        if resolved:
+            schema = _expand_schemas({'bench': schema})['bench']
+        template = Environment(autoescape=True).from_string(FORM_TEMPLATE)
+
+        def render():
+            for locale in LOCALES:
+                with patch('ckanext.scheming.helpers.lang',
+                           return_value=locale):
+                    template.render(schema=schema, h=_Helpers)
+        return render
+    return setup
+
+
+BENCHMARKS = [
+    ('language_text: 60-field form x3 locales (raw)', _render_setup(False)),
+    ('language_text: 60-field form x3 locales (resolved)',
+        _render_setup(True)),
+]
+
+
+if __name__ == '__main__':
+    harness.run(BENCHMARKS, number=20)
@@ -0,0 +1,63 @@
+"""
+Load and expand every schema bundled with ckanext-scheming, with all
+bundled presets available.
+
+    python -m benchmarks.bench_schemas
+"""
+import os
+
+from ckanext.scheming import plugins
+from ckanext.scheming.plugins import (
+    _SchemingMixin, _load_schema, _expand_schemas)
+
+from benchmarks import harness
+
+_SCHEMA_DIR = os.path.dirname(plugins.__file__)
+
+PRESETS = sorted(
+    'ckanext.scheming:' + name for name in os.listdir(_SCHEMA_DIR)
+    if name.startswith('presets') and name.endswith('.json'))
+
+SCHEMAS = sorted(
+    'ckanext.scheming:' + name for name in os.listdir(_SCHEMA_DIR)
+    if name.endswith(('.json', '.yaml')) and not name.startswith('presets'))
+
+
+def load_presets():
+    """
+    Make every bundled preset available for expansion
+    """
+    _SchemingMixin._presets = None
+    _SchemingMixin._load_presets({'scheming.presets': ' '.join(PRESETS)})
+
+
+def _load_setup(url):
+    return lambda: lambda: _load_schema(url)
+
+
+def _expand_setup(url):
+    def setup():
+        load_presets()
+        schemas = {url: _load_schema(url)}
+        return lambda: _expand_schemas(schemas)
+    return setup
+
+
+def _load_all_setup():
+    load_presets()
+    return lambda: _expand_schemas({url: _load_schema(url) for url in SCHEMAS})
+
+
+BENCHMARKS = [
+    ('schema load: %s' % url.split(':')[1], _load_setup(url))
+    for url in SCHEMAS
+] + [
+    ('schema expand: %s' % url.split(':')[1], _expand_setup(url))
+    for url in SCHEMAS
+] + [
+    ('schema load+expand: all bundled', _load_all_setup),
+]
+
+
+if __name__ == '__main__':
+    harness.run(BENCHMARKS)
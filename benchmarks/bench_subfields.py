@@ -0,0 +1,63 @@
+"""
+Validate large repeating subfield groups with scheming_subfields and
+unpack submitted forms with expand_form_composite.
+
+    python -m benchmarks.bench_subfields
+"""
+from collections import defaultdict
+
+from ckanext.scheming.plugins import expand_form_composite
+from ckanext.scheming.validation import scheming_subfields
+
+from benchmarks import harness
+from benchmarks.bench_validate import make_plugin, DATASET_TYPE
+
+ENTRY_COUNTS = (10, 200)
+
+
+def contacts(count):
+    return [
+        {'contact_name': 'Larry %d' % i,
+         'contact_email': 'larry%d@example.com' % i,
+         'contact_role': 'author'}
+        for i in range(count)
+    ]
+
+
+def _subfields_setup(count):
+    def setup():
+        schema = make_plugin()._expanded_schemas[DATASET_TYPE]
+        field = [f for f in schema['dataset_fields']
+                 if f['field_name'] == 'contacts'][0]
+        validator = scheming_subfields(field, schema)
+        entries = contacts(count)
+
+        def validate():
+            errors = defaultdict(list)
+            validator(('contacts',), {('contacts',): entries}, errors, {})
+            assert not errors[('contacts',)], errors
+        return validate
+    return setup
+
+
+def _expand_setup(count):
+    def setup():
+        form = {'name': 'camel', 'title': 'Camel'}
+        for i, entry in enumerate(contacts(count)):
+            for key, value in entry.items():
+                form['contacts-%d-%s' % (i, key)] = value
+        return lambda: expand_form_composite(dict(form), {'contacts'})
+    return setup
+
+
+BENCHMARKS = [
+    ('scheming_subfields: %d entries' % count, _subfields_setup(count))
+    for count in ENTRY_COUNTS
+] + [
+    ('expand_form_composite: %d entries' % count, _expand_setup(count))
+    for count in ENTRY_COUNTS
+]
+
+
+if __name__ == '__main__':
+    harness.run(BENCHMARKS)
@@ -0,0 +1,123 @@
+"""
+Validate datasets with 1 to 500 resources through
+SchemingDatasetsPlugin.validate for package_create, package_update and
+package_show, using the synthetic bench_dataset.yaml schema.
+
+    python -m benchmarks.bench_validate
+"""
+import json
+
+from ckantoolkit import get_validator
+
+from ckanext.scheming.plugins import (
+    SchemingDatasetsPlugin, _load_schemas, _expand_schemas)
+
+from benchmarks import harness
+from benchmarks.bench_schemas import load_presets
+
+ignore = get_validator('ignore')
+ignore_missing = get_validator('ignore_missing')
+not_empty = get_validator('not_empty')
+
+DATASET_TYPE = 'bench-dataset'
+RESOURCE_COUNTS = (1, 10, 100, 500)
+CONTACT_COUNT = 5
+
+# scheming fields not in the base schema are stored as extras
+CORE_FIELDS = ('id', 'type', 'name', 'title', 'notes')
+
+
+def make_plugin():
+    """
+    Return the datasets plugin with the benchmark schema compiled,
+    without the template and asset setup of update_config
+    """
+    load_presets()
+    plugin = SchemingDatasetsPlugin()
+    schemas = _load_schemas(['benchmarks:bench_dataset.yaml'], 'dataset_type')
+    plugin._set_schemas(schemas, _expand_schemas(schemas))
+    return plugin
+
+
+def base_schema():
+    """
+    Return a navl schema standing in for CKAN's default package schema
+    """
+    schema = {f: [ignore_missing] for f in CORE_FIELDS}
+    schema['extras'] = {'key': [not_empty], 'value': [ignore_missing]}
+    schema['resources'] = {'id': [ignore_missing]}
+    schema['__extras'] = [ignore]
+    return schema
+
+
+def dataset_dict(resources):
+    return {
+        'type': DATASET_TYPE,
+        'name': 'camel-%d' % resources,
+        'title': 'Camel with %d photos' % resources,
+        'notes': 'A camel',
+        'category': 'bactrian',
+        'personality': ['friendly', 'spits'],
+        'first_seen': '2014-01-01',
+        'last_seen': '2014-01-01T12:35:00+02:00',
+        'keywords': ['hump', 'desert'],
+        'contacts': [
+            {'contact_name': 'Larry %d' % i,
+             'contact_email': 'larry%d@example.com' % i,
+             'contact_role': 'author'}
+            for i in range(CONTACT_COUNT)
+        ],
+        'resources': [
+            {'url': 'http://example.com/camel-%d.jpg' % i,
+             'name': 'Photo %d' % i,
+             'camels_in_photo': '2',
+             'taken': '2014-01-01T12:35:00'}
+            for i in range(resources)
+        ],
+    }
+
+
+def stored_dataset_dict(resources):
+    """
+    Return dataset_dict(resources) as package_show reads it from the
+    database, with scheming fields in extras
+    """
+    data = dataset_dict(resources)
+    extras = []
+    for key in list(data):
+        if key in CORE_FIELDS or key == 'resources':
+            continue
+        value = data.pop(key)
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        extras.append({'key': key, 'value': value})
+    data['extras'] = extras
+    return data
+
+
+def _validate_setup(action, resources):
+    def setup():
+        plugin = make_plugin()
+        if action == 'package_show':
+            data = stored_dataset_dict(resources)
+        else:
+            data = dataset_dict(resources)
+
+        def validate():
+            data_dict, errors = plugin.validate(
+                {}, dict(data), base_schema(), action)
+            assert not errors, errors
+        return validate
+    return setup
+
+
+BENCHMARKS = [
+    ('validate %s: %d resources' % (action.split('_')[1], resources),
+        _validate_setup(action, resources))
+    for action in ('package_create', 'package_update', 'package_show')
+    for resources in RESOURCE_COUNTS
+]
+
+
+if __name__ == '__main__':
+    harness.run(BENCHMARKS)
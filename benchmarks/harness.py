@@ -0,0 +1,103 @@
+"""
+Minimal timing harness shared by the benchmark scripts
+
+Each benchmark module defines a ``BENCHMARKS`` list of
+``(name, setup)`` pairs where ``setup()`` returns the callable to time.
+
+Results may be saved as a baseline and later runs compared against it,
+see ``python -m benchmarks --help``. Baselines record a calibration
+time so runs on faster or slower machines compare fairly.
+"""
+from __future__ import print_function
+
+import json
+import sys
+import timeit
+
+# smallest total time for one repeat when the number of calls is
+# chosen automatically
+MIN_REPEAT_TIME = 0.2
+
+
+def time_callable(fn, number=None, repeat=5):
+    """
+    Return the best time per call in seconds for fn. When number is
+    None enough calls are made for each repeat to take MIN_REPEAT_TIME.
+    """
+    timer = timeit.Timer(fn)
+    if number is None:
+        number = autorange(timer)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def autorange(timer):
+    """
+    Return a number of calls taking at least MIN_REPEAT_TIME for timer
+    """
+    number = 1
+    while True:
+        if timer.timeit(number) >= MIN_REPEAT_TIME:
+            return number
+        number *= 10
+
+
+def calibrate():
+    """
+    Return the time per call of a fixed pure Python workload, used to
+    scale results between machines
+    """
+    def workload():
+        d = {}
+        for i in range(1000):
+            d['k%d' % i] = [i, str(i)]
+        return sorted(d)
+    return time_callable(workload)
+
+
+def run(benchmarks, number=None, repeat=5, out=sys.stdout, match=None):
+    """
+    Run (name, setup) benchmarks and return {name: seconds per call}
+
+    :param match: only run benchmarks with this text in their name
+    """
+    results = {}
+    for name, setup in benchmarks:
+        if match and match not in name:
+            continue
+        fn = setup()
+        results[name] = time_callable(fn, number, repeat)
+        print('{0:<60} {1:>12.2f} us'.format(name, results[name] * 1e6),
+              file=out)
+    return results
+
+
+def save_baseline(path, results, calibration):
+    with open(path, 'w') as f:
+        json.dump({'calibration': calibration, 'results': results}, f,
+                  indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_baseline(path):
+    """
+    Return (results, calibration) saved by save_baseline
+    """
+    with open(path) as f:
+        baseline = json.load(f)
+    return baseline['results'], baseline['calibration']
+
+
+def compare(results, calibration, baseline, baseline_calibration,
+            threshold):
+    """
+    Return [(name, ratio), ...] for results slower than baseline by more
+    than threshold (e.g. 0.25 for 25%) after scaling by calibration.
+    Benchmarks missing from either side are not compared.
+    """
+    scale = baseline_calibration / calibration
+    regressions = []
+    for name in sorted(set(results) & set(baseline)):
+        ratio = results[name] * scale / baseline[name]
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
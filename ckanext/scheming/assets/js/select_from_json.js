@@ -7,6 +7,8 @@
  *			- in json-mode: An url pointing to a JSON source.
  *			- in sparql-mode: An url pointing to a sparql endpoint
  * query 	- only for sparql mode
+ * proxy	- optional: an url on this site serving the choices from source,
+ *			  fetched and cached by the server as [{value, label}, ...]
  *
  * Examples
  *	
@@ -19,7 +21,8 @@ this.ckan.module('select-from-json', function (jQuery, _) {
 		options: {
 			mode: null,
 			source: '',
-			query: ''
+			query: '',
+			proxy: ''
 		},
 
 		initialize: function () {
@@ -49,6 +52,28 @@ this.ckan.module('select-from-json', function (jQuery, _) {
 			return response.json(); // parses JSON response into native JavaScript objects
 		},
 
+		requestChoices: async function (url = '') {
+			const response = await fetch(url, {
+				headers: {
+					'Accept': 'application/json'
+				}
+			});
+			return response.json();
+		},
+
+		handleChoices: function (choices = []) {
+			for (var i = 0; i < choices.length; i++) {
+				var option = $('<option>', {
+					value: choices[i].value,
+					text: choices[i].label
+				});
+				if (choices[i].value == this.options.selected) {
+					option.attr('selected', 'selected');
+				}
+				$(this.el[0]).append(option);
+			};
+		},
+
 		handleDataSparql: function (data = null) {
 			for (var i = 0; i < data.results.bindings.length; i++) {
 				if (data.results.bindings[i].subject.value == this.options.selected) {
@@ -77,7 +102,14 @@ this.ckan.module('select-from-json', function (jQuery, _) {
 			var btn = $("#" + this.options.field + "-btn")[0];
 			var metrics = new Object();
 
-			if (this.options.mode = "sparql") {
+			if (this.options.proxy) {
+				this.requestChoices(this.options.proxy)
+					.then(data => this.handleChoices(data))
+					.catch(error => {
+						console.error('There has been a problem while fetching choices:', error);
+					});
+			}
+			else if (this.options.mode = "sparql") {
 				var fullUrl = this.options.source + "?query=" + encodeURIComponent(this.options.query);
 
 				this.requestSparql(fullUrl)
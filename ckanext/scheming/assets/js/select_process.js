@@ -7,6 +7,8 @@
  *			- in json-mode: An url pointing to a JSON source.
  *			- in sparql-mode: An url pointing to a sparql endpoint
  * query 	- only for sparql mode
+ * proxy	- optional: an url on this site serving the choices from source,
+ *			  fetched and cached by the server as [{value, label}, ...]
  *
  * Examples
  *	
@@ -18,7 +20,8 @@ this.ckan.module('select-process', function (jQuery, _) {
         options: {
             mode: null,
             source: '',
-            query: ''
+            query: '',
+            proxy: ''
         },
 
         initialize: function () {
@@ -39,6 +42,34 @@ this.ckan.module('select-process', function (jQuery, _) {
             return response.json(); // parses JSON response into native JavaScript objects
         },
 
+        requestChoices: async function (url = '') {
+            const response = await fetch(url, {
+                headers: {
+                    'Accept': 'application/json'
+                }
+            });
+            return response.json();
+        },
+
+        handleChoices: function (choices = []) {
+            var stored_option = null;
+            try {
+                stored_option = JSON.parse($("#" + this.options.field)[0].value).uri;
+            }
+            catch (e) {}
+            for (var i = 0; i < choices.length; i++) {
+                var option = $('<option>', {
+                    id: choices[i].value,
+                    value: choices[i].value,
+                    text: choices[i].label
+                });
+                if (choices[i].value == stored_option) {
+                    option.attr('selected', 'selected');
+                }
+                $(this.el[0]).append(option);
+            };
+        },
+
         handleDataSparql: function (data = null) {
             stored_option = null
             try{
@@ -82,7 +113,14 @@ this.ckan.module('select-process', function (jQuery, _) {
 
 
 
-            if (this.options.mode = "sparql") {
+            if (this.options.proxy) {
+                this.requestChoices(this.options.proxy)
+                    .then(data => this.handleChoices(data))
+                    .catch(error => {
+                        console.error('There has been a problem while fetching choices:', error);
+                    });
+            }
+            else if (this.options.mode = "sparql") {
                 var fullUrl = this.options.source + "?query=" + encodeURIComponent(this.options.query);
 
                 this.requestSparql(fullUrl)
@@ -0,0 +1,150 @@
+# encoding: utf-8
+"""
+Validate many datasets as package_create or package_update would,
+without storing them, optionally sharing the work between processes
+"""
+import datetime
+import logging
+import multiprocessing
+
+import ckan.model as model
+from ckan.lib.plugins import lookup_package_plugin, plugin_validate
+from ckantoolkit import check_access, missing, NotAuthorized, _
+
+log = logging.getLogger(__name__)
+
+ACTIONS = ('create', 'update')
+
+# sessions inherited from the parent process by pool workers, kept so
+# they are never closed or rolled back on the parent's connections
+_inherited_sessions = []
+
+
+def validate_datasets(datasets, action='create', user=None,
+                      ignore_auth=False, workers=1, pool=None):
+    """
+    Return a result for each dataset dict in datasets, in order::
+
+        {"valid": bool, "errors": {...}, "data": {...}}
+
+    where data is the dataset as validated and converted for action.
+    With more than one worker the datasets are split between a pool of
+    processes, each using its own database connection. Pass pool, a
+    pool of workers from worker_pool, to use it instead of starting
+    one; it is left open for the next call.
+    """
+    if workers > 1 and len(datasets) > 1:
+        size = -(-len(datasets) // min(workers, len(datasets)))
+        chunks = [
+            (datasets[i:i + size], action, user, ignore_auth)
+            for i in range(0, len(datasets), size)]
+        if pool is not None:
+            return _map_chunks(pool, chunks)
+        pool = worker_pool(len(chunks))
+        try:
+            return _map_chunks(pool, chunks)
+        finally:
+            pool.close()
+            pool.join()
+
+    return _validate_chunk((datasets, action, user, ignore_auth))
+
+
+def _map_chunks(pool, chunks):
+    results = []
+    for chunk_results in pool.map(_validate_chunk, chunks):
+        results.extend(chunk_results)
+    return results
+
+
+def validate_dataset(context, data_dict, action='create'):
+    """
+    Validate one dataset dict for action ("create" or "update") with
+    the schema package_create or package_update would use, return
+    (validated data, errors). Nothing is written to the database.
+    """
+    data_dict = dict(data_dict)
+    context = dict(context)
+    if action == 'update':
+        pkg = model.Package.get(data_dict.get('id') or data_dict.get('name'))
+        if pkg is None:
+            return data_dict, {'id': [_('Not found')]}
+        context['package'] = pkg
+        data_dict['id'] = pkg.id
+        data_dict.setdefault('type', pkg.type)
+
+    if not context.get('ignore_auth'):
+        try:
+            check_access('package_' + action, context, data_dict)
+        except NotAuthorized as e:
+            return data_dict, {'auth': [str(e) or _('Not authorized')]}
+
+    package_plugin = lookup_package_plugin(data_dict.get('type'))
+    if 'schema' in context:
+        schema = context['schema']
+    elif action == 'update':
+        schema = package_plugin.update_package_schema()
+    else:
+        schema = package_plugin.create_package_schema()
+
+    return plugin_validate(
+        package_plugin, context, data_dict, schema, 'package_' + action)
+
+
+def normalize(value):
+    """
+    Return validated data as JSON-compatible values: dates as ISO 8601
+    strings and missing values removed
+    """
+    if isinstance(value, dict):
+        return {
+            k: normalize(v) for k, v in value.items() if v is not missing}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _validate_chunk(args):
+    datasets, action, user, ignore_auth = args
+    context = {
+        'model': model,
+        'session': model.Session,
+        'user': user,
+        'ignore_auth': ignore_auth,
+    }
+    results = []
+    for data_dict in datasets:
+        try:
+            data, errors = validate_dataset(context, data_dict, action)
+        except Exception as e:
+            log.exception('Error validating dataset')
+            data, errors = data_dict, {'__error': [str(e)]}
+        results.append({
+            'valid': not errors,
+            'errors': normalize(errors),
+            'data': normalize(data),
+        })
+    return results
+
+
+def worker_pool(workers, initializer=None, initargs=()):
+    """
+    Return a multiprocessing.Pool of workers using their own database
+    connections, calling initializer(*initargs) in each worker.
+
+    Idle pooled connections are closed here before forking so workers
+    don't inherit them. The session in use here, and its connection,
+    are set aside untouched in the workers.
+    """
+    model.meta.engine.dispose()
+    return multiprocessing.Pool(
+        workers, initializer=_init_worker, initargs=(initializer, initargs))
+
+
+def _init_worker(initializer=None, initargs=()):
+    _inherited_sessions.append(model.Session.registry())
+    model.Session.registry.clear()
+    if initializer is not None:
+        initializer(*initargs)
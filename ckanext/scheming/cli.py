@@ -0,0 +1,336 @@
+# encoding: utf-8
+"""
+ckan scheming ... commands (CKAN 2.9+)
+"""
+import json
+import logging
+import multiprocessing
+import time
+
+import click
+
+import ckan.model as model
+from ckantoolkit import config, get_action
+
+from ckanext.scheming import batch, compiler, export, importer, references
+from ckanext.scheming.helpers import scheming_get_dataset_schema
+
+log = logging.getLogger(__name__)
+
+# per-process state for reindex workers
+_worker = {}
+
+
+@click.group(short_help=u'ckanext-scheming commands')
+def scheming():
+    pass
+
+
+@scheming.command(u'reindex', short_help=u'Rebuild the search index')
+@click.option(u'-t', u'--type', u'dataset_types', multiple=True,
+              help=u'Only reindex datasets of this type (repeatable)')
+@click.option(u'-w', u'--workers', type=int,
+              default=multiprocessing.cpu_count(), show_default=True,
+              help=u'Number of worker processes')
+@click.option(u'-b', u'--batch-size', type=int, default=250,
+              show_default=True,
+              help=u'Datasets indexed between search index commits')
+def reindex(dataset_types, workers, batch_size):
+    u'''
+    Reindex all datasets, or all datasets of the types given, sharing
+    the work between worker processes that reuse the compiled scheming
+    validators and index transforms.
+    '''
+    ids = package_ids(dataset_types)
+    click.echo(u'Reindexing {0} datasets with {1} workers'.format(
+        len(ids), workers))
+
+    def progress(done, total, elapsed):
+        click.echo(u'{0}/{1} datasets ({2:.1f}/s)'.format(
+            done, total, done / elapsed if elapsed else 0))
+
+    indexed, errors, elapsed = reindex_packages(
+        ids, workers=workers, batch_size=batch_size, progress=progress)
+
+    click.secho(
+        u'Indexed {0} datasets in {1:.1f}s ({2:.1f}/s), {3} errors'.format(
+            indexed, elapsed, indexed / elapsed if elapsed else 0,
+            len(errors)),
+        fg=u'red' if errors else u'green')
+    for pkg_id, error in errors:
+        click.echo(u'{0}: {1}'.format(pkg_id, error), err=True)
+
+
+@scheming.command(u'compile', short_help=u'Check and compile schemas')
+@click.option(u'-o', u'--output', default=u'scheming.compiled',
+              show_default=True, help=u'Compiled artifact to write')
+@click.option(u'--check', is_flag=True,
+              help=u'Only report errors, do not write the artifact')
+def compile_schemas(output, check):
+    u'''
+    Load the presets and the dataset, group and organization schemas
+    from source, report every error found and write the compiled
+    schemas for scheming.compiled.
+    '''
+    from ckanext.scheming.plugins import (
+        SchemingDatasetsPlugin, SchemingGroupsPlugin,
+        SchemingOrganizationsPlugin)
+
+    start = time.time()
+    artifact, errors = compiler.build(config, [
+        SchemingDatasetsPlugin, SchemingGroupsPlugin,
+        SchemingOrganizationsPlugin])
+    for error in errors:
+        click.secho(error, fg=u'red', err=True)
+    if errors:
+        raise click.ClickException(
+            u'{0} errors found'.format(len(errors)))
+
+    types = sum(len(e[u'expanded']) for e in artifact[u'plugins'].values())
+    if not check:
+        compiler.save(output, artifact)
+        click.echo(u'Wrote {0}'.format(output))
+    click.secho(u'Compiled {0} schemas in {1:.2f}s'.format(
+        types, time.time() - start), fg=u'green')
+
+
+@scheming.command(u'build-references',
+                  short_help=u'Rebuild the dataset reference graph')
+def build_references():
+    u'''
+    Rebuild the graph of references between datasets from the fields
+    marked with "reference": true, needed once for
+    scheming.reference_graph = redis and after changing which fields
+    are references.
+    '''
+    start = time.time()
+    count = references.rebuild(references.get_graph())
+    click.secho(u'Recorded references of {0} datasets in {1:.1f}s'.format(
+        count, time.time() - start), fg=u'green')
+
+
+@scheming.command(u'export', short_help=u'Export datasets as CSV or JSONL')
+@click.argument(u'dataset_type')
+@click.option(u'-f', u'--format', u'fmt', type=click.Choice(export.FORMATS),
+              default=u'jsonl', show_default=True)
+@click.option(u'-o', u'--output', type=click.File(u'w'), default=u'-',
+              help=u'File to write, default standard output')
+@click.option(u'-b', u'--batch-size', type=int, default=500,
+              show_default=True,
+              help=u'Datasets read from the database at a time')
+def export_datasets(dataset_type, fmt, output, batch_size):
+    u'''
+    Export all datasets of DATASET_TYPE with the fields of its schema,
+    writing each dataset as it is read.
+    '''
+    schema = scheming_get_dataset_schema(dataset_type)
+    if schema is None:
+        raise click.BadParameter(
+            u'no scheming schema for {0}'.format(dataset_type),
+            param_hint=u'DATASET_TYPE')
+    start = time.time()
+    count = 0
+    for line in export.export_lines(schema, fmt, batch_size):
+        output.write(line)
+        count += 1
+    if fmt == u'csv':
+        count -= 1
+    click.echo(u'Exported {0} datasets in {1:.1f}s'.format(
+        count, time.time() - start), err=True)
+
+
+@scheming.command(u'import', short_help=u'Create datasets from CSV or JSONL')
+@click.argument(u'source', type=click.File(u'r'))
+@click.option(u'-t', u'--type', u'dataset_type',
+              help=u'Dataset type for records without a type')
+@click.option(u'-f', u'--format', u'fmt', type=click.Choice(export.FORMATS),
+              default=u'jsonl', show_default=True)
+@click.option(u'-e', u'--errors', type=click.File(u'w'),
+              default=u'import-errors.jsonl', show_default=True,
+              help=u'File receiving the datasets not created and why')
+@click.option(u'-c', u'--chunk-size', type=int, default=100,
+              show_default=True,
+              help=u'Datasets written per database transaction')
+@click.option(u'-w', u'--workers', type=int,
+              default=multiprocessing.cpu_count(), show_default=True,
+              help=u'Number of worker processes indexing at the end')
+@click.option(u'--validate-only', is_flag=True,
+              help=u'Only validate, in batches of chunk size')
+def import_datasets(source, dataset_type, fmt, errors, chunk_size, workers,
+                    validate_only):
+    u'''
+    Create datasets from SOURCE in the format written by the export
+    command, then index them all at once.
+    '''
+    records = importer.read_records(source, fmt)
+
+    def progress(rows, created, elapsed):
+        click.echo(u'{0} rows, {1} created ({2:.1f} rows/s)'.format(
+            rows, created, rows / elapsed if elapsed else 0))
+
+    if validate_only:
+        rows, invalid, elapsed = validate_records(
+            records, dataset_type, chunk_size, workers, errors, progress)
+        click.secho(
+            u'Validated {0} rows in {1:.1f}s ({2:.1f} rows/s), '
+            u'{3} invalid'.format(
+                rows, elapsed, rows / elapsed if elapsed else 0, invalid),
+            fg=u'red' if invalid else u'green')
+        return
+
+    rows, created, elapsed = importer.import_records(
+        records, dataset_type, chunk_size=chunk_size, errors=errors,
+        progress=progress)
+    click.secho(
+        u'Created {0} of {1} datasets in {2:.1f}s ({3:.1f} rows/s)'.format(
+            len(created), rows, elapsed, rows / elapsed if elapsed else 0),
+        fg=u'red' if len(created) < rows else u'green')
+
+    click.echo(u'Indexing {0} datasets'.format(len(created)))
+    indexed, index_errors, elapsed = reindex_packages(
+        created, workers=workers)
+    click.echo(u'Indexed {0} datasets in {1:.1f}s'.format(indexed, elapsed))
+    for pkg_id, error in index_errors:
+        click.echo(u'{0}: {1}'.format(pkg_id, error), err=True)
+
+
+def validate_records(records, dataset_type, chunk_size, workers, errors,
+                     progress=None):
+    """
+    Validate (line number, dataset dict) records in chunks as
+    package_create would, writing the invalid ones to errors. With more
+    than one worker every chunk is shared between the same pool of
+    processes.
+
+    :returns: (rows, invalid rows, seconds)
+    """
+    start = time.time()
+    rows = invalid = 0
+    pool = batch.worker_pool(workers) if workers > 1 else None
+    try:
+        for chunk in importer.chunks(records, chunk_size):
+            datasets = []
+            for number, data_dict in chunk:
+                if dataset_type:
+                    data_dict.setdefault(u'type', dataset_type)
+                datasets.append(data_dict)
+            results = batch.validate_datasets(
+                datasets, ignore_auth=True, workers=workers, pool=pool)
+            for (number, data_dict), result in zip(chunk, results):
+                if not result[u'valid']:
+                    invalid += 1
+                    errors.write(json.dumps({
+                        u'line': number,
+                        u'name': data_dict.get(u'name'),
+                        u'errors': result[u'errors'],
+                    }, sort_keys=True) + u'\n')
+            rows += len(chunk)
+            if progress:
+                progress(rows, rows - invalid, time.time() - start)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return rows, invalid, time.time() - start
+
+
+def package_ids(dataset_types=()):
+    """
+    Return the ids of all datasets not deleted, optionally limited to
+    the dataset types given
+    """
+    q = model.Session.query(model.Package.id).filter(
+        model.Package.state != u'deleted')
+    if dataset_types:
+        q = q.filter(model.Package.type.in_(dataset_types))
+    return [pkg_id for (pkg_id,) in q]
+
+
+class SearchIndexer(object):
+    """
+    Index package dicts with the CKAN search index, committing only
+    when commit() is called. Other indexers (e.g. for tests) need the
+    same index(pkg_dict) and commit() methods.
+    """
+    def __init__(self):
+        from ckan.lib.search import index_for
+        self.package_index = index_for(model.Package)
+
+    def index(self, pkg_dict):
+        self.package_index.update_dict(pkg_dict, defer_commit=True)
+
+    def commit(self):
+        from ckan.lib.search import commit
+        commit()
+
+
+def reindex_packages(ids, indexer_factory=SearchIndexer, workers=1,
+                     batch_size=250, progress=None):
+    """
+    Index the datasets with ids in batches of batch_size, committing
+    after each batch. With more than one worker, batches are shared
+    between a pool of processes each creating one indexer.
+
+    progress(done, total, elapsed) is called after each batch.
+
+    :returns: (datasets indexed, [(id, error message), ...], seconds)
+    """
+    batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
+    start = time.time()
+    indexed = 0
+    errors = []
+
+    if workers > 1 and len(batches) > 1:
+        pool = batch.worker_pool(
+            min(workers, len(batches)), _init_worker, (indexer_factory,))
+        try:
+            results = pool.imap_unordered(_index_batch, batches)
+            for count, batch_errors in results:
+                indexed += count
+                errors.extend(batch_errors)
+                if progress:
+                    progress(indexed, len(ids), time.time() - start)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(indexer_factory)
+        for batch_ids in batches:
+            count, batch_errors = _index_batch(batch_ids)
+            indexed += count
+            errors.extend(batch_errors)
+            if progress:
+                progress(indexed, len(ids), time.time() - start)
+
+    return indexed, errors, time.time() - start
+
+
+def _init_worker(indexer_factory):
+    _worker['indexer'] = indexer_factory()
+
+
+def _index_batch(ids):
+    """
+    Index one batch of datasets and commit, return
+    (datasets indexed, [(id, error message), ...])
+    """
+    indexer = _worker['indexer']
+    context = {
+        'model': model,
+        'ignore_auth': True,
+        'validate': False,
+        'use_cache': False,
+    }
+    package_show = get_action('package_show')
+    count = 0
+    errors = []
+    for pkg_id in ids:
+        try:
+            indexer.index(package_show(dict(context), {'id': pkg_id}))
+            count += 1
+        except Exception as e:
+            log.exception(u'Error indexing dataset %s', pkg_id)
+            errors.append((pkg_id, str(e)))
+    indexer.commit()
+    model.Session.remove()
+    return count, errors
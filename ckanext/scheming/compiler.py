@@ -0,0 +1,319 @@
+"""
+Check schemas for errors at build time and save them, with presets
+expanded, as a compiled artifact that workers load instead of parsing
+and expanding the schema files. Enable loading with::
+
+    scheming.compiled = /srv/app/scheming.compiled
+
+The artifact records the schema and preset options it was built from
+and a hash of each file. It is ignored, with a warning, when any of
+them changed, so a stale artifact never hides schema changes. Only
+schemas and presets read from module paths or file:// urls can be
+compiled, changes to other sources (e.g. http) can't be detected.
+"""
+import datetime
+import hashlib
+import logging
+import os
+import pickle
+
+import six
+
+from ckanext.scheming.errors import SchemingException
+
+log = logging.getLogger(__name__)
+
+# incremented when the artifact contents change
+ARTIFACT_VERSION = 2
+
+VALIDATOR_KEYS = ('validators', 'output_validators', 'create_validators')
+
+_artifacts = {}
+
+
+def missing_presets(schemas, presets):
+    """
+    Return an error message for every field or subfield of schemas
+    using a preset not in presets
+    """
+    presets = presets or {}
+    errors = []
+    for t, schema in sorted(schemas.items()):
+        for name, field in schema_fields(schema):
+            preset = field.get('preset')
+            if preset and preset not in presets:
+                errors.append('{0} {1}: preset {2!r} not defined'.format(
+                    t, name, preset))
+    return errors
+
+
+def lint(expanded_schemas, template_dirs=None):
+    """
+    Return an error message for every problem found in
+    expanded_schemas: validator names not found, snippets not found in
+    template_dirs and invalid choices. Validators are looked up but not
+    built, so building them has no side effects here (e.g. fetching
+    remote choices).
+    """
+    errors = []
+    for t, schema in sorted(expanded_schemas.items()):
+        def error(name, message):
+            errors.append('{0} {1}: {2}'.format(t, name, message))
+
+        for key in ('before_validators', 'after_validators'):
+            if schema.get(key):
+                for message in validator_errors(schema[key]):
+                    error(key, message)
+
+        for name, field in schema_fields(schema):
+            for key in VALIDATOR_KEYS:
+                if field.get(key):
+                    for message in validator_errors(field[key]):
+                        error(name, message)
+            if template_dirs is not None:
+                for key in ('form_snippet_path', 'display_snippet_path'):
+                    path = field.get(key)
+                    if path and not _template_exists(path, template_dirs):
+                        error(name, 'template {0!r} not found'.format(path))
+            for message in _choice_errors(field):
+                error(name, message)
+    return errors
+
+
+def validator_errors(validators):
+    """
+    Return an error message for every validator named in a schema
+    validators string that can't be found
+    """
+    from ckanext.scheming.validation import get_validator_or_converter
+
+    errors = []
+    for part in validators.split():
+        name = part
+        if '(' in part and part[-1] == ')':
+            name = part.split('(', 1)[0]
+        try:
+            get_validator_or_converter(name)
+        except Exception as e:
+            errors.append(six.text_type(e))
+    return errors
+
+
+def schema_fields(schema):
+    """
+    Generate (name, field) for the fields and subfields of schema
+    """
+    for grouping in ('fields', 'dataset_fields', 'resource_fields'):
+        for field in schema.get(grouping, ()):
+            yield field.get('field_name'), field
+            for sub in ('repeating_subfields', 'simple_subfields'):
+                for subfield in field.get(sub, ()):
+                    yield '{0}.{1}'.format(
+                        field.get('field_name'),
+                        subfield.get('field_name')), subfield
+
+
+def _choice_errors(field):
+    if 'choices_helper' in field:
+        from ckantoolkit import h
+        try:
+            getattr(h, field['choices_helper'])
+        except (AttributeError, KeyError):
+            return ['choices_helper {0!r} not found'.format(
+                field['choices_helper'])]
+    if 'choices' not in field:
+        return []
+    if not isinstance(field['choices'], list):
+        return ['choices must be a list']
+    errors = []
+    seen = set()
+    for choice in field['choices']:
+        if not isinstance(choice, dict) or 'value' not in choice:
+            errors.append('choice {0!r} has no value'.format(choice))
+        elif choice['value'] in seen:
+            errors.append('choice {0!r} repeated'.format(choice['value']))
+        else:
+            seen.add(choice['value'])
+    return errors
+
+
+def template_dirs(config):
+    """
+    Return the template directories searched by CKAN, including the
+    ones of this extension
+    """
+    import ckan
+    dirs = [d.strip() for d in
+            config.get('extra_template_paths', '').split(',') if d.strip()]
+    here = os.path.dirname(__file__)
+    return dirs + [
+        os.path.join(here, 'templates'),
+        os.path.join(here, '2.8_templates'),
+        os.path.join(os.path.dirname(ckan.__file__), 'templates'),
+    ]
+
+
+def _template_exists(path, dirs):
+    return any(os.path.exists(os.path.join(d, path)) for d in dirs)
+
+
+def source_hashes(urls):
+    """
+    Return {url: sha1 of the file contents} for urls that are module
+    paths or file:// urls of existing files, other urls (e.g. http)
+    have None
+    """
+    hashes = {}
+    for url in urls:
+        path = source_file(url)
+        if path:
+            with open(path, 'rb') as f:
+                hashes[url] = hashlib.sha1(f.read()).hexdigest()
+        else:
+            hashes[url] = None
+    return hashes
+
+
+def source_file(url):
+    """
+    Return the path of the file a module path or file:// url points to,
+    or None
+    """
+    from six.moves.urllib.parse import urlparse
+    from six.moves.urllib.request import url2pathname
+    from ckanext.scheming.plugins import _schema_module_file
+
+    if url.startswith('file://'):
+        path = url2pathname(urlparse(url).path)
+        return path if os.path.isfile(path) else None
+    return _schema_module_file(url)
+
+
+def build(config, plugins):
+    """
+    Load and expand the presets and the schemas of plugins from source
+    and return (artifact, errors). The artifact is None when there are
+    errors.
+    """
+    from ckanext.scheming.plugins import (
+        _SchemingMixin, _read_presets, _load_schemas, _expand_schemas,
+        DEFAULT_PRESETS)
+
+    preset_urls = config.get('scheming.presets', DEFAULT_PRESETS).split()
+    errors = []
+    try:
+        presets = _read_presets(preset_urls)
+    except Exception as e:
+        return None, ['presets: {0}'.format(e)]
+
+    dirs = template_dirs(config)
+    entries = {}
+    previous = _SchemingMixin._presets
+    _SchemingMixin._presets = presets
+    try:
+        for plugin in plugins:
+            urls = config.get(plugin.SCHEMA_OPTION, '').split()
+            try:
+                schemas = _load_schemas(urls, plugin.SCHEMA_TYPE_FIELD)
+            except Exception as e:
+                errors.append('{0}: {1}'.format(plugin.SCHEMA_OPTION, e))
+                continue
+            missing = missing_presets(schemas, presets)
+            if missing:
+                errors.extend(missing)
+                continue
+            expanded = _expand_schemas(schemas)
+            errors.extend(lint(expanded, dirs))
+            entries[plugin.SCHEMA_OPTION] = {
+                'urls': urls,
+                'schemas': schemas,
+                'expanded': expanded,
+            }
+    finally:
+        _SchemingMixin._presets = previous
+
+    sources = source_hashes(preset_urls + [
+        url for entry in entries.values() for url in entry['urls']])
+    errors.extend(
+        '{0}: only module paths and file:// urls can be compiled, '
+        'changes to other sources are not detected'.format(url)
+        for url, h in sorted(sources.items()) if h is None)
+    if errors:
+        return None, errors
+    return {
+        'version': ARTIFACT_VERSION,
+        'created': datetime.datetime.utcnow().isoformat(),
+        'locale': config.get('ckan.locale_default', 'en'),
+        'preset_urls': preset_urls,
+        'presets': presets,
+        'sources': sources,
+        'plugins': entries,
+    }, []
+
+
+def save(path, artifact):
+    with open(path, 'wb') as f:
+        pickle.dump(artifact, f, pickle.HIGHEST_PROTOCOL)
+
+
+def load(config):
+    """
+    Return the artifact at scheming.compiled if it was built from the
+    current options and files, otherwise None
+    """
+    path = config.get('scheming.compiled')
+    if not path:
+        return None
+    if path in _artifacts:
+        return _artifacts[path]
+
+    artifact = None
+    try:
+        with open(path, 'rb') as f:
+            artifact = pickle.load(f)
+        _check(config, artifact)
+    except Exception as e:
+        # unreadable, stale or written by another python or version
+        log.warning('Not using compiled schemas %s: %s', path, e)
+        artifact = None
+    _artifacts[path] = artifact
+    return artifact
+
+
+def _check(config, artifact):
+    from ckanext.scheming.plugins import DEFAULT_PRESETS
+
+    if artifact.get('version') != ARTIFACT_VERSION:
+        raise SchemingException('built by another version')
+    if artifact['locale'] != config.get('ckan.locale_default', 'en'):
+        raise SchemingException('built for another ckan.locale_default')
+    if artifact['preset_urls'] != config.get(
+            'scheming.presets', DEFAULT_PRESETS).split():
+        raise SchemingException('scheming.presets changed')
+    for option, entry in six.iteritems(artifact['plugins']):
+        if entry['urls'] != config.get(option, '').split():
+            raise SchemingException('{0} changed'.format(option))
+    current = source_hashes(list(artifact['sources']))
+    changed = sorted(
+        url for url, h in six.iteritems(artifact['sources'])
+        if current[url] != h)
+    if changed:
+        raise SchemingException('changed: {0}'.format(', '.join(changed)))
+
+
+def compiled_schemas(config, plugin):
+    """
+    Return (schemas, expanded schemas) for plugin from the compiled
+    artifact, or None
+    """
+    artifact = load(config)
+    if artifact is None:
+        return None
+    entry = artifact['plugins'].get(plugin.SCHEMA_OPTION)
+    if entry is None:
+        return None
+    return entry['schemas'], entry['expanded']
+
+
+def reset():
+    _artifacts.clear()
@@ -0,0 +1,69 @@
+"""
+Storage format of repeating subfield values kept in package extras.
+
+Values are written as compact JSON. With key compression the subfield
+names are written once instead of in every entry::
+
+    [{"name": "Larry", "role": "author"}, {"name": "Moe", "role": "editor"}]
+
+is stored as::
+
+    {"k":["name","role"],"r":[["Larry","author"],["Moe","editor"]]}
+
+Enable key compression with::
+
+    scheming.composite_compact_keys = true
+
+decode reads both forms, so stored values don't need to be migrated when
+the option changes. Repeating subfield values are always lists, so a
+stored object is never mistaken for a list of entries.
+"""
+import json
+
+from ckantoolkit import missing
+
+KEYS = 'k'
+ROWS = 'r'
+
+SEPARATORS = (',', ':')
+
+
+def _default(value):
+    if value is missing:
+        return None
+    raise TypeError(
+        '{0!r} is not JSON serializable'.format(value))
+
+
+def encode(entries, compact_keys=False):
+    """
+    Return entries, a list of subfield dicts, as JSON text. Missing
+    values are written as null. With compact_keys the subfield names
+    of the first entry are written once and each entry with the same
+    names in the same order is written as a list of values, other
+    entries are written unchanged.
+    """
+    if compact_keys and entries and isinstance(entries, list) and all(
+            isinstance(e, dict) for e in entries):
+        keys = list(entries[0])
+        entries = {
+            KEYS: keys,
+            ROWS: [
+                [e[k] for k in keys] if list(e) == keys else e
+                for e in entries],
+        }
+    return json.dumps(entries, separators=SEPARATORS, default=_default)
+
+
+def decode(text):
+    """
+    Return the list of subfield dicts stored as text by encode, or by
+    json.dumps in earlier versions
+    """
+    value = json.loads(text)
+    if isinstance(value, dict) and KEYS in value and ROWS in value:
+        keys = value[KEYS]
+        return [
+            dict(zip(keys, row)) if isinstance(row, list) else row
+            for row in value[ROWS]]
+    return value
@@ -0,0 +1,173 @@
+# encoding: utf-8
+"""
+Stream all datasets of a scheming type as CSV or JSON lines, with the
+columns given by the expanded schema's dataset_fields and
+resource_fields.
+
+Datasets are read in batches of ids and written one at a time, so memory
+use doesn't grow with the number of datasets exported.
+"""
+import csv
+import io
+import json
+import logging
+
+import six
+
+import ckan.model as model
+from ckantoolkit import get_action
+
+log = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl')
+
+# validators storing a field as JSON text not decoded by package_show
+JSON_VALIDATORS = ('scheming_valid_json_object',)
+
+
+class ExportPlan(object):
+    """
+    The columns exported for one dataset type, compiled once from its
+    expanded schema
+    """
+    def __init__(self, schema):
+        self.dataset_type = schema['dataset_type']
+        self.dataset_fields = [
+            (f['field_name'], _is_json(f))
+            for f in schema.get('dataset_fields', ())]
+        self.resource_fields = [
+            (f['field_name'], _is_json(f))
+            for f in schema.get('resource_fields', ())]
+
+    @property
+    def columns(self):
+        """
+        Column names for CSV, resources are one JSON column
+        """
+        columns = [name for name, is_json in self.dataset_fields]
+        if self.resource_fields:
+            columns.append('resources')
+        return columns
+
+    def record(self, pkg_dict):
+        """
+        Return the exported values of pkg_dict with JSON text fields
+        decoded
+        """
+        record = _select(pkg_dict, self.dataset_fields)
+        if self.resource_fields:
+            record['resources'] = [
+                _select(res, self.resource_fields)
+                for res in pkg_dict.get('resources', ())]
+        return record
+
+
+def _is_json(field):
+    return any(
+        v in field.get('validators', '').split() for v in JSON_VALIDATORS)
+
+
+def _select(data, fields):
+    out = {}
+    for name, is_json in fields:
+        value = data.get(name)
+        if is_json and isinstance(value, six.string_types) and value:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        out[name] = value
+    return out
+
+
+def package_id_batches(dataset_type, batch_size=500):
+    """
+    Generate lists of up to batch_size ids of the active datasets of
+    dataset_type in id order, querying one batch at a time
+    """
+    last = None
+    while True:
+        q = model.Session.query(model.Package.id).filter(
+            model.Package.type == dataset_type,
+            model.Package.state == u'active')
+        if last is not None:
+            q = q.filter(model.Package.id > last)
+        ids = [pkg_id for (pkg_id,) in
+               q.order_by(model.Package.id).limit(batch_size)]
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def iter_records(plan, batch_size=500):
+    """
+    Generate the exported record of each dataset of plan's type
+    """
+    context = {
+        'model': model,
+        'ignore_auth': True,
+        'use_cache': False,
+    }
+    package_show = get_action('package_show')
+    for ids in package_id_batches(plan.dataset_type, batch_size):
+        for pkg_id in ids:
+            try:
+                pkg_dict = package_show(dict(context), {'id': pkg_id})
+            except Exception:
+                log.exception(u'Error exporting dataset %s', pkg_id)
+                continue
+            yield plan.record(pkg_dict)
+        # don't keep the objects loaded for this batch. The session is
+        # kept, it may be the one of the request streaming the export
+        model.Session.expunge_all()
+
+
+def jsonl_lines(records):
+    """
+    Generate one line of compact JSON per record
+    """
+    for record in records:
+        yield json.dumps(record, separators=(',', ':'), sort_keys=True) + '\n'
+
+
+def csv_lines(records, columns):
+    """
+    Generate CSV text for records, starting with a header line. List and
+    dict values are written as compact JSON.
+    """
+    buf = six.StringIO() if six.PY3 else io.BytesIO()
+    writer = csv.writer(buf)
+
+    def line(row):
+        writer.writerow(row)
+        text = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return text if six.PY3 else text.decode('utf-8')
+
+    yield line(columns)
+    for record in records:
+        yield line([_cell(record.get(c)) for c in columns])
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value, separators=(',', ':'), sort_keys=True)
+    elif not isinstance(value, six.string_types):
+        value = six.text_type(value)
+    return value if six.PY3 else value.encode('utf-8')
+
+
+def export_lines(schema, fmt='jsonl', batch_size=500):
+    """
+    Generate the export of all datasets using schema in fmt ("csv" or
+    "jsonl") as lines of text
+    """
+    plan = ExportPlan(schema)
+    records = iter_records(plan, batch_size)
+    if fmt == 'csv':
+        return csv_lines(records, plan.columns)
+    return jsonl_lines(records)
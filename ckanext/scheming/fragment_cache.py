@@ -0,0 +1,98 @@
+"""
+Optional cache for rendered template fragments, e.g. the scheming
+dataset metadata table. Enable with::
+
+    scheming.fragment_cache = memory   # or redis
+    scheming.fragment_cache.size = 1000  # memory: entries kept
+    scheming.fragment_cache.ttl = 86400  # redis: seconds kept
+
+Fragments are keyed by everything that changes their rendering, so
+entries never need to be invalidated, only evicted.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from ckantoolkit import config, asint
+
+_store = {}
+
+
+class LRUCache(object):
+    """
+    In-process cache keeping the maxsize most recently used entries,
+    each for at most ttl seconds when ttl is given
+    """
+    def __init__(self, maxsize=1000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                return None
+            if expires is not None and expires <= time.time():
+                return None
+            self._data[key] = (value, expires)
+            return value
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+class RedisCache(object):
+    """
+    Cache shared between processes, client is a redis connection or
+    anything else with the same get(key) and set(key, value, ex=ttl)
+    """
+    def __init__(self, client, ttl=86400):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(key)
+        if isinstance(value, bytes):
+            return value.decode('utf-8')
+        return value
+
+    def set(self, key, value):
+        self.client.set(key, value.encode('utf-8'), ex=self.ttl)
+
+
+def get_store():
+    """
+    Return the configured fragment cache, or None when disabled
+    """
+    try:
+        return _store['store']
+    except KeyError:
+        pass
+    store = _store['store'] = _make_store(config)
+    return store
+
+
+def reset():
+    """
+    Forget the configured fragment cache, e.g. after config changes
+    """
+    _store.clear()
+
+
+def _make_store(config):
+    kind = config.get('scheming.fragment_cache')
+    if kind == 'memory':
+        return LRUCache(asint(config.get('scheming.fragment_cache.size', 1000)))
+    if kind == 'redis':
+        from ckan.lib.redis import connect_to_redis
+        return RedisCache(
+            connect_to_redis(),
+            asint(config.get('scheming.fragment_cache.ttl', 86400)))
@@ -0,0 +1,89 @@
+"""
+Read-only schema snapshots that may be shared between threads and used
+in cache keys without locks
+"""
+import itertools
+from collections import OrderedDict
+
+_versions = itertools.count(1)
+
+
+def _read_only(*args, **kwargs):
+    raise TypeError('scheming schemas are read-only, copy them to modify')
+
+
+class FrozenDict(dict):
+    """
+    dict that can't be modified after it is created. dict(d) returns a
+    modifiable shallow copy.
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class FrozenList(list):
+    """
+    list that can't be modified after it is created. list(l) returns a
+    modifiable shallow copy.
+    """
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = reverse = sort = clear = \
+        _read_only
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(value):
+    """
+    Return value with its plain dicts and lists, at any depth, replaced
+    by FrozenDict and FrozenList. Other values are returned unchanged.
+    """
+    if type(value) in (dict, OrderedDict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if type(value) is list:
+        return FrozenList(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """
+    Return a modifiable deep copy of a frozen value
+    """
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [thaw(v) for v in value]
+    return value
+
+
+class SchemaSnapshot(object):
+    """
+    The schemas and expanded schemas of one plugin, frozen. Each
+    snapshot has a new version so caches may be keyed on it.
+    """
+    __slots__ = ('version', 'schemas', 'expanded_schemas')
+
+    def __init__(self, schemas, expanded_schemas):
+        self.version = next(_versions)
+        self.schemas = freeze(schemas)
+        self.expanded_schemas = freeze(expanded_schemas)
@@ -14,9 +14,13 @@ import ckan.logic as logic
 import ckan.plugins.toolkit as tk
 
 from jinja2 import Environment
-from ckantoolkit import config, _
+from markupsafe import Markup
+from ckantoolkit import config, asint, _
 from ckanapi import LocalCKAN, NotFound, NotAuthorized
 
+from ckanext.scheming import fragment_cache, remote_choices, references
+from ckanext.scheming.frozen import FrozenDict
+
 try:
     from collections import OrderedDict
 except ImportError:
@@ -25,6 +29,16 @@ except ImportError:
 all_helpers = {}
 log = logging.getLogger(__name__)
 
+# (content hash, bundle, JSON text) by expanded, cleared when schemas load
+_schema_bundles = {}
+
+# LRUCache of datastore choices when scheming.datastore_choices.ttl is set
+_datastore_choices = {}
+
+ALL_TIMEZONES = frozenset(pytz.all_timezones)
+_timezones = {}
+_timezone_options = {}
+
 def helper(fn):
     """
     collect helper functions into ckanext.scheming.all_helpers dict
@@ -40,6 +54,60 @@ def lang():
     return h.lang()
 
 
+def _lookup_locales():
+    try:
+        prefer_lang = lang()
+    except TypeError:
+        prefer_lang = None  # lang() call will fail when no user language available
+    return prefer_lang, config.get('ckan.locale_default', 'en')
+
+
+def _request_locales():
+    """
+    Return (user language, default locale) for the current request.
+
+    Both values are looked up once per request and kept on the template
+    context, outside of a request they are looked up on every call.
+    """
+    from ckantoolkit import c
+    try:
+        locales = getattr(c, '_scheming_locales', None)
+    except (TypeError, RuntimeError, AttributeError):
+        return _lookup_locales()
+    if not locales:
+        locales = _lookup_locales()
+        try:
+            c._scheming_locales = locales
+        except (TypeError, RuntimeError, AttributeError):
+            pass
+    return locales
+
+
+class LanguageText(FrozenDict):
+    """
+    {lang: text} dict from a schema with the text to use for languages
+    not present resolved when the schema is loaded, so that
+    scheming_language_text is a single dict lookup.
+    """
+    __slots__ = ('fallback',)
+
+    def __init__(self, text, default_locale):
+        super(LanguageText, self).__init__(text)
+        try:
+            self.fallback = text[default_locale]
+        except KeyError:
+            l, self.fallback = sorted(text.items())[0]
+
+    def __reduce__(self):
+        return (LanguageText, (dict(self), None), {'fallback': self.fallback})
+
+    def __setstate__(self, state):
+        self.fallback = state['fallback']
+
+    def resolve(self, prefer_lang):
+        return self.get(prefer_lang, self.fallback)
+
+
 @helper
 def scheming_language_text(text, prefer_lang=None):
     """
@@ -54,18 +122,20 @@ def scheming_language_text(text, prefer_lang=None):
 
     assert text != {}
     if hasattr(text, 'get'):
+        default_locale = None
+        if prefer_lang is None:
+            prefer_lang, default_locale = _request_locales()
+
+        if isinstance(text, LanguageText):
+            return text.resolve(prefer_lang)
+
         try:
-            if prefer_lang is None:
-                prefer_lang = lang()
-        except TypeError:
-            pass  # lang() call will fail when no user language available
-        else:
-            try:
-                return text[prefer_lang]
-            except KeyError:
-                pass
+            return text[prefer_lang]
+        except KeyError:
+            pass
 
-        default_locale = config.get('ckan.locale_default', 'en')
+        if default_locale is None:
+            default_locale = config.get('ckan.locale_default', 'en')
         try:
             return text[default_locale]
         except KeyError:
@@ -130,7 +200,8 @@ def scheming_datastore_choices(field):
       ]
 
     When columns aren't specified the first column is used as value
-    and second column used as label.
+    and second column used as label. The records are cached when
+    scheming.datastore_choices.ttl (seconds) is set.
     """
     resource_id = field['datastore_choices_resource']
     limit = field.get('datastore_choices_limit', 1000)
@@ -139,6 +210,20 @@ def scheming_datastore_choices(field):
     if columns:
         fields = [columns['value'], columns['label']]
 
+    cache = _datastore_choices_cache()
+    key = (resource_id, limit, tuple(fields or ()))
+    datastore_choices = cache.get(key) if cache else None
+    if datastore_choices is None:
+        datastore_choices = _fetch_datastore_choices(resource_id, limit, fields)
+        if cache and datastore_choices:
+            cache.set(key, datastore_choices)
+
+    additional_choices = field.get('datastore_additional_choices', [])
+
+    return additional_choices + datastore_choices
+
+
+def _fetch_datastore_choices(resource_id, limit, fields):
     # anon user must be able to read choices or this helper
     # could be used to leak data from private datastore tables
     lc = LocalCKAN(username='')
@@ -153,14 +238,26 @@ def scheming_datastore_choices(field):
     if not fields:
         fields = [f['id'] for f in result['fields'] if f['id'] != '_id']
 
-    datastore_choices = [{
+    return [{
         'value': r[fields[0]],
         'label': r[fields[1]]
     } for r in result['records']]
 
-    additional_choices = field.get('datastore_additional_choices', [])
 
-    return additional_choices + datastore_choices
+def _datastore_choices_cache():
+    """
+    Return the LRUCache for datastore choices, or None when
+    scheming.datastore_choices.ttl isn't set
+    """
+    try:
+        return _datastore_choices['cache']
+    except KeyError:
+        pass
+    ttl = asint(config.get('scheming.datastore_choices.ttl', 0))
+    cache = _datastore_choices['cache'] = fragment_cache.LRUCache(
+        asint(config.get('scheming.datastore_choices.size', 100)),
+        ttl) if ttl else None
+    return cache
 
 
 @helper
@@ -297,6 +394,129 @@ def scheming_get_schema(entity_type, object_type, expanded=True):
         return scheming_get_group_schema(object_type, expanded)
 
 
+def schema_payload(entity_type, object_type, expanded=True):
+    """
+    Return (content hash, JSON text) prepared when the schema for the
+    entity and object types passed was loaded, or None if no schema
+    is defined for the passed types
+    """
+    from ckanext.scheming.plugins import (
+        SchemingDatasetsPlugin, SchemingGroupsPlugin,
+        SchemingOrganizationsPlugin)
+    plugin = {
+        'dataset': SchemingDatasetsPlugin,
+        'group': SchemingGroupsPlugin,
+        'organization': SchemingOrganizationsPlugin,
+    }.get(entity_type)
+    if plugin and plugin.instance:
+        return plugin.instance._schema_payloads.get((object_type, expanded))
+
+
+def schema_bundle(expanded=True):
+    """
+    Return (content hash, bundle, JSON text) for all dataset, group and
+    organization schemas and the presets, built once after the schemas
+    are loaded. The bundle is shared and must not be modified.
+    """
+    try:
+        return _schema_bundles[expanded]
+    except KeyError:
+        pass
+
+    from ckanext.scheming.plugins import (
+        SchemingDatasetsPlugin, SchemingGroupsPlugin,
+        SchemingOrganizationsPlugin, _schema_payload)
+
+    bundle = {}
+    hashes = {}
+    for entity_type, plugin in (
+            ('dataset', SchemingDatasetsPlugin),
+            ('group', SchemingGroupsPlugin),
+            ('organization', SchemingOrganizationsPlugin)):
+        bundle[entity_type] = {}
+        hashes[entity_type] = {}
+        if not plugin.instance:
+            continue
+        schemas = (plugin.instance._expanded_schemas if expanded
+                   else plugin.instance._schemas)
+        for t, schema in schemas.items():
+            content_hash = plugin.instance._schema_payloads[t, expanded][0]
+            bundle[entity_type][t] = {'hash': content_hash, 'schema': schema}
+            hashes[entity_type][t] = content_hash
+
+    presets = scheming_get_presets() or {}
+    hashes['presets'] = _schema_payload(presets)[0]
+    bundle['presets'] = {'hash': hashes['presets'], 'presets': presets}
+    bundle['hash'] = _schema_payload(hashes)[0]
+
+    result = _schema_bundles[expanded] = (
+        bundle['hash'], bundle, json.dumps(bundle))
+    return result
+
+
+def _fragment_key(name, pkg_dict, dataset_type):
+    """
+    Return the fragment cache key for fragment name rendered for
+    pkg_dict, or None when it can't be cached
+    """
+    if not pkg_dict.get('id') or not pkg_dict.get('metadata_modified'):
+        return None
+    payload = schema_payload('dataset', dataset_type)
+    if payload is None:
+        return None
+    prefer_lang, default_locale = _request_locales()
+    return u'scheming:fragment:{0}:{1}:{2}:{3}:{4}:{5}'.format(
+        name, pkg_dict['id'], pkg_dict['metadata_modified'], dataset_type,
+        payload[0], prefer_lang or default_locale)
+
+
+@helper
+def scheming_fragment_cache_get(name, pkg_dict, dataset_type):
+    """
+    Return the cached rendering of fragment name for pkg_dict, or None
+    when not cached or when scheming.fragment_cache is not enabled
+    """
+    store = fragment_cache.get_store()
+    if store is None:
+        return None
+    key = _fragment_key(name, pkg_dict, dataset_type)
+    if key is None:
+        return None
+    value = store.get(key)
+    if value is not None:
+        return Markup(value)
+
+
+@helper
+def scheming_fragment_cache_set(name, pkg_dict, dataset_type, rendered):
+    """
+    Store the rendering of fragment name for pkg_dict when
+    scheming.fragment_cache is enabled and return rendered
+    """
+    store = fragment_cache.get_store()
+    if store is not None:
+        key = _fragment_key(name, pkg_dict, dataset_type)
+        if key is not None:
+            store.set(key, six.text_type(rendered))
+    return rendered
+
+
+@helper
+def scheming_remote_choices_url(entity_type, object_type, field):
+    """
+    Return the URL serving the cached choices for a select-from-json or
+    select-process field, or None when the field has no
+    data-module-source or the choices view isn't available (CKAN < 2.9)
+    """
+    if not tk.check_ckan_version('2.9') or not entity_type:
+        return None
+    if not remote_choices.field_source(field):
+        return None
+    return tk.url_for(
+        'scheming.choices_show', entity_type=entity_type,
+        object_type=object_type, field_name=field['field_name'])
+
+
 @helper
 def scheming_field_by_name(fields, name):
     """
@@ -308,6 +528,34 @@ def scheming_field_by_name(fields, name):
             return f
 
 
+# well-formed ISO 8601 strings handled without the generic parsers below
+_ISO_DATETIME_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{6}))?'
+    r'(?:(Z)|([+-])(\d{2}):(\d{2}))?\Z')
+_ISO_NAIVE_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})'
+    r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{6}))?)?)?\Z')
+_TZ_SPLIT_RE = re.compile(r'([Z+-])')
+_NON_DIGITS_RE = re.compile(r'[^\d]+')
+_SECONDS_RE = re.compile(r'(?P<seconds>\d{2})(\.(?P<microseconds>\d{3,6}))?$')
+
+
+def iso_str_to_datetime(date_str):
+    """
+    Convert a date or datetime string without timezone to a datetime
+    object, returning the same values as ckan's h.date_str_to_datetime.
+
+    Strings like "2014-01-01", "2014-01-01 12:35" or
+    "2014-01-01T12:35:00.000001" are parsed directly, anything else is
+    passed to h.date_str_to_datetime.
+    """
+    m = _ISO_NAIVE_RE.match(date_str)
+    if not m:
+        from ckantoolkit import h
+        return h.date_str_to_datetime(date_str)
+    return datetime.datetime(*(int(x) for x in m.groups() if x is not None))
+
+
 def date_tz_str_to_datetime(date_str):
     """Convert ISO-like formatted datestring with timezone to datetime object.
 
@@ -319,20 +567,45 @@ def date_tz_str_to_datetime(date_str):
            function doesn't fully adhere to the format.  It allows microsecond
            precision, despite that not being part of the ISO format.
     """
+    m = _ISO_DATETIME_RE.match(date_str)
+    if not m:
+        return _date_tz_str_to_datetime(date_str)
+
+    (year, month, day, hour, minute, second, microsecond,
+        z, sign, tz_hours, tz_minutes) = m.groups()
+    final_date = datetime.datetime(
+        int(year), int(month), int(day),
+        int(hour), int(minute), int(second),
+        int(microsecond) if microsecond else 0)
+
+    if sign:
+        offset = int(tz_hours) * 60 + int(tz_minutes)
+        if sign == '+':
+            offset *= -1
+        final_date += datetime.timedelta(minutes=offset)
+
+    return final_date
+
+
+def _date_tz_str_to_datetime(date_str):
+    """
+    General parser used by date_tz_str_to_datetime for strings that
+    are not well-formed ISO 8601, e.g. without seconds or with
+    3-5 digit fractions
+    """
     split = date_str.split('T')
 
     if len(split) < 2:
         raise ValueError('Unable to parse time')
 
-    tz_split = re.split('([Z+-])', split[1])
+    tz_split = _TZ_SPLIT_RE.split(split[1])
 
     date = split[0] + 'T' + tz_split[0]
-    time_tuple = re.split('[^\d]+', date, maxsplit=5)
+    time_tuple = _NON_DIGITS_RE.split(date, maxsplit=5)
 
     # Extract seconds and microseconds
     if len(time_tuple) >= 6:
-        m = re.match('(?P<seconds>\d{2})(\.(?P<microseconds>\d{3,6}))?$',
-                     time_tuple[5])
+        m = _SECONDS_RE.match(time_tuple[5])
         if not m:
             raise ValueError('Unable to parse %s as seconds.microseconds' %
                              time_tuple[5])
@@ -345,7 +618,7 @@ def date_tz_str_to_datetime(date_str):
     # Apply the timezone offset
     if len(tz_split) > 1 and not tz_split[1] == 'Z':
         tz = tz_split[2]
-        tz_tuple = re.split('[^\d]+', tz)
+        tz_tuple = _NON_DIGITS_RE.split(tz)
 
         if tz_tuple[0] == '':
             raise ValueError('Unable to parse timezone')
@@ -374,27 +647,54 @@ def scheming_datetime_to_utc(date):
 @helper
 def scheming_datetime_to_tz(date, tz):
     if isinstance(tz, six.string_types):
-        tz = pytz.timezone(tz)
+        tz = get_timezone(tz)
 
     # Make date naive before returning
     return pytz.utc.localize(date).astimezone(tz).replace(tzinfo=None)
 
 
+def get_timezone(name):
+    """
+    Return the pytz timezone object for name, memoized.
+    Raises pytz.UnknownTimeZoneError for unknown names.
+    """
+    try:
+        return _timezones[name]
+    except KeyError:
+        tz = _timezones[name] = pytz.timezone(name)
+        return tz
+
+
 @helper
 def scheming_get_timezones(field):
-    def to_options(l):
-        return [{'value': tz, 'text': tz} for tz in l]
+    """
+    Return the timezone options for a datetime_tz field as a tuple
+    of {"value": .., "text": ..} dicts. Options are built once for
+    each "timezones" setting and shared between fields, do not modify.
+    """
+    timezones = field.get('timezones')
+    if isinstance(timezones, list):
+        key = tuple(timezones)
+    elif timezones == 'all':
+        key = timezones
+    else:
+        key = None
 
-    def validate_tz(l):
-        return [tz for tz in l if tz in pytz.all_timezones]
+    try:
+        return _timezone_options[key]
+    except KeyError:
+        pass
 
-    timezones = field.get('timezones')
-    if timezones == 'all':
-        return to_options(pytz.all_timezones)
-    elif isinstance(timezones, list):
-        return to_options(validate_tz(timezones))
+    if key is None:
+        names = pytz.common_timezones
+    elif key == 'all':
+        names = pytz.all_timezones
+    else:
+        names = [tz for tz in timezones if tz in ALL_TIMEZONES]
 
-    return to_options(pytz.common_timezones)
+    options = _timezone_options[key] = tuple(
+        {'value': tz, 'text': tz} for tz in names)
+    return options
 
 
 @helper
@@ -474,9 +774,22 @@ def datasets_available(ds_type):
     return result['results']
 
 @helper
-def datasets_related(ds_type, field, term):
+def datasets_related(ds_type, field, term, page=1, rows=1000):
+    """
+    Return the datasets of ds_type whose reference field holds the
+    dataset term (an id, name or link), one page of rows at a time
+    """
+    target = references.resolve([term])[0]
     context = {}
-    data_dict = { u'fq': u''+field+':*'+term+'* type:'+ds_type , u'rows': '1000'}
+    data_dict = {
+        u'fq': u'+type:{0} +{1}'.format(
+            references.quote(ds_type),
+            references.search_filter(field, target)),
+        u'fl': u'id name title',
+        u'sort': u'title_string asc',
+        u'rows': rows,
+        u'start': (page - 1) * rows,
+    }
     result = logic.get_action(u'package_search')(context, data_dict)
     return result['results']
  
@@ -0,0 +1,130 @@
+# encoding: utf-8
+"""
+Create datasets from CSV or JSON lines in the format written by
+ckanext.scheming.export, committing in chunks and indexing once at the
+end instead of after every dataset
+"""
+import csv
+import json
+import logging
+import time
+
+import six
+
+import ckan.model as model
+from ckantoolkit import config, get_action, ValidationError
+
+log = logging.getLogger(__name__)
+
+
+def read_records(lines, fmt='jsonl'):
+    """
+    Generate (line number, dataset dict) from lines of CSV or JSON
+    lines. Empty CSV cells are left out and cells holding JSON lists or
+    objects are decoded, reversing the export format.
+    """
+    if fmt == 'csv':
+        reader = csv.reader(lines)
+        columns = next(reader, None) or []
+        for row in reader:
+            yield reader.line_num, {
+                column: _decode_cell(cell)
+                for column, cell in zip(columns, row) if cell != ''}
+        return
+
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            yield number, json.loads(line)
+
+
+def _decode_cell(cell):
+    if cell[:1] in ('[', '{'):
+        try:
+            return json.loads(cell)
+        except ValueError:
+            pass
+    return cell
+
+
+def chunks(records, size):
+    """
+    Generate lists of up to size items from the records iterable
+    """
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_records(records, dataset_type=None, user=None, chunk_size=100,
+                   errors=None, progress=None):
+    """
+    Create a dataset for each (line number, dataset dict) in records as
+    user, by default the site user.
+    Each chunk of chunk_size datasets is written in one transaction,
+    with a savepoint per dataset so a failing dataset doesn't undo the
+    others. Search indexing is turned off while writing.
+
+    errors, when given, is a file receiving one JSON line per dataset
+    not created: {"line": ..., "name": ..., "errors": {...}}.
+    progress(rows, created, elapsed) is called after each chunk.
+
+    :returns: (rows read, [ids of datasets created], seconds)
+    """
+    if user is None:
+        user = get_action('get_site_user')({'ignore_auth': True}, {})['name']
+    context = {
+        'model': model,
+        'session': model.Session,
+        'user': user,
+        'defer_commit': True,
+        'return_id_only': True,
+    }
+    package_create = get_action('package_create')
+    created = []
+    rows = 0
+    start = time.time()
+
+    automatic_indexing = config.get('ckan.search.automatic_indexing')
+    config['ckan.search.automatic_indexing'] = False
+    try:
+        for chunk in chunks(records, chunk_size):
+            for number, data_dict in chunk:
+                rows += 1
+                if dataset_type:
+                    data_dict.setdefault('type', dataset_type)
+                savepoint = model.Session.begin_nested()
+                try:
+                    pkg_id = package_create(dict(context), data_dict)
+                except Exception as e:
+                    savepoint.rollback()
+                    if isinstance(e, ValidationError):
+                        row_errors = e.error_dict
+                    else:
+                        log.exception(u'Error importing line %s', number)
+                        row_errors = {'__error': [six.text_type(e)]}
+                    if errors is not None:
+                        errors.write(json.dumps({
+                            'line': number,
+                            'name': data_dict.get('name'),
+                            'errors': row_errors,
+                        }, sort_keys=True) + '\n')
+                    continue
+                savepoint.commit()
+                created.append(pkg_id)
+            model.repo.commit()
+            model.Session.remove()
+            if progress:
+                progress(rows, len(created), time.time() - start)
+    finally:
+        model.Session.rollback()
+        if automatic_indexing is None:
+            config.pop('ckan.search.automatic_indexing', None)
+        else:
+            config['ckan.search.automatic_indexing'] = automatic_indexing
+
+    return rows, created, time.time() - start
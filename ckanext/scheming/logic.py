@@ -1,9 +1,18 @@
-from ckantoolkit import get_or_bust, side_effect_free, ObjectNotFound
+import six
+from ckantoolkit import (
+    get_or_bust, side_effect_free, chained_action, check_access,
+    ObjectNotFound, NotAuthorized, ValidationError, asbool, asint, config, _)
+import ckan.authz as authz
+import ckan.model as model
+
+from ckanext.scheming import (
+    validator_stats, batch, remote_choices, references)
 
 from ckanext.scheming.helpers import (
     scheming_dataset_schemas, scheming_get_dataset_schema,
     scheming_group_schemas, scheming_get_group_schema,
     scheming_organization_schemas, scheming_get_organization_schema,
+    scheming_get_schema, schema_bundle,
     )
 
 @side_effect_free
@@ -74,6 +83,270 @@ def scheming_organization_schema_show(context, data_dict):
     return s
 
 
+@side_effect_free
+def scheming_schema_bundle(context, data_dict):
+    '''
+    Return all dataset, group and organization schemas and the presets
+    in one response, e.g.::
+
+        {"dataset": {"camel-photos": {"hash": "...", "schema": {...}}},
+         "group": {...}, "organization": {...},
+         "presets": {"hash": "...", "presets": {...}},
+         "hash": "..."}
+
+    Each schema and the presets carry a content hash, the top-level hash
+    changes when any of them do.
+
+    :param expanded: True to expand presets (default)
+    '''
+    expanded = asbool(data_dict.get('expanded', True))
+    return schema_bundle(expanded)[1]
+
+
+@side_effect_free
+def scheming_validation_stats(context, data_dict):
+    '''
+    Return the number of calls and time spent in each scheming validator
+    since the server started, slowest total first, e.g.::
+
+        {"enabled": true,
+         "validators": [{"type": "dataset", "field": "title",
+                         "validator": "not_empty", "calls": 12,
+                         "total_ms": 0.4, "mean_ms": 0.03,
+                         "max_ms": 0.1}, ...]}
+
+    Enable collection with the scheming.validator_stats option.
+    Only available to sysadmins.
+    '''
+    if not context.get('ignore_auth') and not authz.is_sysadmin(
+            context.get('user')):
+        raise NotAuthorized()
+    return {
+        'enabled': validator_stats.enabled,
+        'validators': validator_stats.stats(),
+    }
+
+
+def scheming_dataset_validate_many(context, data_dict):
+    '''
+    Validate many datasets as package_create or package_update would,
+    without storing anything, e.g. to check harvested records::
+
+        [{"valid": false, "errors": {"category": ["..."]}, "data": {...}},
+         {"valid": true, "errors": {}, "data": {...}}, ...]
+
+    One result is returned for each dataset, in order, with the dataset
+    as it would be stored after validation and conversion.
+
+    :param datasets: list of dataset dicts
+    :param action: "create" (default) or "update", datasets to update
+        need the "id" or "name" of an existing dataset
+    :param workers: number of processes to validate in, limited by the
+        scheming.validate_many.max_workers option (default 1)
+    '''
+    datasets = get_or_bust(data_dict, 'datasets')
+    if not isinstance(datasets, list):
+        raise ValidationError({'datasets': [_('Must be a list')]})
+    action = data_dict.get('action', 'create')
+    if action not in batch.ACTIONS:
+        raise ValidationError({'action': [_('Must be create or update')]})
+    workers = min(
+        asint(data_dict.get('workers', 1)),
+        asint(config.get('scheming.validate_many.max_workers', 1)))
+
+    return batch.validate_datasets(
+        datasets,
+        action,
+        user=context.get('user'),
+        ignore_auth=bool(context.get('ignore_auth')),
+        workers=workers)
+
+
+@side_effect_free
+def scheming_remote_choices(context, data_dict):
+    '''
+    Return the choices for a field using the select-from-json or
+    select-process form modules, fetched from the field's
+    data-module-source on the server and cached, e.g.::
+
+        [{"value": "http://example.com/metric/1", "label": "Accuracy"}, ...]
+
+    :param entity_type: "dataset" (default), "group" or "organization"
+    :param type: the dataset, group or organization type
+    :param field_name: the field or subfield name
+    '''
+    entity_type = data_dict.get('entity_type', 'dataset')
+    t = get_or_bust(data_dict, 'type')
+    field_name = get_or_bust(data_dict, 'field_name')
+    schema = scheming_get_schema(entity_type, t)
+    field = schema and remote_choices.find_field(schema, field_name)
+    source = field and remote_choices.field_source(field)
+    if not source:
+        raise ObjectNotFound()
+    try:
+        return remote_choices.get_choices(*source)[1]
+    except remote_choices.ChoicesUnavailable as e:
+        raise ValidationError({'field_name': [str(e)]})
+
+
+def _reference_source(context, data_dict):
+    pkg = model.Package.get(get_or_bust(data_dict, 'id'))
+    if pkg is None or pkg.state == u'deleted':
+        raise ObjectNotFound()
+    check_access('package_show', dict(context), {'id': pkg.id})
+    return pkg.id
+
+
+def _hidden_datasets(context, targets):
+    '''
+    Return the set of dataset ids in targets the user may not see,
+    other targets (links to other sites) are never hidden
+    '''
+    targets = set(targets)
+    if not targets:
+        return set()
+    hidden = set()
+    sysadmin = context.get('ignore_auth') or authz.is_sysadmin(
+        context.get('user'))
+    for pkg_id, private, state in model.Session.query(
+            model.Package.id, model.Package.private, model.Package.state
+            ).filter(model.Package.id.in_(targets)):
+        if state != u'active':
+            hidden.add(pkg_id)
+        elif private and not sysadmin:
+            try:
+                check_access('package_show', dict(context), {'id': pkg_id})
+            except NotAuthorized:
+                hidden.add(pkg_id)
+    return hidden
+
+
+@side_effect_free
+def scheming_dataset_references(context, data_dict):
+    '''
+    Return the datasets and links a dataset references in its fields
+    marked with "reference": true, by field name, e.g.::
+
+        {"rel_datasets": ["<dataset id>", "http://example.com/other"]}
 
+    Datasets on this site are returned as ids.
+
+    :param id: the id or name of the dataset
+    '''
+    pkg_id = _reference_source(context, data_dict)
+    refs = references.get_graph().references(pkg_id)
+    hidden = _hidden_datasets(
+        context, [t for targets in refs.values() for t in targets])
+    return {
+        field: [t for t in targets if t not in hidden]
+        for field, targets in refs.items()}
+
+
+@side_effect_free
+def scheming_dataset_referenced_by(context, data_dict):
+    '''
+    Return the datasets referencing a dataset, e.g. the workflows using
+    it, with the field holding the reference::
+
+        [{"id": "<dataset id>", "field": "rel_datasets"}, ...]
+
+    :param id: the id or name of the dataset
+    :param field: only return references from this field (optional)
+    '''
+    pkg_id = _reference_source(context, data_dict)
+    field = data_dict.get('field')
+    found = [
+        (source, f) for source, f in
+        references.get_graph().referenced_by(pkg_id)
+        if not field or f == field]
+    hidden = _hidden_datasets(context, [source for source, f in found])
+    return [
+        {'id': source, 'field': f}
+        for source, f in found if source not in hidden]
 
 
+@side_effect_free
+def scheming_dataset_lineage(context, data_dict):
+    '''
+    Return the datasets reached by following references from a dataset
+    and the references followed::
+
+        {"nodes": ["<dataset id>", ...],
+         "edges": [{"source": "<dataset id>", "field": "used",
+                    "target": "<dataset id>"}, ...]}
+
+    :param id: the id or name of the dataset
+    :param direction: "upstream" (default) to follow the references of
+        each dataset, "downstream" to follow the datasets referencing it
+    :param depth: number of steps to follow, default 5, limited by the
+        scheming.lineage.max_depth option (default 10)
+    :param fields: only follow references in these fields, a list or
+        comma separated string (optional)
+    '''
+    pkg_id = _reference_source(context, data_dict)
+    direction = data_dict.get('direction', 'upstream')
+    if direction not in ('upstream', 'downstream'):
+        raise ValidationError(
+            {'direction': [_('Must be upstream or downstream')]})
+    depth = min(
+        asint(data_dict.get('depth', 5)),
+        asint(config.get('scheming.lineage.max_depth', 10)))
+    fields = data_dict.get('fields')
+    if isinstance(fields, six.string_types):
+        fields = fields.replace(',', ' ').split()
+
+    nodes, edges = references.lineage(pkg_id, direction, depth, fields)
+    hidden = _hidden_datasets(context, nodes)
+    return {
+        'nodes': [n for n in nodes if n not in hidden],
+        'edges': [
+            {'source': source, 'field': field, 'target': target}
+            for source, field, target in edges
+            if source not in hidden and target not in hidden],
+    }
+
+
+# always returned when fields are requested
+PROJECTION_KEYS = ('id', 'name', 'type')
+
+
+def projection_fields(value):
+    """
+    Return the frozenset of field names requested as a list or a comma
+    or space separated string, or None when value is empty
+    """
+    if not value:
+        return None
+    if isinstance(value, six.string_types):
+        value = value.replace(',', ' ').split()
+    return frozenset(value).union(PROJECTION_KEYS)
+
+
+def project(pkg_dict, fields):
+    """
+    Return pkg_dict with only the keys in fields
+    """
+    return {k: v for k, v in pkg_dict.items() if k in fields}
+
+
+@chained_action
+@side_effect_free
+def package_show(up_func, context, data_dict):
+    '''
+    package_show accepting an optional ``fields`` parameter: a list (or
+    comma separated string) of the fields to return. Only those scheming
+    fields are decoded by their output validators. "id", "name" and
+    "type" are always returned.
+    '''
+    fields = projection_fields(data_dict.get('fields'))
+    if fields is None:
+        return up_func(context, data_dict)
+    data_dict = dict(data_dict)
+    del data_dict['fields']
+    # a copy, so the caller's context is unchanged. The fields are for
+    # this dataset only and removed once used, so package_show calls
+    # made with this context by other plugins (e.g. in after_show)
+    # return all fields
+    context = dict(context, scheming_fields=(
+        data_dict.get('id') or data_dict.get('name_or_id'), fields))
+    return project(up_func(context, data_dict), fields)
@@ -2,13 +2,13 @@
 # encoding: utf-8
 import os
 import inspect
+import hashlib
 import logging
 from functools import wraps
 from re import L
 
 import six
 import yaml
-import json as json_key
 import ckan.plugins as p
 from pylons import config
 
@@ -40,12 +40,14 @@ from ckantoolkit import (
     add_template_directory,
     add_resource,
     add_public_directory,
-    missing,
     check_ckan_version,
 )
 
-from ckanext.scheming import helpers, validation, logic, loader
+from ckanext.scheming import (
+    helpers, validation, logic, loader, fragment_cache, validator_stats,
+    reloader, remote_choices, compiler, warmup, references, composite)
 from ckanext.scheming.errors import SchemingException
+from ckanext.scheming.frozen import SchemaSnapshot, freeze
 
 ignore_missing = get_validator('ignore_missing')
 not_empty = get_validator('not_empty')
@@ -54,6 +56,26 @@ convert_from_extras = get_converter('convert_from_extras')
 
 DEFAULT_PRESETS = 'ckanext.scheming:presets.json'
 
+# validators that store a JSON object, indexed as JSON text by default
+INDEX_JSON_VALIDATORS = (
+    'scheming_valid_json_object',
+)
+
+# validators that store a JSON list, indexed as a list by default
+# field keys that may hold {lang: text} values
+LANGUAGE_TEXT_KEYS = (
+    'label',
+    'repeating_label',
+    'form_placeholder',
+    'help_text',
+    'form_alert_warning',
+    'upload_label',
+    'label_date',
+    'label_time',
+    'label_tz',
+    'facet_label',
+)
+
 log = logging.getLogger(__name__)
 
 def run_once_for_caller(var_name, rval_fn):
@@ -86,13 +108,32 @@ class _SchemingMixin(object):
 
     All plugins below need helpers and template directories, but we should
     only do them once when any plugin is loaded.
+
+    Schemas and presets are read-only once loaded. A plugin's schemas are
+    replaced as a whole by _set_schemas, giving a new snapshot version.
     """
     instance = None
     _presets = None
     _is_fallback = False
     _schema_urls = tuple()
-    _schemas = tuple()
-    _expanded_schemas = tuple()
+    _snapshot = SchemaSnapshot({}, {})
+    _schema_payloads = {}
+
+    @property
+    def _schemas(self):
+        return self._snapshot.schemas
+
+    @property
+    def _expanded_schemas(self):
+        return self._snapshot.expanded_schemas
+
+    @property
+    def schema_version(self):
+        """
+        Version of the current schemas, changed every time they are
+        loaded so it may be used in cache keys
+        """
+        return self._snapshot.version
 
     @run_once_for_caller('_scheming_get_helpers', dict)
     def get_helpers(self):
@@ -115,18 +156,13 @@ class _SchemingMixin(object):
         if _SchemingMixin._presets is not None:
             return
 
-        presets = reversed(
-            config.get(
-                'scheming.presets',
-                DEFAULT_PRESETS
-            ).split()
-        )
+        artifact = compiler.load(config)
+        if artifact is not None:
+            _SchemingMixin._presets = artifact['presets']
+            return
 
-        _SchemingMixin._presets = {
-            field['preset_name']: field['values']
-            for preset_path in presets
-            for field in _load_schema(preset_path)['presets']
-        }
+        _SchemingMixin._presets = _read_presets(
+            config.get('scheming.presets', DEFAULT_PRESETS).split())
 
     def update_config(self, config):
         if self.instance:
@@ -138,20 +174,55 @@ class _SchemingMixin(object):
         self._store_instance(self)
         self._add_template_directory(config)
         self._load_presets(config)
+        validator_stats.configure(config)
 
         self._is_fallback = p.toolkit.asbool(
             config.get(self.FALLBACK_OPTION, False)
         )
 
         self._schema_urls = config.get(self.SCHEMA_OPTION, "").split()
-        self._schemas = _load_schemas(
-            self._schema_urls,
-            self.SCHEMA_TYPE_FIELD
-        )
-        # log.info(self._schemas)
+        compiled = compiler.compiled_schemas(config, self)
+        if compiled is not None:
+            self._set_schemas(*compiled)
+        else:
+            schemas = freeze(_load_schemas(
+                self._schema_urls,
+                self.SCHEMA_TYPE_FIELD
+            ))
+            self._set_schemas(schemas, _expand_schemas(schemas))
+        reloader.watch(self, config)
+
+    def _set_schemas(self, schemas, expanded_schemas):
+        """
+        Replace this plugin's schemas with a frozen snapshot of schemas
+        and expanded_schemas in one assignment, then rebuild the lookup
+        tables derived from them
+        """
+        self._snapshot = SchemaSnapshot(schemas, expanded_schemas)
+        self._compile_schemas()
 
- 
-        self._expanded_schemas = _expand_schemas(self._schemas)
+    def _compile_schemas(self):
+        """
+        Build lookup tables derived from self._expanded_schemas, called
+        every time the schemas are loaded. Each table is built completely
+        before it replaces the previous one, so requests running while
+        schemas are reloaded never see a partial table.
+        """
+        helpers._schema_bundles.clear()
+        helpers._datastore_choices.clear()
+        fragment_cache.reset()
+        remote_choices.reset()
+        self._schema_payloads = {
+            (t, expanded): _schema_payload(schema)
+            for expanded, schemas in (
+                (True, self._expanded_schemas), (False, self._schemas))
+            for t, schema in schemas.items()
+        }
+
+    @run_once_for_caller('_scheming_get_blueprint', list)
+    def get_blueprint(self):
+        from ckanext.scheming import views
+        return [views.scheming]
 
     def is_fallback(self):
         return self._is_fallback
@@ -209,10 +280,21 @@ class SchemingDatasetsPlugin(p.SingletonPlugin, DefaultDatasetForm,
     # this is required 
     p.implements(p.IFacets, inherit=False)
     p.implements(p.IPackageController, inherit=True)
+    p.implements(p.IMiddleware, inherit=True)
+    if hasattr(p, 'IClick'):
+        p.implements(p.IClick)
+    if hasattr(p, 'IBlueprint'):
+        p.implements(p.IBlueprint)
 
     SCHEMA_OPTION = 'scheming.dataset_schemas'
     FALLBACK_OPTION = 'scheming.dataset_fallback'
     SCHEMA_TYPE_FIELD = 'dataset_type'
+    _validators_cache = {}
+    _facet_fields = {}
+    _facets_cache = {}
+    _filter_config = OrderedDict()
+    _index_transforms = {}
+    _reference_fields = {}
     # this the name of the Field
     SCHEMA_FILTER_ORDER = ['organization', 'groups', 'tags', 'res_format', 'license_id']
     # this is the label of the field
@@ -241,40 +323,72 @@ class SchemingDatasetsPlugin(p.SingletonPlugin, DefaultDatasetForm,
     def package_types(self):
         return list(self._schemas)
 
+    def _compile_schemas(self):
+        super(SchemingDatasetsPlugin, self)._compile_schemas()
+        self._filter_config = _filter_config(config)
+        self._validators_cache = {}
+        self._facets_cache = {}
+        facet_fields = {}
+        index_transforms = {}
+        encode_composite = p.plugin_loaded('scheming_nerf_index')
+        reference_fields = {}
+        for t, schema in self._expanded_schemas.items():
+            fields = tuple(
+                f for f in schema.get('dataset_fields', ()) if f.get('facet'))
+            if fields:
+                facet_fields[t] = fields
+            transforms = _compile_index_transforms(schema, encode_composite)
+            if transforms:
+                index_transforms[t] = transforms
+            refs = tuple(
+                f['field_name'] for f in schema.get('dataset_fields', ())
+                if f.get('reference'))
+            if refs:
+                reference_fields[t] = refs
+        self._facet_fields = facet_fields
+        self._index_transforms = index_transforms
+        self._reference_fields = reference_fields
+        references.reset()
+
     def get_filter_config(self):
-        # this iis the function to add the facets to the ckan
-        filter_order = config.get('ckanext.scheming.filter_order', '')
-        filter_titles = config.get('ckanext.scheming.filter_titles', '')
-        if filter_order and filter_titles:
-            filter_order = filter_order.split(' ')
-            filter_titles = filter_titles.split(' ')
-        else:
-            filter_order = self.SCHEMA_FILTER_ORDER
-            filter_titles = self.SCHEMA_FILTER_TITLES
-
-        facets_ordered = OrderedDict()
-        for k in range(len(filter_order)):
-            facets_ordered[filter_order[k]] = filter_titles[k]
-        
-        return facets_ordered
-    
+        """
+        Return the facets for organization and group pages from the
+        ckanext.scheming.filter_order and ckanext.scheming.filter_titles
+        options, parsed once when the configuration is loaded
+        """
+        return self._filter_config
+
     def dataset_facets(self, facets_dict, package_type):
-        facets_dict['gemet_keywords'] = p.toolkit._('gemet_keywords')
-        facets_dict['theme'] = p.toolkit._('theme')
+        """
+        Add the fields with "facet": true in the package_type schema to
+        facets_dict. The (field name, label) pairs are built once for
+        each dataset type and language, a new dict is returned every time
+        because later plugins may modify it.
+        """
+        fields = self._facet_fields.get(package_type)
+        if not fields:
+            return facets_dict
+
+        prefer_lang, default_locale = helpers._request_locales()
+        key = (package_type, prefer_lang)
+        try:
+            labels = self._facets_cache[key]
+        except KeyError:
+            labels = self._facets_cache[key] = tuple(
+                (f['field_name'], helpers.scheming_language_text(
+                    f.get('facet_label') or f.get('label') or f['field_name'],
+                    prefer_lang))
+                for f in fields)
+
+        facets = OrderedDict(facets_dict)
+        facets.update(labels)
+        return facets
 
-        return facets_dict
-        # Return the updated facet dict.
-        # return self.get_filter_config()
-            
     def organization_facets(self, facets_dict, organization_type, package_type):
-        #facets_dict['type'] = p.toolkit._('Type')
-        # Return the updated facet dict.
-        return self.get_filter_config()
-        
+        return OrderedDict(self._filter_config)
+
     def group_facets(self, facets_dict, group_type, package_type):
-        #facets_dict['type'] = p.toolkit._('Type')
-        # Return the updated facet dict.
-        return self.get_filter_config()
+        return OrderedDict(self._filter_config)
 
     def validate(self, context, data_dict, schema, action):
         """
@@ -289,53 +403,48 @@ class SchemingDatasetsPlugin(p.SingletonPlugin, DefaultDatasetForm,
 
         scheming_schema = self._expanded_schemas[t]
 
-        before = scheming_schema.get('before_validators')
-        after = scheming_schema.get('after_validators')
-        if action_type == 'show':
-            get_validators = _field_output_validators
-            before = after = None
-        elif action_type == 'create':
-            get_validators = _field_create_validators
-        else:
-            get_validators = _field_validators
+        convert = tuple(
+            f['field_name'] not in schema
+            for f in scheming_schema['dataset_fields'])
+        (before, after, dataset_validators, resource_validators,
+            composite_convert_fields, composite_convert_to
+            ) = self._compiled_validators(t, action_type, convert)
+
+        fields = None
+        if action_type == 'show' and 'scheming_fields' in context:
+            # fields requested from package_show for one dataset
+            pkg_ref, fields = context['scheming_fields']
+            if pkg_ref in (data_dict.get('id'), data_dict.get('name')):
+                del context['scheming_fields']
+            else:
+                fields = None
+        if fields is not None:
+            # only decode the scheming fields requested
+            skip = set(dataset_validators) - fields
+            dataset_validators = {
+                k: v for k, v in dataset_validators.items() if k in fields}
+            composite_convert_fields = [
+                f for f in composite_convert_fields if f in fields]
+            for k in skip:
+                data_dict.pop(k, None)
+            data_dict['extras'] = [
+                ex for ex in data_dict.get('extras', ())
+                if ex['key'] not in skip]
+            if 'resources' not in fields:
+                resource_validators = {}
 
         if before:
-            schema['__before'] = validation.validators_from_string(
-                before, None, scheming_schema)
+            schema['__before'] = before
         if after:
-            schema['__after'] = validation.validators_from_string(
-                after, None, scheming_schema)
-        fg = (
-            (scheming_schema['dataset_fields'], schema, True),
-            (scheming_schema['resource_fields'], schema['resources'], False)
-        )
-
-        composite_convert_fields = []
-        for field_list, destination, convert_extras in fg:
-            for f in field_list:
-                convert_this = convert_extras and f['field_name'] not in schema
-                destination[f['field_name']] = get_validators(
-                    f,
-                    scheming_schema,
-                    convert_this
-                )
-                if convert_this and 'repeating_subfields' in f:
-                    composite_convert_fields.append(f['field_name'])
-
-        def composite_convert_to(key, data, errors, context):
-            unflat = unflatten(data)
-            for f in composite_convert_fields:
-                if f not in unflat:
-                    continue
-                data[(f,)] = json.dumps(unflat[f], default=lambda x:None if x == missing else x)
-                convert_to_extras((f,), data, errors, context)
-                del data[(f,)]
+            schema['__after'] = after
+        schema.update(dataset_validators)
+        schema['resources'].update(resource_validators)
 
         if action_type == 'show':
             if composite_convert_fields:
                 for ex in data_dict['extras']:
                     if ex['key'] in composite_convert_fields:
-                        data_dict[ex['key']] = json.loads(ex['value'])
+                        data_dict[ex['key']] = composite.decode(ex['value'])
                 data_dict['extras'] = [
                     ex for ex in data_dict['extras']
                     if ex['key'] not in composite_convert_fields
@@ -364,6 +473,73 @@ class SchemingDatasetsPlugin(p.SingletonPlugin, DefaultDatasetForm,
 
         return navl_validate(data_dict, schema, context)
 
+    def _compiled_validators(self, t, action_type, convert):
+        """
+        Return (before, after, dataset field validators, resource field
+        validators, composite convert fields, composite convert validator)
+        for dataset type t and action_type. Validators are built once
+        for each combination of fields stored as extras (convert) and
+        reused, so they must not be modified.
+        """
+        key = (t, action_type, convert)
+        try:
+            return self._validators_cache[key]
+        except KeyError:
+            pass
+
+        scheming_schema = self._expanded_schemas[t]
+        before = scheming_schema.get('before_validators')
+        after = scheming_schema.get('after_validators')
+        if action_type == 'show':
+            get_validators = _field_output_validators
+            before = after = None
+        elif action_type == 'create':
+            get_validators = _field_create_validators
+        else:
+            get_validators = _field_validators
+
+        if before:
+            before = validation.validators_from_string(
+                before, None, scheming_schema)
+        if after:
+            after = validation.validators_from_string(
+                after, None, scheming_schema)
+
+        dataset_validators = {}
+        composite_convert_fields = []
+        for f, convert_this in zip(scheming_schema['dataset_fields'], convert):
+            dataset_validators[f['field_name']] = get_validators(
+                f,
+                scheming_schema,
+                convert_this
+            )
+            if convert_this and 'repeating_subfields' in f:
+                composite_convert_fields.append(f['field_name'])
+
+        resource_validators = {
+            f['field_name']: get_validators(f, scheming_schema, False)
+            for f in scheming_schema['resource_fields']
+        }
+
+        compact_keys = p.toolkit.asbool(
+            config.get('scheming.composite_compact_keys', False))
+
+        def composite_convert_to(key, data, errors, context):
+            unflat = unflatten(data)
+            for f in composite_convert_fields:
+                if f not in unflat:
+                    continue
+                data[(f,)] = composite.encode(unflat[f], compact_keys)
+                convert_to_extras((f,), data, errors, context)
+                del data[(f,)]
+        composite_convert_to = validator_stats.timed(
+            composite_convert_to, scheming_schema, None)
+
+        compiled = self._validators_cache[key] = (
+            before, after, dataset_validators, resource_validators,
+            composite_convert_fields, composite_convert_to)
+        return compiled
+
     def get_actions(self):
         """
         publish dataset schemas
@@ -371,8 +547,36 @@ class SchemingDatasetsPlugin(p.SingletonPlugin, DefaultDatasetForm,
         return {
             'scheming_dataset_schema_list': logic.scheming_dataset_schema_list,
             'scheming_dataset_schema_show': logic.scheming_dataset_schema_show,
+            'scheming_schema_bundle': logic.scheming_schema_bundle,
+            'scheming_validation_stats': logic.scheming_validation_stats,
+            'scheming_dataset_validate_many':
+                logic.scheming_dataset_validate_many,
+            'scheming_remote_choices': logic.scheming_remote_choices,
+            'scheming_dataset_references': logic.scheming_dataset_references,
+            'scheming_dataset_referenced_by':
+                logic.scheming_dataset_referenced_by,
+            'scheming_dataset_lineage': logic.scheming_dataset_lineage,
+            'package_show': logic.package_show,
         }
 
+    def make_middleware(self, app, config):
+        """
+        Warm up the scheming plugins once the Flask app is created, when
+        scheming.warmup is enabled
+        """
+        if (hasattr(app, 'jinja_env')
+                and p.toolkit.asbool(config.get('scheming.warmup', False))):
+            warmup.run_once([
+                plugin.instance for plugin in (
+                    SchemingDatasetsPlugin, SchemingGroupsPlugin,
+                    SchemingOrganizationsPlugin)
+                if plugin.instance], app)
+        return app
+
+    def get_commands(self):
+        from ckanext.scheming import cli
+        return [cli.scheming]
+
     def setup_template_variables(self, context, data_dict):
         super(SchemingDatasetsPlugin, self).setup_template_variables(
             context, data_dict)
@@ -382,13 +586,131 @@ class SchemingDatasetsPlugin(p.SingletonPlugin, DefaultDatasetForm,
         if not hasattr(c, 'licenses'):
             c.licenses = [('', '')] + model.Package.get_license_options()
 
-    # added for Solr
     def before_index(self, data_dict):
-        # Unflatten a flattened dict for Solr|
-        data_dict['gemet_keywords'] = json_key.loads(data_dict['gemet_keywords'])
-        data_dict['theme'] = json_key.loads(data_dict['theme'])
+        """
+        Convert JSON-stored values to lists or JSON text for Solr, using
+        the transforms compiled for this dataset type, and add the exact
+        targets of reference fields
+        """
+        transforms = self._index_transforms.get(data_dict.get('type'))
+        if transforms:
+            index_transform(data_dict, transforms)
+        fields = self._reference_fields.get(data_dict.get('type'))
+        if fields:
+            references.index_references(data_dict, fields)
         return data_dict
 
+    def after_create(self, context, pkg_dict):
+        """
+        Record the references of the new dataset in the reference graph
+        """
+        references.update(_package_id(context, pkg_dict), pkg_dict)
+
+    def after_update(self, context, pkg_dict):
+        references.update(_package_id(context, pkg_dict), pkg_dict)
+
+    def after_delete(self, context, pkg_dict):
+        references.remove(_package_id(context, pkg_dict))
+
+
+def _package_id(context, pkg_dict):
+    """
+    Return the id of the dataset a package controller hook was called
+    for. pkg_dict may only have its name, and package_delete passes on
+    its input, where "id" may be the name.
+    """
+    ref = pkg_dict.get('id') or pkg_dict.get('name')
+    pkg = model.Package.get(ref) if ref else None
+    if pkg is None:
+        pkg = context['package']
+    return pkg.id
+
+
+def _schema_payload(schema):
+    """
+    Return (content hash, JSON text) for schema. The hash is taken over
+    JSON with sorted keys so it only changes when the schema does.
+    """
+    canonical = json.dumps(schema, sort_keys=True, separators=(',', ':'))
+    content_hash = hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+    return content_hash, json.dumps(schema)
+
+
+def _filter_config(config):
+    """
+    Return an OrderedDict of {facet name: title} for organization and group
+    pages from the ckanext.scheming.filter_order and filter_titles options
+    """
+    filter_order = config.get('ckanext.scheming.filter_order', '')
+    filter_titles = config.get('ckanext.scheming.filter_titles', '')
+    if filter_order and filter_titles:
+        filter_order = filter_order.split(' ')
+        filter_titles = filter_titles.split(' ')
+    else:
+        filter_order = SchemingDatasetsPlugin.SCHEMA_FILTER_ORDER
+        filter_titles = SchemingDatasetsPlugin.SCHEMA_FILTER_TITLES
+
+    return OrderedDict(zip(filter_order, filter_titles))
+
+
+def _compile_index_transforms(schema, encode_composite=False):
+    """
+    Return ((field_name, transform), ...) for the dataset fields in
+    expanded schema that store JSON lists or objects.
+
+    Fields with "index_as": "list" are indexed as a list of values,
+    "index_as": "json" or a JSON object validator as JSON text. With
+    encode_composite repeating subfields are indexed as JSON text,
+    otherwise as stored.
+    """
+    out = []
+    for f in schema.get('dataset_fields', ()):
+        index_as = f.get('index_as')
+        if 'repeating_subfields' in f:
+            if index_as is None and encode_composite:
+                index_as = 'json'
+        elif index_as is None:
+            names = set(
+                v.split('(', 1)[0] for v in f.get('validators', '').split())
+            if names.intersection(INDEX_JSON_VALIDATORS):
+                index_as = 'json'
+        if index_as == 'list':
+            out.append((f['field_name'], _index_list))
+        elif index_as == 'json':
+            out.append((f['field_name'], _index_json))
+        elif index_as:
+            raise SchemingException(
+                'unknown index_as {!r} for field {!r}'.format(
+                    index_as, f['field_name']))
+    return tuple(out)
+
+
+def index_transform(data_dict, transforms):
+    """
+    Apply ((field_name, transform), ...) to the non-empty values in
+    data_dict
+    """
+    for field_name, transform in transforms:
+        value = data_dict.get(field_name)
+        if value:
+            data_dict[field_name] = transform(value)
+    return data_dict
+
+
+def _index_list(value):
+    if isinstance(value, six.string_types):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return [value]
+    return value
+
+
+def _index_json(value):
+    if isinstance(value, six.string_types):
+        return value
+    return json.dumps(value)
+
 
 def expand_form_composite(data, fieldnames):
     """
@@ -430,6 +752,8 @@ class SchemingGroupsPlugin(p.SingletonPlugin, _GroupOrganizationMixin,
     p.implements(p.IGroupForm, inherit=True)
     p.implements(p.IActions)
     p.implements(p.IValidators)
+    if hasattr(p, 'IBlueprint'):
+        p.implements(p.IBlueprint)
 
     SCHEMA_OPTION = 'scheming.group_schemas'
     FALLBACK_OPTION = 'scheming.group_fallback'
@@ -460,6 +784,8 @@ class SchemingOrganizationsPlugin(p.SingletonPlugin, _GroupOrganizationMixin,
     p.implements(p.IGroupForm, inherit=True)
     p.implements(p.IActions)
     p.implements(p.IValidators)
+    if hasattr(p, 'IBlueprint'):
+        p.implements(p.IBlueprint)
 
     SCHEMA_OPTION = 'scheming.organization_schemas'
     FALLBACK_OPTION = 'scheming.organization_fallback'
@@ -490,24 +816,26 @@ class SchemingOrganizationsPlugin(p.SingletonPlugin, _GroupOrganizationMixin,
 
 class SchemingNerfIndexPlugin(p.SingletonPlugin):
     """
-    json.dump repeating dataset fields in before_index to prevent failures
+    json.dump repeating dataset fields before indexing to prevent failures
     on unmodified solr schema. It's better to customize your solr schema
     and before_index processing than to use this plugin.
+
+    The encoding is compiled into the scheming_datasets index transforms
+    when this plugin is loaded, so datasets are transformed in one pass.
     """
     p.implements(p.IPackageController, inherit=True)
 
-    def before_index(self, data_dict):
-        schemas = SchemingDatasetsPlugin.instance._expanded_schemas
-        if data_dict['type'] not in schemas:
-            return data_dict
-
-        for d in schemas[data_dict['type']]['dataset_fields']:
-            if d['field_name'] not in data_dict:
-                continue
-            if 'repeating_subfields' in d:
-                data_dict[d['field_name']] = json.dumps(data_dict[d['field_name']])
 
-        return data_dict
+def _read_presets(urls):
+    """
+    Return the frozen presets defined in the preset files at urls,
+    earlier files taking precedence
+    """
+    return freeze({
+        field['preset_name']: field['values']
+        for preset_path in reversed(urls)
+        for field in _load_schema(preset_path)['presets']
+    })
 
 
 def _load_schemas(schemas, type_field):
@@ -530,7 +858,19 @@ def _load_schema_module_path(url):
     Given a path like "ckanext.spatialx:spatialx_schema.json"
     find the second part relative to the import path of the first
     """
+    p = _schema_module_file(url)
+    if p:
+        if watch_file:
+            watch_file(p)
+        with open(p) as schema_file:
+            return loader.load(schema_file)
+
 
+def _schema_module_file(url):
+    """
+    Return the file path for a module path like
+    "ckanext.spatialx:spatialx_schema.json", or None when it is not found
+    """
     module, file_name = url.split(':', 1)
     try:
         # __import__ has an odd signature
@@ -540,10 +880,7 @@ def _load_schema_module_path(url):
 
     p = os.path.join(os.path.dirname(inspect.getfile(m)), file_name)
     if os.path.exists(p):
-        if watch_file:
-            watch_file(p)
-        with open(p) as schema_file:
-            return loader.load(schema_file)
+        return p
 
 
 def _load_schema_url(url):
@@ -581,9 +918,10 @@ def _field_output_validators(f, schema, convert_extras,
             for sf in f['repeating_subfields']
         }
     elif convert_extras:
-        validators = [convert_from_extras_type, ignore_missing]
+        validators = _timed(
+            [convert_from_extras_type, ignore_missing], schema, f)
     else:
-        validators = [ignore_missing]
+        validators = _timed([ignore_missing], schema, f)
     if 'output_validators' in f:
         validators += validation.validators_from_string(
             f['output_validators'], f, schema)
@@ -601,12 +939,12 @@ def _field_validators(f, schema, convert_extras):
             schema
         )
     elif helpers.scheming_field_required(f):
-        validators = [not_empty]
+        validators = _timed([not_empty], schema, f)
     else:
-        validators = [ignore_missing]
+        validators = _timed([ignore_missing], schema, f)
 
     if convert_extras:
-        validators.append(convert_to_extras)
+        validators += _timed([convert_to_extras], schema, f)
 
     # If this field contains children, we need a special validator to handle
     # them.
@@ -634,7 +972,7 @@ def _field_create_validators(f, schema, convert_extras):
     )
 
     if convert_extras:
-        validators.append(convert_to_extras)
+        validators += _timed([convert_to_extras], schema, f)
 
     # If this field contains children, we need a special validator to handle
     # them.
@@ -647,6 +985,15 @@ def _field_create_validators(f, schema, convert_extras):
     return validators
 
 
+def _timed(validators, schema, f):
+    """
+    Return validators wrapped for validator_stats when it is enabled
+    """
+    if not validator_stats.enabled:
+        return validators
+    return [validator_stats.timed(v, schema, f) for v in validators]
+
+
 def _expand(schema, field):
     """
     If scheming field f includes a preset value return a new field
@@ -664,33 +1011,107 @@ def _expand(schema, field):
 
 
 
+def _resolve_language_text(field, default_locale):
+    """
+    Return a copy of field with its multilingual {lang: text} values
+    replaced by helpers.LanguageText objects.
+    """
+    field = dict(field)
+    for key in LANGUAGE_TEXT_KEYS:
+        if isinstance(field.get(key), dict) and field[key]:
+            field[key] = helpers.LanguageText(field[key], default_locale)
+    if isinstance(field.get('choices'), list):
+        field['choices'] = [
+            dict(c, label=helpers.LanguageText(c['label'], default_locale))
+            if isinstance(c, dict) and isinstance(c.get('label'), dict)
+            and c['label'] else c
+            for c in field['choices']
+        ]
+    return field
+
+
+def _resolve_snippets(field):
+    """
+    Add the template paths that snippets/display_field.html and
+    snippets/form_field.html render for field as "display_snippet_path"
+    and "form_snippet_path" (None when form_snippet is null).
+    """
+    display = field.get('display_snippet')
+    if not display:
+        if field.get('repeating_subfields'):
+            display = 'repeating_subfields.html'
+        elif field.get('choices') or 'choices_helper' in field:
+            display = 'select.html'
+        else:
+            display = 'text.html'
+    field['display_snippet_path'] = _snippet_path(
+        'scheming/display_snippets/', display)
+
+    if 'form_snippet' in field:
+        form = field['form_snippet']
+    elif field.get('repeating_subfields'):
+        form = 'repeating_subfields.html'
+    else:
+        form = 'text.html'
+    field['form_snippet_path'] = form and _snippet_path(
+        'scheming/form_snippets/', form)
+    return field
+
+
+def _snippet_path(directory, snippet):
+    if '/' in snippet:
+        return snippet
+    return directory + snippet
+
+
+def _prepare_field(schema, field, default_locale):
+    """
+    Return a new field with presets expanded, multilingual text resolved
+    and snippet paths added
+    """
+    return _resolve_snippets(
+        _resolve_language_text(_expand(schema, field), default_locale))
+
+
 def _expand_schemas(schemas):
     """
     Return a new dict of schemas with all field presets expanded.
-    """
-    out = {}
-    for name, original in schemas.items():
-        schema = dict(original)
-        for grouping in ('fields', 'dataset_fields', 'resource_fields'):
-            if grouping not in schema:
-                continue
+    The schemas passed are not modified.
 
+    raises SchemingException listing every preset not found.
+    """
+    missing = compiler.missing_presets(schemas, _SchemingMixin._presets)
+    if missing:
+        raise SchemingException('\n'.join(missing))
+    default_locale = config.get('ckan.locale_default', 'en')
+    return {
+        name: _expand_schema(schema, default_locale)
+        for name, schema in schemas.items()
+    }
+
+
+def _expand_schema(original, default_locale):
+    schema = dict(original)
+    for grouping in ('fields', 'dataset_fields', 'resource_fields'):
+        if grouping in schema:
             schema[grouping] = [
-                _expand(schema, field)
+                _expand_field(schema, field, default_locale)
                 for field in schema[grouping]
             ]
+    return schema
 
-            for field in schema[grouping]:
-                if 'repeating_subfields' in field:
-                    field['repeating_subfields'] = [
-                        _expand(schema, subfield)
-                        for subfield in field['repeating_subfields']
-                    ]
-                elif 'simple_subfields' in field:
-                    field['simple_subfields'] = [
-                        _expand(schema, subfield)
-                        for subfield in field['simple_subfields']
-                    ]
-
-        out[name] = schema
-    return out
+
+def _expand_field(schema, field, default_locale):
+    """
+    Return a new field prepared with _prepare_field, including its
+    subfields
+    """
+    field = _prepare_field(schema, field, default_locale)
+    for grouping in ('repeating_subfields', 'simple_subfields'):
+        if grouping in field:
+            field[grouping] = [
+                _prepare_field(schema, subfield, default_locale)
+                for subfield in field[grouping]
+            ]
+            break
+    return field
@@ -0,0 +1,434 @@
+"""
+Graph of the references between datasets, taken from dataset fields
+marked with ``"reference": true`` (e.g. the select_dataset_by_type
+preset) holding comma separated dataset links. Each dataset maps to
+{field name: [targets]} and each target to the (dataset, field) pairs
+referencing it, so lookups in both directions are dict or set lookups.
+
+Targets are dataset ids for links to datasets on this site and the
+link itself for other links. Choose where the graph is kept with::
+
+    scheming.reference_graph = memory   # default, or redis
+
+The memory graph is kept by each process. It is built from the
+database on first use and checked against the database at most every
+``scheming.reference_graph.sync_interval`` seconds (default 30), reading
+again the datasets changed by other processes. Prefer the redis graph
+when running many workers: it is shared, built once with
+``ckan scheming build-references`` and updated when datasets are
+created, updated or deleted.
+"""
+import collections
+import json
+import threading
+import time
+
+import six
+
+import ckan.model as model
+from ckantoolkit import config, asint
+
+REDIS_PREFIX = 'scheming:refs:'
+
+# reference fields are also indexed as exact values in <prefix><field
+# name>, matching the multivalued string vocab_* field of CKAN's Solr
+# schema
+INDEX_PREFIX = 'vocab_ref_'
+
+_graph = {}
+
+
+class MemoryGraph(object):
+    """
+    Reference graph kept in this process
+    """
+    def __init__(self):
+        self.forward = {}
+        self.reverse = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def set(self, source, refs):
+        """
+        Replace the references of dataset source with refs,
+        {field name: [targets]}
+        """
+        with self._lock:
+            for field, targets in self.forward.pop(source, {}).items():
+                for target in targets:
+                    sources = self.reverse.get(target)
+                    if sources is not None:
+                        sources.discard((source, field))
+                        if not sources:
+                            del self.reverse[target]
+            refs = {f: tuple(ts) for f, ts in refs.items() if ts}
+            if refs:
+                self.forward[source] = refs
+                for field, targets in refs.items():
+                    for target in targets:
+                        self.reverse[target].add((source, field))
+
+    def remove(self, source):
+        self.set(source, {})
+
+    def references(self, source):
+        """
+        Return {field name: [targets]} referenced by dataset source
+        """
+        return {f: list(ts) for f, ts in self.forward.get(source, {}).items()}
+
+    def referenced_by(self, target):
+        """
+        Return the sorted [(dataset, field name)] referencing target
+        """
+        return sorted(self.reverse.get(target, ()))
+
+    def clear(self):
+        with self._lock:
+            self.forward.clear()
+            self.reverse.clear()
+
+
+class RedisGraph(object):
+    """
+    Reference graph shared between processes in redis, with a hash of
+    field name to JSON targets per dataset and a set of
+    "dataset field" members per target
+    """
+    def __init__(self, client, prefix=REDIS_PREFIX):
+        self.client = client
+        self.prefix = prefix
+
+    def _forward(self, source):
+        return self.prefix + 'fwd:' + source
+
+    def _reverse(self, target):
+        return self.prefix + 'rev:' + target
+
+    def set(self, source, refs):
+        old = self.references(source)
+        pipe = self.client.pipeline()
+        for field, targets in old.items():
+            for target in targets:
+                pipe.srem(self._reverse(target), source + ' ' + field)
+        pipe.delete(self._forward(source))
+        for field, targets in refs.items():
+            if not targets:
+                continue
+            pipe.hset(self._forward(source), field, json.dumps(list(targets)))
+            for target in targets:
+                pipe.sadd(self._reverse(target), source + ' ' + field)
+        pipe.execute()
+
+    def remove(self, source):
+        self.set(source, {})
+
+    def references(self, source):
+        return {
+            _text(field): json.loads(_text(targets))
+            for field, targets in self.client.hgetall(
+                self._forward(source)).items()}
+
+    def referenced_by(self, target):
+        return sorted(
+            tuple(_text(member).split(' ', 1))
+            for member in self.client.smembers(self._reverse(target)))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def parse_links(value):
+    """
+    Return the links in a comma separated string or list
+    """
+    if not value:
+        return []
+    if isinstance(value, six.string_types):
+        value = value.split(',')
+    return [link.strip() for link in value if link and link.strip()]
+
+
+def local_name(link, site_url=None):
+    """
+    Return the dataset id or name a link to a dataset on this site ends
+    with, or None for other links. Plain ids and names count as local.
+    """
+    if site_url is None:
+        site_url = config.get('ckan.site_url', '')
+    site_url = site_url.rstrip('/')
+    if '://' in link:
+        if not site_url or not link.startswith(site_url + '/'):
+            return None
+    return link.rstrip('/').rsplit('/', 1)[-1] or None
+
+
+def resolve(links):
+    """
+    Return the target of each link: the id of the dataset a local link
+    points to, or the link itself
+    """
+    names = {link: local_name(link) for link in links}
+    wanted = set(n for n in names.values() if n)
+    ids = {}
+    if wanted:
+        for pkg_id, name in model.Session.query(
+                model.Package.id, model.Package.name).filter(
+                    model.Package.id.in_(wanted) |
+                    model.Package.name.in_(wanted)):
+            ids[pkg_id] = ids[name] = pkg_id
+    return [ids.get(names[link], link) for link in links]
+
+
+def reference_fields(dataset_type):
+    """
+    Return the names of the fields marked as references for a dataset
+    type
+    """
+    from ckanext.scheming.plugins import SchemingDatasetsPlugin
+
+    plugin = SchemingDatasetsPlugin.instance
+    if plugin is None:
+        return ()
+    return plugin._reference_fields.get(dataset_type, ())
+
+
+def field_value(pkg_dict, name):
+    """
+    Return the value of field name in pkg_dict, looking in extras for
+    validated data not yet converted back from extras
+    """
+    if pkg_dict.get(name):
+        return pkg_dict[name]
+    for extra in pkg_dict.get('extras') or ():
+        if extra.get('key') == name:
+            return extra.get('value')
+
+
+def dataset_references(pkg_dict):
+    """
+    Return {field name: [targets]} for the reference fields of pkg_dict
+    """
+    refs = {}
+    for name in reference_fields(pkg_dict.get('type')):
+        targets = resolve(parse_links(field_value(pkg_dict, name)))
+        if targets:
+            refs[name] = targets
+    return refs
+
+
+def index_references(data_dict, fields):
+    """
+    Add the targets of each reference field in fields to data_dict as
+    INDEX_PREFIX + field name for exact search queries, resolving the
+    links of all fields in one query
+    """
+    links = {name: parse_links(data_dict.get(name)) for name in fields}
+    every = sorted(set(link for ls in links.values() for link in ls))
+    if not every:
+        return data_dict
+    targets = dict(zip(every, resolve(every)))
+    for name, ls in links.items():
+        if ls:
+            data_dict[INDEX_PREFIX + name] = [targets[link] for link in ls]
+    return data_dict
+
+
+def search_filter(field, target):
+    """
+    Return a Solr filter matching datasets whose reference field holds
+    target exactly
+    """
+    return u'{0}{1}:{2}'.format(INDEX_PREFIX, field, quote(target))
+
+
+def quote(value):
+    """
+    Return value as a quoted Solr term
+    """
+    return u'"{0}"'.format(
+        value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def get_graph():
+    """
+    Return the configured reference graph. The memory graph is built
+    from the database on first use and brought up to date with changes
+    made by other processes when the sync interval has passed.
+    """
+    try:
+        graph = _graph['graph']
+    except KeyError:
+        if config.get('scheming.reference_graph', 'memory') == 'redis':
+            from ckan.lib.redis import connect_to_redis
+            graph = _graph['graph'] = RedisGraph(connect_to_redis())
+            return graph
+        graph = _graph['graph'] = MemoryGraph()
+        _graph['database'] = None
+        _graph['sync_interval'] = asint(
+            config.get('scheming.reference_graph.sync_interval', 30))
+        _graph['next_sync'] = 0
+    if 'database' in _graph and time.time() >= _graph['next_sync']:
+        sync(graph)
+    return graph
+
+
+def database_state():
+    """
+    Return (latest dataset metadata_modified, number of active datasets)
+    """
+    modified = model.Session.query(model.Package.metadata_modified).order_by(
+        model.Package.metadata_modified.desc()).limit(1).scalar()
+    active = model.Session.query(model.Package.id).filter(
+        model.Package.state == u'active').count()
+    return modified, active
+
+
+def sync(graph):
+    """
+    Update graph with the datasets changed in the database since the
+    last call: datasets modified since then are read again and datasets
+    referencing others that are no longer active are removed. Nothing
+    is read when the database state is unchanged. Changes made in this
+    process are applied to the graph directly and don't wait for this.
+    """
+    _graph['next_sync'] = time.time() + _graph.get('sync_interval', 0)
+    state = database_state()
+    last = _graph.get('database')
+    if state == last:
+        return
+    if last is None or last[0] is None:
+        rebuild(graph)
+    else:
+        changed = [pkg_id for (pkg_id,) in model.Session.query(
+            model.Package.id).filter(
+                model.Package.metadata_modified >= last[0])]
+        read_references(graph, changed)
+        sources = list(graph.forward)
+        if sources:
+            read_references(graph, [
+                pkg_id for (pkg_id,) in model.Session.query(
+                    model.Package.id).filter(
+                        model.Package.id.in_(sources),
+                        model.Package.state != u'active')])
+    _graph['database'] = state
+
+
+def rebuild(graph):
+    """
+    Replace the contents of graph with the references of all active
+    datasets read from the database, returns the number of datasets
+    with references
+    """
+    graph.clear()
+    return read_references(graph)
+
+
+def read_references(graph, ids=None):
+    """
+    Set the references of the datasets with ids in graph from the
+    database, removing datasets that are not active, or of all active
+    datasets when ids is None. Returns the number of datasets with
+    references.
+    """
+    from ckanext.scheming.plugins import SchemingDatasetsPlugin
+
+    plugin = SchemingDatasetsPlugin.instance
+    fields = plugin._reference_fields if plugin else {}
+    names = set(n for ns in fields.values() for n in ns)
+    if ids is not None:
+        if not ids:
+            return 0
+        for pkg_id in ids:
+            graph.remove(pkg_id)
+    if not names:
+        return 0
+
+    values = collections.defaultdict(dict)
+    q = model.Session.query(
+        model.Package.id, model.Package.type,
+        model.PackageExtra.key, model.PackageExtra.value
+    ).join(
+        model.PackageExtra, model.PackageExtra.package_id == model.Package.id
+    ).filter(
+        model.Package.state == u'active',
+        model.PackageExtra.key.in_(names))
+    if ids is not None:
+        q = q.filter(model.Package.id.in_(ids))
+    for pkg_id, pkg_type, key, value in q:
+        if key in fields.get(pkg_type, ()):
+            values[pkg_id][key] = parse_links(value)
+
+    links = set(link for refs in values.values()
+                for ls in refs.values() for link in ls)
+    targets = dict(zip(links, resolve(list(links))))
+    for pkg_id, refs in values.items():
+        graph.set(pkg_id, {
+            field: [targets[link] for link in ls]
+            for field, ls in refs.items()})
+    return len(values)
+
+
+def update(pkg_id, pkg_dict):
+    """
+    Record the references of a created or updated dataset
+    """
+    if pkg_dict.get('state') == u'deleted':
+        return remove(pkg_id)
+    get_graph().set(pkg_id, dataset_references(pkg_dict))
+
+
+def remove(pkg_id):
+    """
+    Forget the references of a deleted dataset
+    """
+    get_graph().remove(pkg_id)
+
+
+def lineage(pkg_id, direction='upstream', depth=5, fields=None):
+    """
+    Return (dataset ids reached, [(source, field, target), ...]) walking
+    references from pkg_id up to depth steps. upstream follows the
+    references of each dataset, downstream the datasets referencing it.
+    Only the fields named in fields are followed when given.
+    """
+    graph = get_graph()
+    seen = set([pkg_id])
+    edges = []
+    frontier = [pkg_id]
+    for _ in range(depth):
+        following = []
+        for node in frontier:
+            if direction == 'upstream':
+                found = [
+                    (node, field, target)
+                    for field, targets in graph.references(node).items()
+                    for target in targets]
+            else:
+                found = [
+                    (source, field, node)
+                    for source, field in graph.referenced_by(node)]
+            for edge in found:
+                if fields and edge[1] not in fields:
+                    continue
+                edges.append(edge)
+                other = edge[2] if direction == 'upstream' else edge[0]
+                if other not in seen:
+                    seen.add(other)
+                    following.append(other)
+        if not following:
+            break
+        frontier = following
+    seen.discard(pkg_id)
+    return sorted(seen), edges
+
+
+def reset():
+    """
+    Forget the reference graph, e.g. after the schemas change
+    """
+    _graph.clear()
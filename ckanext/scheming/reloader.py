@@ -0,0 +1,256 @@
+"""
+Optional reloading of changed schema and preset files without restarting
+workers (CKAN 2.9+). Enable with::
+
+    scheming.reload = true
+    scheming.reload.interval = 2  # seconds between checks
+
+At the start of a request, at most once per interval, the modification
+times of the schema and preset files loaded from module paths are
+checked. Only changed files are parsed again and only the schemas
+defined in them or using a changed preset are expanded again. Each
+plugin's schemas are then replaced by assignment, so requests already
+running keep the schemas they started with.
+"""
+import logging
+import os
+import threading
+import time
+
+from ckantoolkit import asbool
+
+from ckanext.scheming.frozen import freeze
+
+log = logging.getLogger(__name__)
+
+try:
+    _clock = time.perf_counter
+except AttributeError:  # Python 2
+    _clock = time.time
+
+DEFAULT_INTERVAL = 2
+
+
+class SchemaReloader(object):
+    """
+    Track schema and preset files for the scheming plugins and reload
+    the ones changed
+    """
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        # [(plugin, {path: [url, schema type]}), ...]
+        self.plugins = []
+        self.preset_urls = []
+        self.preset_paths = {}
+        self.preset_values = {}
+        self.mtimes = {}
+        self.last_reload = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+
+    def watch(self, plugin):
+        """
+        Track the schema files loaded by plugin from module paths
+        """
+        from ckanext.scheming.plugins import _load_schema, _schema_module_file
+
+        files = {}
+        for url in plugin._schema_urls:
+            path = _schema_module_file(url)
+            if path:
+                schema = _load_schema(url)
+                files[path] = [url, schema[plugin.SCHEMA_TYPE_FIELD]]
+                self.mtimes[path] = _mtime(path)
+        self.plugins = [
+            (p, f) for (p, f) in self.plugins if type(p) is not type(plugin)
+        ] + [(plugin, files)]
+
+    def watch_presets(self, urls):
+        """
+        Track the preset files given in the scheming.presets order
+        """
+        from ckanext.scheming.plugins import _schema_module_file
+
+        self.preset_urls = list(urls)
+        self.preset_paths = {}
+        for url in urls:
+            path = _schema_module_file(url)
+            if path:
+                self.preset_paths[path] = url
+                self.mtimes[path] = _mtime(path)
+            self.preset_values[url] = _load_presets_file(url)
+
+    def check(self):
+        """
+        Reload changed files if the interval has passed since the last
+        check. Returns the schema types reloaded.
+        """
+        now = time.time()
+        if now < self._next_check or not self._lock.acquire(False):
+            return []
+        try:
+            self._next_check = now + self.interval
+            changed = set()
+            for path, mtime in list(self.mtimes.items()):
+                new_mtime = _mtime(path)
+                if new_mtime != mtime:
+                    self.mtimes[path] = new_mtime
+                    changed.add(path)
+            if not changed:
+                return []
+            return self.reload(changed)
+        finally:
+            self._lock.release()
+
+    def reload(self, paths):
+        """
+        Parse the files at paths again and replace the schemas affected.
+        Files that fail to load are logged and their previous contents
+        kept. Returns the schema types reloaded.
+        """
+        from ckanext.scheming.plugins import (
+            _SchemingMixin, _load_schema, _expand_schemas)
+
+        start = _clock()
+        changed_presets = set()
+        preset_urls = [self.preset_paths[p] for p in paths
+                       if p in self.preset_paths]
+        if preset_urls:
+            for url in preset_urls:
+                try:
+                    self.preset_values[url] = _load_presets_file(url)
+                except Exception:
+                    log.exception('Error reloading presets %s', url)
+            old = _SchemingMixin._presets or {}
+            new = {
+                name: values
+                for url in reversed(self.preset_urls)
+                for name, values in self.preset_values[url].items()
+            }
+            changed_presets = {
+                name for name in set(old) | set(new)
+                if old.get(name) != new.get(name)}
+            _SchemingMixin._presets = freeze(new)
+
+        reloaded = []
+        for plugin, files in self.plugins:
+            schemas = dict(plugin._schemas)
+            dirty = set()
+            for path, entry in files.items():
+                if path not in paths:
+                    continue
+                url, old_type = entry
+                try:
+                    schema = _load_schema(url)
+                    t = schema[plugin.SCHEMA_TYPE_FIELD]
+                except Exception:
+                    log.exception('Error reloading schema %s', url)
+                    continue
+                if t != old_type:
+                    schemas.pop(old_type, None)
+                    entry[1] = t
+                schemas[t] = schema
+                dirty.add(t)
+            if changed_presets:
+                dirty.update(
+                    t for t, schema in schemas.items()
+                    if schema_presets(schema) & changed_presets)
+            if not dirty:
+                continue
+
+            try:
+                expanded = _expand_schemas({t: schemas[t] for t in dirty})
+            except Exception:
+                log.exception('Error expanding schemas %s', sorted(dirty))
+                continue
+            expanded_schemas = {
+                t: s for t, s in plugin._expanded_schemas.items()
+                if t in schemas}
+            expanded_schemas.update(expanded)
+            _swap(plugin, schemas, expanded_schemas, dirty)
+            reloaded.extend(sorted(dirty))
+
+        elapsed = _clock() - start
+        self.last_reload = {
+            'files': sorted(paths),
+            'types': reloaded,
+            'seconds': elapsed,
+        }
+        log.info('Reloaded scheming schemas %s from %s in %.1fms',
+                 ', '.join(reloaded) or '(none)', ', '.join(sorted(paths)),
+                 elapsed * 1000)
+        return reloaded
+
+
+def schema_presets(schema):
+    """
+    Return the set of preset names used by the fields of schema
+    """
+    names = set()
+    for grouping in ('fields', 'dataset_fields', 'resource_fields'):
+        for field in schema.get(grouping, ()):
+            names.add(field.get('preset'))
+            for sub in ('repeating_subfields', 'simple_subfields'):
+                for subfield in field.get(sub, ()):
+                    names.add(subfield.get('preset'))
+    names.discard(None)
+    return names
+
+
+def _swap(plugin, schemas, expanded_schemas, types):
+    """
+    Replace plugin's schemas and rebuild its lookup tables, keeping the
+    compiled validators of the schema types not reloaded
+    """
+    validators = getattr(plugin, '_validators_cache', None)
+    plugin._set_schemas(schemas, expanded_schemas)
+    if validators:
+        plugin._validators_cache.update(
+            (key, value) for key, value in validators.items()
+            if key[0] not in types and key[0] in expanded_schemas)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _load_presets_file(url):
+    from ckanext.scheming.plugins import _load_schema
+
+    return {
+        field['preset_name']: field['values']
+        for field in _load_schema(url)['presets']
+    }
+
+
+_reloader = {}
+
+
+def watch(plugin, config):
+    """
+    Track plugin's schema files when scheming.reload is enabled
+    """
+    from ckanext.scheming.plugins import DEFAULT_PRESETS
+
+    if not asbool(config.get('scheming.reload', False)):
+        _reloader.clear()
+        return
+    reloader = _reloader.get('reloader')
+    if reloader is None:
+        reloader = _reloader['reloader'] = SchemaReloader(float(
+            config.get('scheming.reload.interval', DEFAULT_INTERVAL)))
+        reloader.watch_presets(
+            config.get('scheming.presets', DEFAULT_PRESETS).split())
+    reloader.watch(plugin)
+
+
+def check():
+    """
+    Reload changed schema files when scheming.reload is enabled
+    """
+    reloader = _reloader.get('reloader')
+    if reloader is not None:
+        reloader.check()
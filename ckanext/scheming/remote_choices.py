@@ -0,0 +1,272 @@
+"""
+Server-side fetching and caching of the choices offered by the
+select-from-json and select-process form modules, configured by a
+field's form_attrs::
+
+    "data-module-mode": "sparql",   # or "json"
+    "data-module-source": "https://example.com/sparql",
+    "data-module-query": "SELECT ?subject ?label WHERE { ... }"
+
+Choices are normalized to [{"value": ..., "label": ...}, ...] and kept
+in a per-process LRU cache::
+
+    scheming.remote_choices.ttl = 3600     # seconds, default 3600
+    scheming.remote_choices.size = 100     # sources kept, default 100
+    scheming.remote_choices.timeout = 10   # seconds, default 10
+
+Validators check values against a Registry: a frozenset snapshot of the
+values offered by a source, refreshed in a background thread.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import requests
+import six
+from ckantoolkit import config, asint
+
+from ckanext.scheming.errors import SchemingException
+from ckanext.scheming.fragment_cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+# form modules that load their choices from data-module-source
+MODULES = ('select-from-json', 'select-process')
+
+# seconds before retrying a source that couldn't be fetched
+RETRY_INTERVAL = 60
+
+_cache = {}
+_fetch_locks = {}
+_fetch_locks_lock = threading.Lock()
+_registries = {}
+
+
+class ChoicesUnavailable(SchemingException):
+    pass
+
+
+def field_source(field):
+    """
+    Return (mode, source, query) for a field using one of MODULES, or
+    None for other fields
+    """
+    attrs = field.get('form_attrs') or {}
+    if attrs.get('data-module') not in MODULES:
+        return None
+    source = attrs.get('data-module-source')
+    if not source:
+        return None
+    return (
+        attrs.get('data-module-mode') or 'json',
+        source,
+        attrs.get('data-module-query'),
+    )
+
+
+def find_field(schema, field_name):
+    """
+    Return the field or subfield named field_name in schema, or None
+    """
+    for grouping in ('fields', 'dataset_fields', 'resource_fields'):
+        for field in schema.get(grouping, ()):
+            if field['field_name'] == field_name:
+                return field
+            for sub in ('repeating_subfields', 'simple_subfields'):
+                for subfield in field.get(sub, ()):
+                    if subfield['field_name'] == field_name:
+                        return subfield
+
+
+def get_choices(mode, source, query=None):
+    """
+    Return (content hash, choices, compact JSON text, expiry time) for
+    the source, fetched when not cached or expired.
+
+    :raises ChoicesUnavailable: when the source can't be fetched
+    """
+    key = (mode, source, query)
+    cache = _get_cache()
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    # fetch each source once, even when many forms open at the same time
+    with _fetch_locks_lock:
+        lock = _fetch_locks.setdefault(key, threading.Lock())
+    with lock:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        choices = fetch_choices(
+            mode, source, query,
+            asint(config.get('scheming.remote_choices.timeout', 10)))
+        body = json.dumps(choices, separators=(',', ':'))
+        entry = (
+            hashlib.sha1(body.encode('utf-8')).hexdigest(),
+            choices,
+            body,
+            time.time() + cache.ttl,
+        )
+        cache.set(key, entry)
+        return entry
+
+
+def fetch_choices(mode, source, query=None, timeout=10):
+    """
+    Fetch and normalize the choices from a SPARQL endpoint or JSON file
+
+    :raises ChoicesUnavailable: when the source can't be fetched
+    """
+    try:
+        if mode == 'sparql':
+            response = requests.post(
+                source,
+                data={'query': query or ''},
+                headers={'Accept': 'application/sparql-results+json'},
+                timeout=timeout)
+        else:
+            response = requests.get(
+                source,
+                headers={'Accept': 'application/json'},
+                timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        log.warning('Could not fetch choices from %s: %s', source, e)
+        raise ChoicesUnavailable(
+            'Could not fetch choices from %s' % source)
+    return normalize_choices(data)
+
+
+def normalize_choices(data):
+    """
+    Return [{"value": ..., "label": ...}, ...] for SPARQL JSON results
+    (?subject and ?label variables), lists of values or objects, and
+    registry JSON like the INSPIRE themes. Repeated values are dropped.
+    """
+    if isinstance(data, dict):
+        if 'results' in data:
+            items = [
+                {'value': b['subject']['value'],
+                 'label': b.get('label', b['subject'])['value']}
+                for b in data['results'].get('bindings', ())
+                if 'subject' in b]
+        elif 'register' in data:
+            items = data['register'].get('containeditems', ())
+        else:
+            items = data.get('choices', ())
+    else:
+        items = data
+
+    out = []
+    seen = set()
+    for item in items:
+        choice = _choice(item)
+        if choice and choice['value'] not in seen:
+            seen.add(choice['value'])
+            out.append(choice)
+    return out
+
+
+def _choice(item):
+    if isinstance(item, six.string_types):
+        return {'value': item, 'label': item}
+    if not isinstance(item, dict):
+        return None
+    if len(item) == 1:
+        inner = next(iter(item.values()))
+        if isinstance(inner, dict):
+            item = inner
+    value = item.get('value') or item.get('id') or item.get('uri')
+    if not value:
+        return None
+    label = item.get('label') or value
+    if isinstance(label, dict):
+        label = label.get('text') or label.get('value') or value
+    return {'value': value, 'label': label}
+
+
+class Registry(object):
+    """
+    The values offered by one source as a frozenset, replaced in a
+    background thread when expired so lookups never wait for the source
+    """
+    def __init__(self, mode, source, query=None):
+        self.key = (mode, source, query)
+        self.values = None
+        self.expires = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Return the frozenset of values, or None if the source hasn't
+        been fetched yet. Starts a refresh when expired, never waits
+        for it.
+        """
+        if time.time() >= self.expires:
+            self.refresh()
+        return self.values
+
+    def refresh(self, wait=False):
+        """
+        Fetch the values in a background thread unless a fetch is
+        already running. With wait=True return once it finishes.
+        """
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                thread = self._thread = threading.Thread(
+                    target=self._refresh, name='scheming-registry')
+                thread.daemon = True
+                thread.start()
+        if wait:
+            thread.join()
+
+    def _refresh(self):
+        try:
+            content_hash, choices, body, expires = get_choices(*self.key)
+        except ChoicesUnavailable:
+            self.expires = time.time() + RETRY_INTERVAL
+            return
+        self.values = frozenset(c['value'] for c in choices)
+        self.expires = expires
+
+
+def registry(mode, source, query=None):
+    """
+    Return the shared Registry for a source, fetched in the background
+    on first use or by the warmup
+    """
+    key = (mode, source, query)
+    try:
+        return _registries[key]
+    except KeyError:
+        pass
+    with _fetch_locks_lock:
+        reg = _registries.get(key)
+        if reg is None:
+            reg = _registries[key] = Registry(mode, source, query)
+    return reg
+
+
+def reset():
+    """
+    Forget the cached choices, e.g. after config changes. Registries
+    keep their values until they are next refreshed.
+    """
+    _cache.clear()
+
+
+def _get_cache():
+    try:
+        return _cache['cache']
+    except KeyError:
+        pass
+    cache = _cache['cache'] = LRUCache(
+        asint(config.get('scheming.remote_choices.size', 100)),
+        asint(config.get('scheming.remote_choices.ttl', 3600)))
+    return cache
@@ -0,0 +1,62 @@
+import datetime
+
+import pytest
+from ckanapi import LocalCKAN, ValidationError
+
+from ckanext.scheming.batch import normalize
+
+
+class TestNormalize(object):
+    def test_dates_and_missing(self):
+        from ckantoolkit import missing
+
+        assert normalize({
+            "a": datetime.datetime(2014, 1, 1, 12, 35),
+            "b": missing,
+            "c": [{"d": datetime.date(2014, 1, 1)}],
+        }) == {"a": "2014-01-01T12:35:00", "c": [{"d": "2014-01-01"}]}
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestValidateMany(object):
+    def test_per_record_results(self):
+        lc = LocalCKAN()
+        results = lc.action.scheming_dataset_validate_many(datasets=[
+            {"type": "test-schema", "name": "fred_many1",
+             "category": "bactrian",
+             "a_relevant_datetime": "2014-01-01T12:35:00"},
+            {"type": "test-schema", "name": "fred_many2",
+             "category": "rocker"},
+            {"type": "not-a-schema", "name": "fred_many3"},
+        ])
+        assert [r["valid"] for r in results] == [True, False, False]
+        assert results[0]["data"]["category"] == "bactrian"
+        assert results[0]["data"]["a_relevant_datetime"] == (
+            "2014-01-01T12:35:00")
+        assert "category" in results[1]["errors"]
+        assert "type" in results[2]["errors"]
+
+    def test_nothing_stored(self):
+        lc = LocalCKAN()
+        lc.action.scheming_dataset_validate_many(datasets=[
+            {"type": "test-schema", "name": "fred_many4"}])
+        assert lc.action.package_list() == []
+
+    def test_update(self):
+        lc = LocalCKAN()
+        lc.action.package_create(type="test-schema", name="fred_many5")
+        results = lc.action.scheming_dataset_validate_many(
+            action="update",
+            datasets=[
+                {"name": "fred_many5", "category": "hybrid"},
+                {"name": "fred_many6"},
+            ])
+        assert results[0]["valid"]
+        assert results[0]["data"]["category"] == "hybrid"
+        assert "id" in results[1]["errors"]
+
+    def test_invalid_action(self):
+        lc = LocalCKAN()
+        with pytest.raises(ValidationError):
+            lc.action.scheming_dataset_validate_many(
+                datasets=[], action="delete")
@@ -0,0 +1,95 @@
+import pytest
+import six
+from mock import patch
+
+from ckanapi import LocalCKAN
+
+from ckanext.scheming.cli import (
+    package_ids, reindex_packages, validate_records)
+
+
+class RecordingIndexer(object):
+    indexed = []
+    commits = []
+
+    def __init__(self):
+        del RecordingIndexer.indexed[:]
+        del RecordingIndexer.commits[:]
+
+    def index(self, pkg_dict):
+        self.indexed.append(pkg_dict['name'])
+
+    def commit(self):
+        self.commits.append(len(self.indexed))
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestReindex(object):
+    def test_reindex_in_batches(self):
+        lc = LocalCKAN()
+        for i in range(5):
+            lc.action.package_create(
+                type="test-schema", name="reindex_{0}".format(i))
+        progress = []
+
+        indexed, errors, elapsed = reindex_packages(
+            package_ids(["test-schema"]),
+            indexer_factory=RecordingIndexer,
+            batch_size=2,
+            progress=lambda done, total, t: progress.append((done, total)))
+
+        assert indexed == 5
+        assert errors == []
+        assert sorted(RecordingIndexer.indexed) == [
+            "reindex_{0}".format(i) for i in range(5)]
+        assert RecordingIndexer.commits == [2, 4, 5]
+        assert progress == [(2, 5), (4, 5), (5, 5)]
+
+    def test_reindex_with_workers(self):
+        lc = LocalCKAN()
+        for i in range(5):
+            lc.action.package_create(
+                type="test-schema", name="reindex_workers_{0}".format(i))
+        progress = []
+
+        indexed, errors, elapsed = reindex_packages(
+            package_ids(["test-schema"]),
+            indexer_factory=RecordingIndexer,
+            workers=2,
+            batch_size=2,
+            progress=lambda done, total, t: progress.append((done, total)))
+
+        assert indexed == 5
+        assert errors == []
+        assert len(progress) == 3
+        assert progress[-1] == (5, 5)
+
+    def test_reports_errors(self):
+        indexed, errors, elapsed = reindex_packages(
+            ["not-a-dataset"], indexer_factory=RecordingIndexer)
+        assert indexed == 0
+        assert [pkg_id for pkg_id, e in errors] == ["not-a-dataset"]
+
+
+class TestValidateRecords(object):
+    @patch("ckanext.scheming.batch.validate_datasets")
+    @patch("ckanext.scheming.batch.worker_pool")
+    def test_one_pool_for_all_chunks(self, worker_pool, validate_datasets):
+        validate_datasets.side_effect = lambda datasets, **kw: [
+            {"valid": d["name"] != "b", "errors": {"name": ["bad"]}}
+            for d in datasets]
+        records = [(i + 1, {"name": n}) for i, n in enumerate("abcde")]
+        errors = six.StringIO()
+
+        rows, invalid, elapsed = validate_records(
+            records, "test-schema", 2, 4, errors)
+
+        assert (rows, invalid) == (5, 1)
+        worker_pool.assert_called_once_with(4)
+        assert validate_datasets.call_count == 3
+        for args, kwargs in validate_datasets.call_args_list:
+            assert kwargs["pool"] is worker_pool.return_value
+            assert [d["type"] for d in args[0]] == ["test-schema"] * len(
+                args[0])
+        worker_pool.return_value.close.assert_called_once_with()
+        assert '"line": 2' in errors.getvalue()
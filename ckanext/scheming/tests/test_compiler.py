@@ -0,0 +1,126 @@
+import pickle
+
+from mock import Mock, patch
+
+from ckanext.scheming import compiler
+from ckanext.scheming.plugins import SchemingDatasetsPlugin
+
+CONFIG = {
+    "scheming.dataset_schemas": "ckanext.scheming.tests:test_schema.json",
+    "scheming.presets": "ckanext.scheming:presets.json",
+}
+
+
+class TestMissingPresets(object):
+    def test_every_missing_preset_reported(self):
+        schemas = {"t": {"dataset_fields": [
+            {"field_name": "a", "preset": "nope"},
+            {"field_name": "b", "repeating_subfields": [
+                {"field_name": "c", "preset": "also_nope"}]},
+            {"field_name": "d", "preset": "title"},
+        ]}}
+        assert compiler.missing_presets(schemas, {"title": {}}) == [
+            "t a: preset 'nope' not defined",
+            "t b.c: preset 'also_nope' not defined",
+        ]
+
+
+class TestLint(object):
+    def test_errors_reported_together(self, tmpdir):
+        tmpdir.join("scheming", "form_snippets").ensure("text.html")
+        schemas = {"t": {"dataset_fields": [
+            {"field_name": "a",
+             "validators": "ignore_missing not_a_real_validator",
+             "form_snippet_path": "scheming/form_snippets/text.html"},
+            {"field_name": "b", "choices": [{"value": "x"}, {"value": "x"}],
+             "form_snippet_path": "scheming/form_snippets/missing.html"},
+        ]}}
+
+        errors = compiler.lint(schemas, [str(tmpdir)])
+
+        assert len(errors) == 3
+        assert "not_a_real_validator" in errors[0]
+        assert errors[1] == (
+            "t b: template 'scheming/form_snippets/missing.html' not found")
+        assert errors[2] == "t b: choice 'x' repeated"
+
+    def test_validators_not_built(self):
+        schemas = {"t": {"dataset_fields": [
+            {"field_name": "a",
+             "validators": "scheming_required if_empty_same_as(name)"},
+        ]}}
+        validator = Mock(is_a_scheming_validator=True)
+        with patch(
+                "ckanext.scheming.validation.get_validator_or_converter",
+                return_value=validator) as lookup:
+            assert compiler.lint(schemas) == []
+        assert [c[0][0] for c in lookup.call_args_list] == [
+            "scheming_required", "if_empty_same_as"]
+        assert not validator.called
+
+
+class TestArtifact(object):
+    def _build(self, tmpdir):
+        artifact, errors = compiler.build(CONFIG, [SchemingDatasetsPlugin])
+        assert errors == []
+        path = str(tmpdir.join("scheming.compiled"))
+        compiler.save(path, artifact)
+        compiler.reset()
+        return path, artifact
+
+    def test_round_trip(self, tmpdir):
+        path, artifact = self._build(tmpdir)
+        config = dict(CONFIG, **{"scheming.compiled": path})
+
+        schemas, expanded = compiler.compiled_schemas(
+            config, SchemingDatasetsPlugin)
+
+        assert expanded == artifact["plugins"][
+            "scheming.dataset_schemas"]["expanded"]
+        assert "test-schema" in expanded
+        assert expanded["test-schema"]["dataset_fields"][0][
+            "form_snippet_path"]
+
+    def test_stale_source_ignored(self, tmpdir):
+        path, artifact = self._build(tmpdir)
+        artifact["sources"]["ckanext.scheming:presets.json"] = "0" * 40
+        with open(path, "wb") as f:
+            pickle.dump(artifact, f)
+        config = dict(CONFIG, **{"scheming.compiled": path})
+
+        assert compiler.load(config) is None
+
+    def test_changed_option_ignored(self, tmpdir):
+        path, artifact = self._build(tmpdir)
+        config = dict(CONFIG, **{
+            "scheming.compiled": path,
+            "scheming.dataset_schemas": "ckanext.scheming:camel_photos.yaml",
+        })
+
+        assert compiler.load(config) is None
+
+    def test_file_url_source_hashed(self, tmpdir):
+        schema = tmpdir.join("schema.json")
+        schema.write("{}")
+        url = "file://" + str(schema)
+        hashes = compiler.source_hashes([url])
+        assert hashes[url]
+        schema.write('{"changed": true}')
+        assert compiler.source_hashes([url])[url] != hashes[url]
+
+    @patch("ckanext.scheming.compiler.source_hashes")
+    def test_unhashable_source_not_compiled(self, source_hashes):
+        source_hashes.side_effect = lambda urls: dict(
+            (url, None if url == "ckanext.scheming:presets.json" else "0")
+            for url in urls)
+        artifact, errors = compiler.build(CONFIG, [SchemingDatasetsPlugin])
+        assert artifact is None
+        assert errors[0].startswith("ckanext.scheming:presets.json: ")
+
+    def test_unloadable_artifact_ignored(self, tmpdir):
+        path = tmpdir.join("scheming.compiled")
+        # refers to a module that doesn't exist, raises ImportError
+        path.write_binary(b"cnot_a_real_module\nThing\n.")
+        config = dict(CONFIG, **{"scheming.compiled": str(path)})
+
+        assert compiler.load(config) is None
@@ -0,0 +1,49 @@
+import json
+
+from ckantoolkit import missing
+
+from ckanext.scheming import composite
+
+ENTRIES = [
+    {"name": "Larry", "role": "author"},
+    {"name": "Moe", "role": "editor"},
+]
+
+
+class TestComposite(object):
+    def test_compact_json(self):
+        assert composite.encode(ENTRIES) == (
+            '[{"name":"Larry","role":"author"},'
+            '{"name":"Moe","role":"editor"}]')
+
+    def test_compact_keys(self):
+        text = composite.encode(ENTRIES, compact_keys=True)
+        assert json.loads(text) == {
+            "k": ["name", "role"],
+            "r": [["Larry", "author"], ["Moe", "editor"]]}
+        assert composite.decode(text) == ENTRIES
+
+    def test_compact_keys_mixed_entries(self):
+        entries = [
+            {"name": "Larry", "role": "author"},
+            {"role": "editor", "name": "Moe"},
+            {"name": "Curly"},
+        ]
+        decoded = composite.decode(
+            composite.encode(entries, compact_keys=True))
+        assert decoded == entries
+        assert [list(e) for e in decoded] == [list(e) for e in entries]
+
+    def test_missing_is_null(self):
+        for compact_keys in (False, True):
+            text = composite.encode(
+                [{"name": "Larry", "role": missing}], compact_keys)
+            assert composite.decode(text) == [
+                {"name": "Larry", "role": None}]
+
+    def test_decode_json_dumps(self):
+        assert composite.decode(json.dumps(ENTRIES)) == ENTRIES
+
+    def test_empty(self):
+        for compact_keys in (False, True):
+            assert composite.decode(composite.encode([], compact_keys)) == []
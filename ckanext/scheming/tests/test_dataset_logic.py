@@ -1,7 +1,10 @@
 import pytest
+from mock import patch
 
 from ckanapi import LocalCKAN, NotFound
 
+from ckanext.scheming.plugins import SchemingDatasetsPlugin
+
 
 class TestDatasetSchemaLists(object):
     def test_dataset_schema_list(self):
@@ -18,3 +21,126 @@ class TestDatasetSchemaLists(object):
         lc = LocalCKAN("visitor")
         with pytest.raises(NotFound):
             lc.action.scheming_dataset_schema_show(type="ernie")
+
+
+class TestDatasetSchemaEndpoint(object):
+    def test_schema_endpoint(self, app):
+        response = app.get("/api/scheming/dataset/test-schema")
+        assert response.headers["ETag"]
+        assert "Humps" in response.body
+
+    def test_schema_endpoint_not_modified(self, app):
+        etag = app.get("/api/scheming/dataset/test-schema").headers["ETag"]
+        response = app.get(
+            "/api/scheming/dataset/test-schema",
+            headers={"If-None-Match": etag},
+            status=304,
+        )
+        assert response.headers["ETag"] == etag
+
+    def test_schema_endpoint_expanded_hash_differs(self, app):
+        expanded = app.get("/api/scheming/dataset/test-schema")
+        plain = app.get("/api/scheming/dataset/test-schema?expanded=false")
+        assert expanded.headers["ETag"] != plain.headers["ETag"]
+
+    def test_schema_endpoint_not_found(self, app):
+        app.get("/api/scheming/dataset/ernie", status=404)
+
+
+class TestSchemaBundle(object):
+    def test_bundle_contains_all_schemas(self):
+        lc = LocalCKAN("visitor")
+        bundle = lc.action.scheming_schema_bundle()
+        assert "test-schema" in bundle["dataset"]
+        assert "organization" in bundle["organization"]
+        assert "group" in bundle["group"]
+        assert "date" in bundle["presets"]["presets"]
+        schema = bundle["dataset"]["test-schema"]
+        assert schema["schema"]["dataset_fields"][2]["label"] == "Humps"
+        assert schema["hash"]
+        assert bundle["hash"]
+
+    def test_bundle_hash_matches_schema_endpoint(self, app):
+        lc = LocalCKAN("visitor")
+        bundle = lc.action.scheming_schema_bundle(expanded=False)
+        response = app.get("/api/scheming/dataset/test-schema?expanded=false")
+        assert response.headers["ETag"] == '"{0}"'.format(
+            bundle["dataset"]["test-schema"]["hash"])
+
+    def test_bundle_endpoint_not_modified(self, app):
+        etag = app.get("/api/scheming/bundle").headers["ETag"]
+        app.get(
+            "/api/scheming/bundle",
+            headers={"If-None-Match": etag},
+            status=304,
+        )
+
+
+class TestProjectionFields(object):
+    def test_string_and_list(self):
+        from ckanext.scheming.logic import projection_fields
+        assert projection_fields("humps, a_json_field") == frozenset(
+            ["humps", "a_json_field", "id", "name", "type"])
+        assert projection_fields(["humps"]) == frozenset(
+            ["humps", "id", "name", "type"])
+        assert projection_fields("") is None
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestPackageShowFields(object):
+    def test_only_requested_fields(self):
+        lc = LocalCKAN()
+        lc.action.package_create(
+            type="test-schema", name="fields_1", humps=3,
+            a_json_field={"a": 1}, personality=["friendly"])
+
+        pkg = lc.action.package_show(
+            id="fields_1", fields=["a_json_field"])
+
+        assert pkg["a_json_field"] == {"a": 1}
+        assert set(pkg) == {"id", "name", "type", "a_json_field"}
+
+    def test_without_fields_unchanged(self):
+        lc = LocalCKAN()
+        lc.action.package_create(type="test-schema", name="fields_2", humps=3)
+        pkg = lc.action.package_show(id="fields_2")
+        assert pkg["humps"] == 3
+        assert "resources" in pkg
+
+    def test_fields_not_left_in_context(self):
+        from ckantoolkit import get_action
+
+        LocalCKAN().action.package_create(
+            type="test-schema", name="fields_3", humps=3)
+        context = {"ignore_auth": True}
+        get_action("package_show")(
+            context, {"id": "fields_3", "fields": "humps"})
+        assert "scheming_fields" not in context
+        assert get_action("package_show")(context, {"id": "fields_3"})[
+            "humps"] == 3
+
+    def test_nested_package_show_returns_all_fields(self):
+        from ckantoolkit import get_action
+
+        lc = LocalCKAN()
+        lc.action.package_create(type="test-schema", name="fields_4", humps=4)
+        lc.action.package_create(type="test-schema", name="fields_5", humps=5)
+        plugin = SchemingDatasetsPlugin.instance
+        validate = plugin.validate
+        nested = []
+
+        def validate_then_show(context, data_dict, schema, action):
+            # as another plugin's after_show would, with the same context
+            result = validate(context, data_dict, schema, action)
+            if data_dict.get("name") == "fields_4" and not nested:
+                nested.append(get_action("package_show")(
+                    context, {"id": "fields_5"}))
+            return result
+
+        with patch.object(plugin, "validate", validate_then_show):
+            pkg = get_action("package_show")(
+                {"ignore_auth": True}, {"id": "fields_4", "fields": "humps"})
+
+        assert set(pkg) == {"id", "name", "type", "humps"}
+        assert nested[0]["humps"] == 5
+        assert "resources" in nested[0]
@@ -0,0 +1,77 @@
+import csv
+import json
+
+import pytest
+from ckanapi import LocalCKAN
+
+from ckanext.scheming.export import ExportPlan, csv_lines, export_lines
+
+SCHEMA = {
+    "dataset_type": "export-test",
+    "dataset_fields": [
+        {"field_name": "name"},
+        {"field_name": "personality",
+         "validators": "scheming_multiple_choice"},
+        {"field_name": "metrics",
+         "validators": "scheming_valid_json_object"},
+    ],
+    "resource_fields": [
+        {"field_name": "url"},
+    ],
+}
+
+
+class TestExportPlan(object):
+    def test_decodes_json_fields(self):
+        plan = ExportPlan(SCHEMA)
+        record = plan.record({
+            "name": "larry",
+            "personality": ["friendly"],
+            "metrics": '{"http://example.com/m/1": {"label": "A"}}',
+            "notes": "not in the schema",
+            "resources": [{"url": "http://example.com", "id": "r1"}],
+        })
+        assert record == {
+            "name": "larry",
+            "personality": ["friendly"],
+            "metrics": {"http://example.com/m/1": {"label": "A"}},
+            "resources": [{"url": "http://example.com"}],
+        }
+
+    def test_columns(self):
+        assert ExportPlan(SCHEMA).columns == [
+            "name", "personality", "metrics", "resources"]
+
+    def test_csv_lines(self):
+        lines = list(csv_lines(
+            iter([{"name": "larry", "personality": ["friendly", "shy"]}]),
+            ["name", "personality", "metrics"]))
+        assert len(lines) == 2
+        rows = list(csv.reader(lines))
+        assert rows == [
+            ["name", "personality", "metrics"],
+            ["larry", '["friendly","shy"]', ""],
+        ]
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestExportLines(object):
+    def test_jsonl_in_batches(self):
+        from ckanext.scheming.helpers import scheming_get_dataset_schema
+
+        lc = LocalCKAN()
+        for i in range(3):
+            lc.action.package_create(
+                type="test-schema", name="export_{0}".format(i),
+                a_json_field={"n": i})
+
+        lines = list(export_lines(
+            scheming_get_dataset_schema("test-schema"), "jsonl",
+            batch_size=2))
+
+        records = sorted((json.loads(line) for line in lines),
+                         key=lambda r: r["name"])
+        assert [r["name"] for r in records] == [
+            "export_0", "export_1", "export_2"]
+        assert [r["a_json_field"] for r in records] == [
+            {"n": 0}, {"n": 1}, {"n": 2}]
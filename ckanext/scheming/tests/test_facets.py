@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+from mock import patch
+
+from ckanext.scheming.plugins import SchemingDatasetsPlugin
+
+
+def _dataset_facets(package_type, lang="en"):
+    facets = OrderedDict([("organization", "Organizations"), ("tags", "Tags")])
+    with patch(
+        "ckanext.scheming.helpers._request_locales",
+        return_value=(lang, "en"),
+    ):
+        return SchemingDatasetsPlugin.instance.dataset_facets(
+            facets, package_type)
+
+
+class TestDatasetFacets(object):
+    def test_schema_facet_added(self):
+        facets = _dataset_facets("test-schema")
+        assert list(facets.items()) == [
+            ("organization", "Organizations"),
+            ("tags", "Tags"),
+            ("category", "Camel category"),
+        ]
+
+    def test_facet_label_language(self):
+        assert _dataset_facets("test-schema", "fr")["category"] == (
+            u"Cat\xe9gorie")
+
+    def test_labels_built_once(self):
+        _dataset_facets("test-schema")
+        cache = SchemingDatasetsPlugin.instance._facets_cache
+        assert cache[("test-schema", "en")] == (
+            ("category", "Camel category"),)
+
+    def test_returned_facets_may_be_modified(self):
+        facets = _dataset_facets("test-schema")
+        facets["category"] = "Changed by another plugin"
+        del facets["tags"]
+        assert _dataset_facets("test-schema") == OrderedDict([
+            ("organization", "Organizations"),
+            ("tags", "Tags"),
+            ("category", "Camel category"),
+        ])
+
+    def test_type_without_facets_unchanged(self):
+        assert list(_dataset_facets("test-subfields")) == [
+            "organization", "tags"]
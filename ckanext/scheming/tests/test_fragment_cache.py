@@ -0,0 +1,81 @@
+import time
+
+from mock import patch
+
+from ckanext.scheming import fragment_cache
+from ckanext.scheming.fragment_cache import LRUCache, RedisCache
+from ckanext.scheming.helpers import (
+    scheming_fragment_cache_get,
+    scheming_fragment_cache_set,
+)
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+class TestLRUCache(object):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        assert cache.get("a") == "1"
+        cache.set("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.get("c") == "3"
+
+
+class TestRedisCache(object):
+    def test_round_trip(self):
+        cache = RedisCache(FakeRedis(), ttl=10)
+        cache.set("a", u"\xa1Hola!")
+        assert cache.get("a") == u"\xa1Hola!"
+        assert cache.get("b") is None
+
+
+class TestFragmentHelpers(object):
+    pkg_dict = {"id": "abc", "metadata_modified": "2021-01-01T00:00:00"}
+
+    def teardown_method(self, method):
+        fragment_cache.reset()
+
+    def test_disabled_by_default(self):
+        fragment_cache.reset()
+        assert scheming_fragment_cache_set(
+            "info", self.pkg_dict, "test-schema", u"<tr></tr>") == u"<tr></tr>"
+        assert scheming_fragment_cache_get(
+            "info", self.pkg_dict, "test-schema") is None
+
+    def test_cached_per_modified_and_locale(self):
+        fragment_cache._store["store"] = LRUCache()
+        with patch("ckanext.scheming.helpers._request_locales",
+                   return_value=("en", "en")):
+            scheming_fragment_cache_set(
+                "info", self.pkg_dict, "test-schema", u"<tr></tr>")
+            assert scheming_fragment_cache_get(
+                "info", self.pkg_dict, "test-schema") == u"<tr></tr>"
+            assert scheming_fragment_cache_get(
+                "info", dict(self.pkg_dict, metadata_modified="2022"),
+                "test-schema") is None
+        with patch("ckanext.scheming.helpers._request_locales",
+                   return_value=("fr", "en")):
+            assert scheming_fragment_cache_get(
+                "info", self.pkg_dict, "test-schema") is None
+
+
+class TestLRUCacheTTL(object):
+    def test_expires(self):
+        cache = LRUCache(2, ttl=60)
+        cache.set("a", "1")
+        assert cache.get("a") == "1"
+        with patch("ckanext.scheming.fragment_cache.time.time",
+                   return_value=time.time() + 61):
+            assert cache.get("a") is None
@@ -0,0 +1,75 @@
+import copy
+import pickle
+
+import pytest
+
+from ckanext.scheming.frozen import (
+    FrozenDict, FrozenList, SchemaSnapshot, freeze, thaw)
+from ckanext.scheming.helpers import LanguageText
+from ckanext.scheming.plugins import _SchemingMixin, _expand_schemas
+
+
+class TestFreeze(object):
+    def test_nested(self):
+        frozen = freeze({"fields": [{"field_name": "title"}]})
+        assert isinstance(frozen, FrozenDict)
+        assert isinstance(frozen["fields"], FrozenList)
+        assert isinstance(frozen["fields"][0], FrozenDict)
+        assert frozen == {"fields": [{"field_name": "title"}]}
+
+    def test_read_only(self):
+        frozen = freeze({"fields": [{"field_name": "title"}]})
+        with pytest.raises(TypeError):
+            frozen["label"] = "x"
+        with pytest.raises(TypeError):
+            frozen.update(label="x")
+        with pytest.raises(TypeError):
+            frozen["fields"].append({})
+        with pytest.raises(TypeError):
+            frozen["fields"][0]["field_name"] = "name"
+
+    def test_copies_modifiable(self):
+        frozen = freeze({"fields": [{"field_name": "title"}]})
+        copied = dict(frozen)
+        copied["label"] = "x"
+        thawed = thaw(frozen)
+        thawed["fields"][0]["field_name"] = "name"
+        assert frozen["fields"][0]["field_name"] == "title"
+        assert copy.deepcopy(frozen) is frozen
+
+    def test_pickle(self):
+        frozen = freeze({"fields": [{"field_name": "title"}]})
+        loaded = pickle.loads(pickle.dumps(frozen))
+        assert loaded == frozen
+        assert isinstance(loaded["fields"], FrozenList)
+
+    def test_language_text(self):
+        text = LanguageText({"en": "Title", "fr": "Titre"}, "fr")
+        assert freeze(text) is text
+        with pytest.raises(TypeError):
+            text["de"] = "Titel"
+        loaded = pickle.loads(pickle.dumps(text))
+        assert loaded.resolve("de") == "Titre"
+
+
+class TestSchemaSnapshot(object):
+    def test_versions_increase(self):
+        first = SchemaSnapshot({}, {})
+        second = SchemaSnapshot({}, {})
+        assert second.version > first.version
+
+    def test_expand_does_not_modify(self, monkeypatch):
+        monkeypatch.setattr(_SchemingMixin, "_presets", freeze({}))
+        schemas = freeze({"test": {
+            "dataset_type": "test",
+            "dataset_fields": [{
+                "field_name": "contacts",
+                "repeating_subfields": [{"field_name": "name"}],
+            }],
+        }})
+        expanded = _expand_schemas(schemas)
+        subfield = expanded["test"]["dataset_fields"][0][
+            "repeating_subfields"][0]
+        assert subfield["form_snippet_path"] == "scheming/form_snippets/text.html"
+        assert "form_snippet_path" not in schemas["test"]["dataset_fields"][
+            0]["repeating_subfields"][0]
@@ -4,13 +4,21 @@ from mock import patch, Mock
 import datetime
 import six
 
+import pytest
+
 from ckanext.scheming.helpers import (
+    LanguageText,
     scheming_language_text,
     scheming_field_required,
     scheming_get_preset,
     scheming_get_presets,
     scheming_datastore_choices,
     scheming_display_json_value,
+    scheming_get_timezones,
+    get_timezone,
+    date_tz_str_to_datetime,
+    _date_tz_str_to_datetime,
+    iso_str_to_datetime,
 )
 
 from ckanapi import NotFound
@@ -45,6 +53,18 @@ class TestLanguageText(object):
         lang.side_effect = TypeError()
         assert "hello" == scheming_language_text({"en": "hello", "aa": "aaaa"})
 
+    def test_resolved_matching_language(self):
+        text = LanguageText({"en": "hello", "fr": "bonjour"}, "en")
+        assert "bonjour" == scheming_language_text(text, prefer_lang="fr")
+
+    def test_resolved_default_locale(self):
+        text = LanguageText({"aa": "aaaa", "en": "hello"}, "en")
+        assert "hello" == scheming_language_text(text, prefer_lang="zh")
+
+    def test_resolved_first_when_no_default_locale(self):
+        text = LanguageText({"bb": "no", "aa": "hello"}, "en")
+        assert "hello" == scheming_language_text(text, prefer_lang="zh")
+
 
 class TestFieldRequired(object):
     def test_explicit_required_true(self):
@@ -187,6 +207,66 @@ class TestDatastoreChoices(object):
         )
 
 
+class TestTimezones(object):
+    def test_common_timezones_default(self):
+        options = scheming_get_timezones({})
+        assert {"value": "UTC", "text": "UTC"} in options
+        assert options is scheming_get_timezones({"timezones": None})
+
+    def test_timezone_list_drops_unknown(self):
+        options = scheming_get_timezones(
+            {"timezones": ["Europe/Berlin", "Not/AZone", "UTC"]}
+        )
+        assert options == (
+            {"value": "Europe/Berlin", "text": "Europe/Berlin"},
+            {"value": "UTC", "text": "UTC"},
+        )
+
+    def test_get_timezone_memoized(self):
+        assert get_timezone("Europe/Berlin") is get_timezone("Europe/Berlin")
+        assert get_timezone("Europe/Berlin").zone == "Europe/Berlin"
+
+
+class TestDateTimeParsing(object):
+    tz_values = [
+        "2014-01-01T12:35:00",
+        "2014-01-01T12:35:00.123456",
+        "2014-01-01T12:35:00Z",
+        "2014-01-01T12:35:00.000001Z",
+        "2014-01-01T12:35:00+00:00",
+        "2014-01-01T12:35:00-05:00",
+        "2014-01-01T12:35:00.500+02:30",
+        "2014-01-01T12:35",
+        "2014-12-31T23:59:59-14:00",
+    ]
+
+    @pytest.mark.parametrize("value", tz_values)
+    def test_fast_path_matches_general_parser(self, value):
+        assert date_tz_str_to_datetime(value) == \
+            _date_tz_str_to_datetime(value)
+
+    def test_offset_converted_to_utc(self):
+        assert date_tz_str_to_datetime(
+            "2014-01-01T12:35:00-05:00"
+        ) == datetime.datetime(2014, 1, 1, 17, 35)
+
+    @pytest.mark.parametrize(
+        "value", ["2014-11-15T12:00:00A", "2014-11-15T12:00:00+abc", "2014"]
+    )
+    def test_invalid_raises(self, value):
+        with pytest.raises(ValueError):
+            date_tz_str_to_datetime(value)
+
+    @pytest.mark.parametrize("value,expected", [
+        ("2014-01-01", datetime.datetime(2014, 1, 1)),
+        ("2014-01-01 12:35", datetime.datetime(2014, 1, 1, 12, 35)),
+        ("2014-01-01T12:35:00.000001",
+            datetime.datetime(2014, 1, 1, 12, 35, 0, 1)),
+    ])
+    def test_iso_str_to_datetime(self, value, expected):
+        assert iso_str_to_datetime(value) == expected
+
+
 class TestJSONHelpers(object):
     def test_display_json_value_default(self):
 
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+import six
+from ckanapi import LocalCKAN
+
+from ckanext.scheming.export import csv_lines
+from ckanext.scheming.importer import read_records, chunks, import_records
+
+
+class TestReadRecords(object):
+    def test_jsonl(self):
+        lines = ['{"name": "a"}\n', '\n', '{"name": "b"}\n']
+        assert list(read_records(lines)) == [
+            (1, {"name": "a"}), (3, {"name": "b"})]
+
+    def test_csv_reverses_export(self):
+        record = {"name": "larry", "personality": ["friendly", "shy"],
+                  "a_json_field": {"a": 1}, "notes": "[not json"}
+        lines = list(csv_lines(
+            [record], ["name", "personality", "a_json_field", "notes",
+                       "other"]))
+        assert [r for n, r in read_records(lines, "csv")] == [record]
+
+    def test_chunks(self):
+        assert list(chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestImportRecords(object):
+    def test_import_with_errors(self):
+        errors = six.StringIO()
+        records = [
+            (1, {"name": "import_1", "humps": "3"}),
+            (2, {"name": "import_2", "humps": "many"}),
+            (3, {"name": "import_3"}),
+        ]
+        progress = []
+
+        rows, created, elapsed = import_records(
+            records, "test-schema", chunk_size=2, errors=errors,
+            progress=lambda rows, ok, t: progress.append((rows, ok)))
+
+        assert rows == 3
+        assert len(created) == 2
+        assert progress == [(2, 1), (3, 2)]
+        lc = LocalCKAN()
+        assert lc.action.package_show(id="import_3")["type"] == "test-schema"
+        [error] = [json.loads(line) for line in errors.getvalue().splitlines()]
+        assert error["line"] == 2
+        assert "humps" in error["errors"]
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from ckanext.scheming.errors import SchemingException
+from ckanext.scheming.plugins import (
+    _compile_index_transforms,
+    index_transform,
+)
+
+
+def _schema(*fields):
+    return {"dataset_type": "test", "dataset_fields": list(fields)}
+
+
+class TestIndexTransforms(object):
+    def test_no_transforms_for_plain_fields(self):
+        assert _compile_index_transforms(_schema(
+            {"field_name": "title", "validators": "not_empty unicode"},
+            {"field_name": "contacts", "repeating_subfields": [
+                {"field_name": "name"}]},
+            {"field_name": "personality",
+             "validators": "scheming_multiple_choice"},
+            {"field_name": "keywords",
+             "validators": "ignore_missing scheming_multiple_text"},
+        )) == ()
+
+    def test_encode_composite(self):
+        transforms = _compile_index_transforms(_schema(
+            {"field_name": "contacts", "repeating_subfields": [
+                {"field_name": "name"}]},
+        ), encode_composite=True)
+        data = index_transform(
+            {"contacts": [{"name": "Larry"}]}, transforms)
+        assert data == {"contacts": '[{"name": "Larry"}]'}
+
+    def test_list_and_json_fields(self):
+        transforms = _compile_index_transforms(_schema(
+            {"field_name": "theme", "validators": "scheming_multiple_choice",
+             "index_as": "list"},
+            {"field_name": "spatial",
+             "validators": "scheming_required scheming_valid_json_object"},
+        ))
+        data = index_transform({
+            "theme": json.dumps(["a", "b"]),
+            "spatial": {"type": "Point"},
+        }, transforms)
+        assert data == {"theme": ["a", "b"], "spatial": '{"type": "Point"}'}
+
+    def test_empty_and_missing_values_skipped(self):
+        transforms = _compile_index_transforms(_schema(
+            {"field_name": "theme", "index_as": "list"},
+            {"field_name": "keywords", "index_as": "list"},
+        ))
+        assert index_transform({"theme": ""}, transforms) == {"theme": ""}
+
+    def test_unknown_index_as(self):
+        with pytest.raises(SchemingException):
+            _compile_index_transforms(_schema(
+                {"field_name": "theme", "index_as": "tree"}))
@@ -1,6 +1,6 @@
 import pytest
 
-from ckanext.scheming.plugins import _load_schema
+from ckanext.scheming.plugins import _load_schema, _resolve_snippets
 from ckanext.scheming.errors import SchemingException
 
 
@@ -21,3 +21,38 @@ class TestLoadSchema(object):
             )["dataset_type"]
             == "camel-photos"
         )
+
+
+class TestResolveSnippets(object):
+    def test_defaults(self):
+        field = _resolve_snippets({"field_name": "title"})
+        assert field["display_snippet_path"] == (
+            "scheming/display_snippets/text.html")
+        assert field["form_snippet_path"] == "scheming/form_snippets/text.html"
+
+    def test_choices_helper_is_select_without_calling_helper(self):
+        field = _resolve_snippets({
+            "field_name": "category",
+            "choices_helper": "scheming_datastore_choices",
+        })
+        assert field["display_snippet_path"] == (
+            "scheming/display_snippets/select.html")
+
+    def test_repeating_subfields(self):
+        field = _resolve_snippets({
+            "field_name": "contacts",
+            "repeating_subfields": [{"field_name": "name"}],
+        })
+        assert field["display_snippet_path"] == (
+            "scheming/display_snippets/repeating_subfields.html")
+        assert field["form_snippet_path"] == (
+            "scheming/form_snippets/repeating_subfields.html")
+
+    def test_full_paths_and_hidden_form(self):
+        field = _resolve_snippets({
+            "field_name": "notes",
+            "display_snippet": "myext/notes.html",
+            "form_snippet": None,
+        })
+        assert field["display_snippet_path"] == "myext/notes.html"
+        assert field["form_snippet_path"] is None
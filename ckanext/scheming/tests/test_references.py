@@ -0,0 +1,189 @@
+import pytest
+from ckanapi import LocalCKAN
+from mock import patch
+
+from ckanext.scheming import references
+from ckanext.scheming.plugins import SchemingDatasetsPlugin
+
+
+class TestMemoryGraph(object):
+    def test_forward_and_reverse(self):
+        graph = references.MemoryGraph()
+        graph.set("wf", {"used": ["a", "b"], "generated": ["c"]})
+        graph.set("other", {"used": ["a"]})
+
+        assert graph.references("wf") == {
+            "used": ["a", "b"], "generated": ["c"]}
+        assert graph.referenced_by("a") == [
+            ("other", "used"), ("wf", "used")]
+        assert graph.referenced_by("c") == [("wf", "generated")]
+
+    def test_set_replaces_old_references(self):
+        graph = references.MemoryGraph()
+        graph.set("wf", {"used": ["a", "b"]})
+        graph.set("wf", {"used": ["b"]})
+
+        assert graph.referenced_by("a") == []
+        assert graph.referenced_by("b") == [("wf", "used")]
+        assert "a" not in graph.reverse
+
+    def test_remove(self):
+        graph = references.MemoryGraph()
+        graph.set("wf", {"used": ["a"]})
+        graph.remove("wf")
+
+        assert graph.references("wf") == {}
+        assert graph.referenced_by("a") == []
+
+
+class TestLinks(object):
+    def test_parse_links(self):
+        assert references.parse_links(" a, ,http://x.org/b ") == [
+            "a", "http://x.org/b"]
+        assert references.parse_links(["a", ""]) == ["a"]
+        assert references.parse_links(None) == []
+
+    def test_local_name(self):
+        site = "http://ckan.example.com"
+        assert references.local_name(
+            site + "/dataset/camels/", site) == "camels"
+        assert references.local_name("/dataset/camels", site) == "camels"
+        assert references.local_name("camels", site) == "camels"
+        assert references.local_name(
+            "http://elsewhere.org/dataset/camels", site) is None
+
+
+class TestIndex(object):
+    def test_index_references(self):
+        data_dict = {
+            "type": "test-schema",
+            "related_datasets": "http://a.org/x, http://b.org/y",
+        }
+        references.index_references(data_dict, ("related_datasets",))
+        assert data_dict["vocab_ref_related_datasets"] == [
+            "http://a.org/x", "http://b.org/y"]
+        assert data_dict["related_datasets"] == (
+            "http://a.org/x, http://b.org/y")
+
+    def test_no_references(self):
+        data_dict = {"type": "test-schema", "related_datasets": ""}
+        references.index_references(data_dict, ("related_datasets",))
+        assert "vocab_ref_related_datasets" not in data_dict
+
+    def test_search_filter(self):
+        assert references.search_filter("used", 'a"b') == (
+            'vocab_ref_used:"a\\"b"')
+
+
+class TestGetGraph(object):
+    def teardown_method(self, method):
+        references.reset()
+
+    @patch("ckanext.scheming.references.rebuild")
+    @patch("ckanext.scheming.references.database_state")
+    def test_memory_graph_synced_once_per_interval(
+            self, database_state, rebuild):
+        database_state.return_value = ("2020-01-01", 3)
+        references.reset()
+        graph = references.get_graph()
+        assert references.get_graph() is graph
+        assert database_state.call_count == 1
+        assert rebuild.call_count == 1
+
+        references._graph["next_sync"] = 0
+        references.get_graph()
+        assert database_state.call_count == 2
+        assert rebuild.call_count == 1
+
+
+class TestLineage(object):
+    def setup_method(self, method):
+        graph = references.MemoryGraph()
+        graph.set("wf", {"used": ["a"], "generated": ["b"]})
+        graph.set("a", {"was_derived_from": ["raw"]})
+        references._graph["graph"] = graph
+
+    def teardown_method(self, method):
+        references.reset()
+
+    def test_upstream(self):
+        nodes, edges = references.lineage("wf", "upstream", 5)
+        assert nodes == ["a", "b", "raw"]
+        assert ("a", "was_derived_from", "raw") in edges
+
+    def test_depth(self):
+        nodes, edges = references.lineage("wf", "upstream", 1)
+        assert nodes == ["a", "b"]
+
+    def test_downstream_fields(self):
+        nodes, edges = references.lineage(
+            "raw", "downstream", 5, ["was_derived_from"])
+        assert nodes == ["a"]
+        assert edges == [("a", "was_derived_from", "raw")]
+
+
+def test_reference_fields_compiled():
+    plugin = SchemingDatasetsPlugin.instance
+    assert plugin._reference_fields["test-schema"] == ("related_datasets",)
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestReferenceActions(object):
+    def test_referenced_by_follows_updates(self):
+        references.reset()
+        lc = LocalCKAN()
+        raw = lc.action.package_create(type="test-schema", name="raw_camels")
+        wf = lc.action.package_create(
+            type="test-schema", name="camel_workflow",
+            related_datasets="/dataset/raw_camels,http://example.com/x")
+
+        assert lc.action.scheming_dataset_referenced_by(id="raw_camels") == [
+            {"id": wf["id"], "field": "related_datasets"}]
+        assert lc.action.scheming_dataset_references(id=wf["id"]) == {
+            "related_datasets": [raw["id"], "http://example.com/x"]}
+
+        lc.action.package_patch(id=wf["id"], related_datasets="")
+        assert lc.action.scheming_dataset_referenced_by(id=raw["id"]) == []
+
+    def test_datasets_related_exact(self):
+        from ckanext.scheming.helpers import datasets_related
+
+        lc = LocalCKAN()
+        lc.action.package_create(type="test-schema", name="camels")
+        lc.action.package_create(type="test-schema", name="camels_two")
+        wf = lc.action.package_create(
+            type="test-schema", name="camel_workflow",
+            related_datasets="/dataset/camels_two")
+
+        assert datasets_related(
+            "test-schema", "related_datasets", "camels") == []
+        related = datasets_related(
+            "test-schema", "related_datasets", "camels_two")
+        assert [r["name"] for r in related] == [wf["name"]]
+
+    def test_memory_graph_reads_changes_from_other_processes(self):
+        import ckan.model as model
+
+        references.reset()
+        lc = LocalCKAN()
+        raw = lc.action.package_create(type="test-schema", name="raw_camels")
+        wf = lc.action.package_create(
+            type="test-schema", name="camel_workflow",
+            related_datasets="raw_camels")
+        graph = references.get_graph()
+
+        # as if another process created the workflow
+        graph.remove(wf["id"])
+        modified, active = references._graph["database"]
+        references._graph["database"] = (
+            model.Package.get(wf["id"]).metadata_modified, active - 1)
+        references._graph["next_sync"] = 0
+
+        assert lc.action.scheming_dataset_referenced_by(id=raw["id"]) == [
+            {"id": wf["id"], "field": "related_datasets"}]
+
+        # and deleted it
+        model.Package.get(wf["id"]).state = u"deleted"
+        model.repo.commit()
+        references._graph["next_sync"] = 0
+        assert lc.action.scheming_dataset_referenced_by(id=raw["id"]) == []
@@ -0,0 +1,136 @@
+import json
+import os
+import sys
+
+import pytest
+
+from ckanext.scheming.plugins import (
+    _SchemingMixin, _load_schemas, _expand_schemas)
+from ckanext.scheming.reloader import SchemaReloader, schema_presets
+
+PRESETS = {
+    "scheming_presets_version": 1,
+    "presets": [
+        {"preset_name": "title", "values": {"label": "Title"}},
+        {"preset_name": "notes", "values": {"label": "Notes"}},
+    ],
+}
+
+
+def _schema(dataset_type, preset, label="Field"):
+    return {
+        "scheming_version": 2,
+        "dataset_type": dataset_type,
+        "dataset_fields": [
+            {"field_name": "title", "preset": preset},
+            {"field_name": "extra", "label": label},
+        ],
+        "resource_fields": [],
+    }
+
+
+class FakePlugin(object):
+    SCHEMA_TYPE_FIELD = "dataset_type"
+
+    def __init__(self, urls):
+        self._schema_urls = urls
+        self._schemas = _load_schemas(urls, "dataset_type")
+        self._expanded_schemas = _expand_schemas(self._schemas)
+        self.compiled = 0
+
+    def _set_schemas(self, schemas, expanded_schemas):
+        self._schemas = schemas
+        self._expanded_schemas = expanded_schemas
+        self.compiled += 1
+
+
+def _write(path, value, bump=0):
+    path.write_text(json.dumps(value))
+    if bump:
+        st = os.stat(str(path))
+        os.utime(str(path), (st.st_atime + bump, st.st_mtime + bump))
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    pkg = tmp_path / "reload_schemas"
+    pkg.mkdir()
+    (pkg / "__init__.py").write_text("")
+    _write(pkg / "presets.json", PRESETS)
+    _write(pkg / "one.json", _schema("one", "title"))
+    _write(pkg / "two.json", _schema("two", "notes"))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "reload_schemas", raising=False)
+    monkeypatch.setattr(_SchemingMixin, "_presets", {
+        p["preset_name"]: p["values"] for p in PRESETS["presets"]})
+    return pkg
+
+
+@pytest.fixture
+def reloader(files):
+    plugin = FakePlugin(
+        ["reload_schemas:one.json", "reload_schemas:two.json"])
+    reloader = SchemaReloader(interval=0)
+    reloader.watch_presets(["reload_schemas:presets.json"])
+    reloader.watch(plugin)
+    return reloader, plugin
+
+
+class TestSchemaReloader(object):
+    def test_unchanged(self, reloader):
+        reloader, plugin = reloader
+        assert reloader.check() == []
+        assert plugin.compiled == 0
+
+    def test_changed_schema_only(self, files, reloader):
+        reloader, plugin = reloader
+        two = plugin._expanded_schemas["two"]
+        _write(files / "one.json", _schema("one", "title", "New"), bump=10)
+
+        assert reloader.check() == ["one"]
+        assert plugin.compiled == 1
+        assert plugin._expanded_schemas["one"]["dataset_fields"][1][
+            "label"] == "New"
+        assert plugin._expanded_schemas["two"] is two
+        assert reloader.last_reload["types"] == ["one"]
+        assert reloader.last_reload["seconds"] >= 0
+
+    def test_changed_preset_reloads_dependents(self, files, reloader):
+        reloader, plugin = reloader
+        one = plugin._expanded_schemas["one"]
+        presets = dict(PRESETS, presets=[
+            PRESETS["presets"][0],
+            {"preset_name": "notes", "values": {"label": "Description"}},
+        ])
+        _write(files / "presets.json", presets, bump=10)
+
+        assert reloader.check() == ["two"]
+        assert plugin._expanded_schemas["one"] is one
+        assert plugin._expanded_schemas["two"]["dataset_fields"][0][
+            "label"] == "Description"
+
+    def test_invalid_file_keeps_schema(self, files, reloader):
+        reloader, plugin = reloader
+        one = plugin._expanded_schemas["one"]
+        (files / "one.json").write_text("{")
+        st = os.stat(str(files / "one.json"))
+        os.utime(str(files / "one.json"), (st.st_atime, st.st_mtime + 10))
+
+        assert reloader.check() == []
+        assert plugin._expanded_schemas["one"] is one
+
+    def test_interval(self, files, reloader):
+        reloader, plugin = reloader
+        reloader.interval = 3600
+        assert reloader.check() == []
+        _write(files / "one.json", _schema("one", "title", "New"), bump=10)
+        assert reloader.check() == []
+
+
+def test_schema_presets():
+    schema = _schema("one", "title")
+    schema["dataset_fields"].append({
+        "field_name": "contacts",
+        "repeating_subfields": [{"field_name": "date", "preset": "date"}],
+    })
+    assert schema_presets(schema) == {"title", "date"}
@@ -0,0 +1,249 @@
+import json
+import threading
+import time
+
+import pytest
+from six.moves import BaseHTTPServer
+
+from ckanext.scheming import remote_choices
+
+SPARQL_RESULTS = {
+    "head": {"vars": ["subject", "label"]},
+    "results": {"bindings": [
+        {"subject": {"type": "uri", "value": "http://example.com/m/1"},
+         "label": {"type": "literal", "value": "Accuracy"}},
+        {"subject": {"type": "uri", "value": "http://example.com/m/2"},
+         "label": {"type": "literal", "value": "Precision"}},
+        {"subject": {"type": "uri", "value": "http://example.com/m/1"},
+         "label": {"type": "literal", "value": "Accuracy"}},
+    ]},
+}
+
+REGISTER = {
+    "register": {"containeditems": [
+        {"theme": {"id": "http://example.com/theme/ad",
+                   "label": {"text": "Addresses", "lang": "en"}}},
+        {"theme": {"id": "http://example.com/theme/hy",
+                   "label": {"text": "Hydrography", "lang": "en"}}},
+    ]},
+}
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self._reply(REGISTER)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self._reply(SPARQL_RESULTS)
+
+    def _reply(self, data):
+        self.requests.append((self.command, self.path))
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    del _Handler.requests[:]
+    remote_choices.reset()
+    remote_choices._registries.clear()
+    yield 'http://127.0.0.1:%d' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+    remote_choices.reset()
+    remote_choices._registries.clear()
+
+
+class TestNormalizeChoices(object):
+    def test_sparql_results(self):
+        assert remote_choices.normalize_choices(SPARQL_RESULTS) == [
+            {"value": "http://example.com/m/1", "label": "Accuracy"},
+            {"value": "http://example.com/m/2", "label": "Precision"},
+        ]
+
+    def test_register(self):
+        assert remote_choices.normalize_choices(REGISTER) == [
+            {"value": "http://example.com/theme/ad", "label": "Addresses"},
+            {"value": "http://example.com/theme/hy", "label": "Hydrography"},
+        ]
+
+    def test_list(self):
+        assert remote_choices.normalize_choices(
+            ["a", {"value": "b", "label": "B"}, {"label": "no value"}]
+        ) == [
+            {"value": "a", "label": "a"},
+            {"value": "b", "label": "B"},
+        ]
+
+
+class TestFieldSource(object):
+    def test_select_from_json(self):
+        assert remote_choices.field_source({
+            "field_name": "metrics",
+            "form_attrs": {
+                "data-module": "select-from-json",
+                "data-module-mode": "sparql",
+                "data-module-source": "http://example.com/sparql",
+                "data-module-query": "SELECT ?subject ?label {}",
+            },
+        }) == ("sparql", "http://example.com/sparql",
+               "SELECT ?subject ?label {}")
+
+    def test_other_module(self):
+        assert remote_choices.field_source({
+            "field_name": "title",
+            "form_attrs": {"data-module": "slug-preview-target"},
+        }) is None
+
+    def test_find_subfield(self):
+        schema = {"dataset_fields": [{
+            "field_name": "contacts",
+            "repeating_subfields": [{"field_name": "role"}],
+        }]}
+        assert remote_choices.find_field(schema, "role") == {
+            "field_name": "role"}
+        assert remote_choices.find_field(schema, "missing") is None
+
+
+class TestGetChoices(object):
+    def test_sparql_cached(self, server):
+        source = server + '/sparql'
+        h1, choices, body, expires = remote_choices.get_choices(
+            'sparql', source, 'SELECT')
+        h2, _, _, _ = remote_choices.get_choices('sparql', source, 'SELECT')
+        assert h1 == h2
+        assert len(choices) == 2
+        assert json.loads(body) == choices
+        assert _Handler.requests == [('POST', '/sparql')]
+
+    def test_json_get(self, server):
+        _, choices, _, _ = remote_choices.get_choices(
+            'json', server + '/themes.json')
+        assert choices[0]['label'] == 'Addresses'
+        assert _Handler.requests == [('GET', '/themes.json')]
+
+    def test_expired_refetched(self, server, monkeypatch):
+        source = server + '/themes.json'
+        remote_choices.get_choices('json', source)
+        cache = remote_choices._get_cache()
+        now = time.time()
+        monkeypatch.setattr(time, 'time', lambda: now + cache.ttl + 1)
+        remote_choices.get_choices('json', source)
+        assert len(_Handler.requests) == 2
+
+    def test_unavailable(self, server):
+        with pytest.raises(remote_choices.ChoicesUnavailable):
+            remote_choices.get_choices('json', server + '/missing')
+
+
+class TestRegistry(object):
+    def test_snapshot(self, server):
+        reg = remote_choices.Registry('sparql', server + '/sparql', 'SELECT')
+        assert reg.values is None
+        reg.refresh(wait=True)
+        assert reg.get() == frozenset(
+            ["http://example.com/m/1", "http://example.com/m/2"])
+        reg.get()
+        assert len(_Handler.requests) == 1
+
+    def test_unavailable_keeps_values(self, server):
+        reg = remote_choices.Registry('json', server + '/missing')
+        reg.refresh(wait=True)
+        assert reg.values is None
+        assert reg.expires > time.time()
+
+
+class TestSchemingRegistryUris(object):
+    def _validator(self, server):
+        from ckanext.scheming.validation import scheming_registry_uris
+        field = {
+            "field_name": "process",
+            "form_attrs": {
+                "data-module": "select-process",
+                "data-module-mode": "sparql",
+                "data-module-source": server + '/sparql',
+                "data-module-query": "SELECT",
+            },
+        }
+        validator = scheming_registry_uris(field, {})
+        remote_choices.registry(
+            'sparql', server + '/sparql', 'SELECT').refresh(wait=True)
+        return validator
+
+    def test_not_fetched_when_built(self, server):
+        from ckanext.scheming.validation import scheming_registry_uris
+        scheming_registry_uris({
+            "field_name": "metrics",
+            "form_attrs": {
+                "data-module": "select-from-json",
+                "data-module-source": server + '/metrics',
+            },
+        }, {})
+        assert _Handler.requests == []
+
+    def test_known_uris(self, server):
+        validator = self._validator(server)
+        value = json.dumps({"uri": "http://example.com/m/2", "label": "P"})
+        assert validator(value) == value
+        value = json.dumps({"http://example.com/m/1": {"label": "A"}})
+        assert validator(value) == value
+
+    def test_unknown_uri(self, server):
+        from ckantoolkit import Invalid
+        validator = self._validator(server)
+        with pytest.raises(Invalid):
+            validator(json.dumps({"uri": "http://example.com/m/3"}))
+
+    def test_unchecked_without_snapshot(self, server, caplog):
+        from ckanext.scheming.validation import scheming_registry_uris
+        validator = scheming_registry_uris({
+            "field_name": "metrics",
+            "form_attrs": {
+                "data-module": "select-from-json",
+                "data-module-source": server + '/missing',
+            },
+        }, {})
+        value = json.dumps({"http://example.com/m/9": {}})
+        assert validator(value) == value
+        assert "http://example.com/m/9" in caplog.text
+        remote_choices.registry(
+            'json', server + '/missing', None).refresh(wait=True)
+
+    def test_loaded_by_warmup(self, server):
+        from ckanext.scheming import warmup
+        from ckanext.scheming.validation import scheming_registry_uris
+
+        class Plugin(object):
+            _expanded_schemas = {"test": {"dataset_fields": [{
+                "field_name": "metrics",
+                "form_attrs": {
+                    "data-module": "select-from-json",
+                    "data-module-source": server + '/metrics',
+                },
+            }]}}
+
+        validator = scheming_registry_uris(
+            Plugin._expanded_schemas["test"]["dataset_fields"][0], {})
+        assert warmup.prefetch_choices([Plugin]) == 1
+        value = json.dumps({"http://example.com/theme/hy": {}})
+        assert validator(value) == value
+        assert len(_Handler.requests) == 1
@@ -0,0 +1,105 @@
+import pytest
+from ckanapi import LocalCKAN
+
+from ckanext.scheming import validator_stats
+from ckanext.scheming.validation import validators_from_string
+
+SCHEMA = {"dataset_type": "test-schema"}
+FIELD = {"field_name": "title"}
+
+
+@pytest.fixture
+def stats_enabled():
+    validator_stats.configure({"scheming.validator_stats": "true"})
+    validator_stats.reset()
+    yield
+    validator_stats.configure({})
+    validator_stats.reset()
+
+
+class TestTimed(object):
+    def test_disabled_returns_validator(self):
+        def upper(value):
+            return value.upper()
+
+        assert validator_stats.timed(upper, SCHEMA, FIELD) is upper
+
+    @pytest.mark.usefixtures("stats_enabled")
+    def test_keeps_argument_count(self):
+        def one(value):
+            return value
+
+        def two(value, context):
+            return value
+
+        def four(key, data, errors, context):
+            data[key] = 1
+
+        for fn, count in ((one, 1), (two, 2), (four, 4)):
+            wrapped = validator_stats.timed(fn, SCHEMA, FIELD)
+            assert wrapped is not fn
+            assert wrapped.__code__.co_argcount == count
+            assert wrapped.__wrapped__ is fn
+
+    @pytest.mark.usefixtures("stats_enabled")
+    def test_leaves_classes_and_wrapped_alone(self):
+        assert validator_stats.timed(int, SCHEMA, FIELD) is int
+
+        def one(value):
+            return value
+
+        wrapped = validator_stats.timed(one, SCHEMA, FIELD)
+        assert validator_stats.timed(wrapped, SCHEMA, FIELD) is wrapped
+
+    @pytest.mark.usefixtures("stats_enabled")
+    def test_records_calls_and_errors(self):
+        def check(value):
+            if not value:
+                raise ValueError(value)
+            return value
+
+        wrapped = validator_stats.timed(check, SCHEMA, FIELD, "check(x)")
+        assert wrapped("a") == "a"
+        with pytest.raises(ValueError):
+            wrapped("")
+
+        (stat,) = validator_stats.stats()
+        assert stat["type"] == "test-schema"
+        assert stat["field"] == "title"
+        assert stat["validator"] == "check(x)"
+        assert stat["calls"] == 2
+        assert stat["max_ms"] <= stat["total_ms"]
+
+    @pytest.mark.usefixtures("stats_enabled")
+    def test_validators_from_string_named_by_schema(self):
+        (v,) = validators_from_string("if_empty_same_as(name)", FIELD, SCHEMA)
+        assert v.scheming_stats_key == (
+            "test-schema", "title", "if_empty_same_as(name)")
+
+
+class TestSinks(object):
+    def test_metric_name(self):
+        assert validator_stats.metric_name(
+            ("test-schema", "title", "if_empty_same_as(name)")
+        ) == "scheming.validator.test-schema.title.if_empty_same_as_name"
+        assert validator_stats.metric_name(
+            ("test-schema", None, "not_empty")
+        ) == "scheming.validator.test-schema._.not_empty"
+
+    def test_sink_from_config(self):
+        sink = validator_stats._make_sink("statsd://example.org:9125")
+        assert sink.address == ("example.org", 9125)
+        assert isinstance(validator_stats._make_sink("log"),
+                          validator_stats.LogSink)
+        assert validator_stats._make_sink(None) is None
+
+
+@pytest.mark.usefixtures("clean_db", "stats_enabled")
+class TestValidationStatsAction(object):
+    def test_stats_returned(self):
+        lc = LocalCKAN()
+        validator_stats.timed(
+            lambda value: value, SCHEMA, FIELD, "strip")("x")
+        result = lc.action.scheming_validation_stats()
+        assert result["enabled"]
+        assert result["validators"][0]["validator"] == "strip"
@@ -0,0 +1,65 @@
+import contextlib
+
+from mock import patch
+
+from ckanext.scheming import warmup
+from ckanext.scheming.plugins import SchemingDatasetsPlugin
+
+
+class RecordingEnv(object):
+    def __init__(self):
+        self.loaded = []
+
+    def get_template(self, path):
+        self.loaded.append(path)
+
+
+class FakeApp(object):
+    def __init__(self):
+        self.jinja_env = RecordingEnv()
+
+    @contextlib.contextmanager
+    def app_context(self):
+        yield
+
+
+class TestWarmup(object):
+    def test_build_validators(self):
+        plugin = SchemingDatasetsPlugin.instance
+        plugin._validators_cache.clear()
+
+        count = warmup.build_validators([plugin])
+
+        assert count == 3 * len(plugin._expanded_schemas)
+        assert {key[:2] for key in plugin._validators_cache} >= {
+            ("test-schema", "create"),
+            ("test-schema", "update"),
+            ("test-schema", "show"),
+        }
+
+    def test_compile_templates(self):
+        plugin = SchemingDatasetsPlugin.instance
+        app = FakeApp()
+
+        count = warmup.compile_templates([plugin], app)
+
+        assert count == len(app.jinja_env.loaded)
+        assert "scheming/snippets/form_field.html" in app.jinja_env.loaded
+        assert "scheming/form_snippets/text.html" in app.jinja_env.loaded
+        assert "scheming/display_snippets/text.html" in app.jinja_env.loaded
+
+    def test_no_flask_app(self):
+        assert warmup.compile_templates(
+            [SchemingDatasetsPlugin.instance], object()) == 0
+
+    def test_run_logs_every_stage(self):
+        timings = warmup.run([SchemingDatasetsPlugin.instance], FakeApp())
+        assert [stage for stage, count, seconds in timings] == [
+            "validators", "templates", "choices"]
+
+    def test_uncached_helper_choices_not_fetched(self):
+        with patch(
+                "ckanext.scheming.helpers.scheming_field_choices") as choices:
+            assert warmup.prefetch_choices(
+                [SchemingDatasetsPlugin.instance]) == 0
+        assert not choices.called
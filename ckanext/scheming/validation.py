@@ -4,12 +4,10 @@ from collections import defaultdict
 import itertools
 import logging
 
-import pytz
 import six
 import string
 import requests
 
-import ckan.lib.helpers as h
 from ckan.lib.navl.dictization_functions import convert
 from ckantoolkit import (
     get_validator,
@@ -23,6 +21,9 @@ from decimal import Decimal, DecimalException
 
 import ckanext.scheming.helpers as sh
 from ckanext.scheming.errors import SchemingException
+from ckanext.scheming import validator_stats, remote_choices, composite
+
+log = logging.getLogger(__name__)
 
 OneOf = get_validator('OneOf')
 ignore_missing = get_validator('ignore_missing')
@@ -71,7 +72,7 @@ def scheming_subfields(field, schema):
 
             # Group our unrolled fields by their index.
             values = defaultdict(dict)
-            for k in _junk.keys():
+            for k in list(_junk.keys()):
                 if k[0] == key[0]:
                     name = k[2]
                     index = k[1]
@@ -115,7 +116,7 @@ def scheming_subfields(field, schema):
                 # of issues.
                 errors[key].extend(
                     itertools.chain.from_iterable(
-                        v for v in entry_errors.itervalues()
+                        six.itervalues(entry_errors)
                     )
                 )
 
@@ -131,9 +132,9 @@ def scheming_subfields(field, schema):
         # such as ckanext-restricted make assumptions on how values are stored.
 
         if 'repeating_subfields' in field:
-            data[key] = json.dumps(value)
+            data[key] = composite.encode(value)
         elif value:
-            data[key] = json.dumps(value[0])
+            data[key] = composite.encode(value[0])
 
     return subfields_validator
 
@@ -261,7 +262,7 @@ def validate_date_inputs(field, key, data, extras, errors, context):
     if value:
         try:
             value_full = value
-            date = h.date_str_to_datetime(value)
+            date = sh.iso_str_to_datetime(value)
         except (TypeError, ValueError) as e:
             errors[date_key].append(date_error)
 
@@ -273,17 +274,17 @@ def validate_date_inputs(field, key, data, extras, errors, context):
         else:
             try:
                 value_full += ' ' + value
-                date = h.date_str_to_datetime(value_full)
+                date = sh.iso_str_to_datetime(value_full)
             except (TypeError, ValueError) as e:
                 errors[time_key].append(time_error)
 
     tz_key, value = get_input('tz')
     if value:
-        if value not in pytz.all_timezones:
+        if value not in sh.ALL_TIMEZONES:
             errors[tz_key].append('Invalid timezone')
         else:
             if isinstance(date, datetime.datetime):
-                date = pytz.timezone(value).localize(date)
+                date = sh.get_timezone(value).localize(date)
 
     return date
 
@@ -300,7 +301,7 @@ def scheming_isodatetime(field, schema):
                 return value
             else:
                 try:
-                    date = h.date_str_to_datetime(value)
+                    date = sh.iso_str_to_datetime(value)
                 except (TypeError, ValueError) as e:
                     raise Invalid(_('Date format incorrect'))
         else:
@@ -385,6 +386,44 @@ def scheming_valid_json_object(value, context):
         )
 
 
+@scheming_validator
+@register_validator
+def scheming_registry_uris(field, schema):
+    """
+    Require that the URIs selected in a select_from_json or
+    select_process field are offered by the field's data-module-source.
+
+    Use after scheming_valid_json_object. Values are checked against a
+    snapshot of the source refreshed in the background, validation never
+    waits for the source. Until the first snapshot is available values
+    are accepted and logged as unchecked.
+    """
+    source = remote_choices.field_source(field)
+    if not source:
+        return lambda value: value
+    registry = remote_choices.registry(*source)
+
+    def validator(value):
+        if value is missing or not value:
+            return value
+        selected = json.loads(value) if isinstance(
+            value, six.string_types) else value
+        if 'uri' in selected:
+            selected = [selected['uri']]
+        uris = registry.get()
+        if uris is None:
+            log.warning(
+                'URIs of %s not checked, %s not fetched yet: %s',
+                field['field_name'], source[1], ', '.join(sorted(selected)))
+            return value
+        unknown = sorted(u for u in selected if u not in uris)
+        if unknown:
+            raise Invalid(_('unknown URI: {}').format(', '.join(unknown)))
+        return value
+
+    return validator
+
+
 @register_validator
 def scheming_load_json(value, context):
     if isinstance(value, six.string_types):
@@ -426,6 +465,8 @@ def validators_from_string(s, field, schema):
             v = get_validator_or_converter(p)
         if getattr(v, 'is_a_scheming_validator', False):
             v = v(field, schema)
+        if validator_stats.enabled:
+            v = validator_stats.timed(v, schema, field, p)
         out.append(v)
     return out
 
@@ -0,0 +1,223 @@
+"""
+Optional timing and call counts for scheming validators. Enable with::
+
+    scheming.validator_stats = true
+    # optional, also report every call:
+    scheming.validator_stats.sink = log   # or statsd://localhost:8125
+
+Validators are wrapped as they are built from the schemas, so while
+this is disabled nothing is wrapped and validation runs unchanged.
+Plain functions and methods taking (value), (value, context) or
+(key, data, errors, context) are timed, other callables are left alone.
+"""
+import inspect
+import logging
+import re
+import socket
+import threading
+import time
+
+from ckantoolkit import asbool
+
+from ckanext.scheming.errors import SchemingException
+
+log = logging.getLogger(__name__)
+
+try:
+    _clock = time.perf_counter
+except AttributeError:  # Python 2
+    _clock = time.time
+
+enabled = False
+_sink = None
+_stats = {}
+_lock = threading.Lock()
+
+_METRIC_UNSAFE_RE = re.compile(r'[^A-Za-z0-9_-]+')
+
+
+def configure(config):
+    """
+    Enable or disable instrumentation from the config, must be called
+    before validators are built
+    """
+    global enabled, _sink
+    enabled = asbool(config.get('scheming.validator_stats', False))
+    _sink = _make_sink(
+        config.get('scheming.validator_stats.sink')) if enabled else None
+
+
+def timed(validator, schema, field, name=None):
+    """
+    Return validator wrapped to record its calls under (schema type,
+    field name, name), or validator unchanged when disabled.
+
+    :param field: the scheming field, None for schema-level validators
+    :param name: the name to report, defaults to the validator's name
+    """
+    if not enabled or hasattr(validator, 'scheming_stats_key'):
+        return validator
+    wrapper = _WRAPPERS.get(_arg_count(validator))
+    if wrapper is None:
+        return validator
+    key = (
+        _schema_type(schema),
+        field['field_name'] if field else None,
+        name or getattr(validator, '__name__', repr(validator)),
+    )
+    return wrapper(validator, key)
+
+
+def stats():
+    """
+    Return the aggregates recorded so far, slowest total first
+    """
+    with _lock:
+        items = [(key, tuple(value)) for key, value in _stats.items()]
+    out = [{
+        'type': t,
+        'field': field,
+        'validator': validator,
+        'calls': calls,
+        'total_ms': total * 1000,
+        'mean_ms': total * 1000 / calls,
+        'max_ms': slowest * 1000,
+    } for (t, field, validator), (calls, total, slowest) in items]
+    out.sort(key=lambda s: s['total_ms'], reverse=True)
+    return out
+
+
+def reset():
+    """
+    Forget the aggregates recorded so far
+    """
+    with _lock:
+        _stats.clear()
+
+
+def metric_name(key):
+    """
+    Return a statsd metric name for a (type, field, validator) key
+    """
+    return 'scheming.validator.' + '.'.join(
+        _METRIC_UNSAFE_RE.sub('_', part or '_').strip('_') or '_'
+        for part in key)
+
+
+class LogSink(object):
+    """
+    Log each call in statsd line format at debug level
+    """
+    def __init__(self, logger=log):
+        self.logger = logger
+
+    def __call__(self, key, elapsed):
+        self.logger.debug('%s:%.3f|ms', metric_name(key), elapsed * 1000)
+
+
+class StatsdSink(object):
+    """
+    Send each call as a statsd timing over UDP, errors are ignored
+    """
+    def __init__(self, host='localhost', port=8125):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, key, elapsed):
+        line = '%s:%.3f|ms' % (metric_name(key), elapsed * 1000)
+        try:
+            self.socket.sendto(line.encode('ascii'), self.address)
+        except socket.error:
+            pass
+
+
+def _make_sink(url):
+    if not url:
+        return None
+    if url == 'log':
+        return LogSink()
+    if url.startswith('statsd://'):
+        host, _, port = url[len('statsd://'):].partition(':')
+        return StatsdSink(host or 'localhost', int(port or 8125))
+    raise SchemingException(
+        'Unknown scheming.validator_stats.sink: %r' % url)
+
+
+def _record(key, elapsed):
+    with _lock:
+        value = _stats.get(key)
+        if value is None:
+            value = _stats[key] = [0, 0.0, 0.0]
+        value[0] += 1
+        value[1] += elapsed
+        if elapsed > value[2]:
+            value[2] = elapsed
+    if _sink is not None:
+        _sink(key, elapsed)
+
+
+def _schema_type(schema):
+    if not schema:
+        return None
+    return (
+        schema.get('dataset_type') or
+        schema.get('group_type') or
+        schema.get('organization_type'))
+
+
+def _arg_count(fn):
+    """
+    Return the number of positional arguments fn is called with, or
+    None for callables that can't be inspected
+    """
+    code = getattr(fn, '__code__', None)
+    if code is None or inspect.isclass(fn):
+        return None
+    count = code.co_argcount
+    if inspect.ismethod(fn) and getattr(fn, '__self__', None) is not None:
+        count -= 1
+    return count
+
+
+# navl picks the call signature from the validator's arguments, so each
+# wrapper takes exactly the arguments of the validator it wraps. Wrappers
+# keep their own __name__: older CKAN versions match it against the
+# TypeError raised when trying signatures.
+
+def _mark(wrapper, fn, key):
+    wrapper.__wrapped__ = fn
+    wrapper.scheming_stats_key = key
+    return wrapper
+
+
+def _timed_1(fn, key):
+    def timed_validator(value):
+        start = _clock()
+        try:
+            return fn(value)
+        finally:
+            _record(key, _clock() - start)
+    return _mark(timed_validator, fn, key)
+
+
+def _timed_2(fn, key):
+    def timed_validator(value, context):
+        start = _clock()
+        try:
+            return fn(value, context)
+        finally:
+            _record(key, _clock() - start)
+    return _mark(timed_validator, fn, key)
+
+
+def _timed_4(fn, key):
+    def timed_validator(key_, data, errors, context):
+        start = _clock()
+        try:
+            return fn(key_, data, errors, context)
+        finally:
+            _record(key, _clock() - start)
+    return _mark(timed_validator, fn, key)
+
+
+_WRAPPERS = {1: _timed_1, 2: _timed_2, 4: _timed_4}
@@ -0,0 +1,113 @@
+# encoding: utf-8
+"""
+Flask views (CKAN 2.9+)
+"""
+import time
+
+from flask import Blueprint, Response, request, abort, stream_with_context
+
+import ckan.authz as authz
+from ckantoolkit import asbool, g
+
+from ckanext.scheming import reloader, remote_choices, export
+from ckanext.scheming.helpers import (
+    schema_payload, schema_bundle, scheming_get_schema)
+
+scheming = Blueprint(u'scheming', __name__)
+
+
+@scheming.before_app_request
+def reload_schemas():
+    u'''
+    Pick up changed schema files when scheming.reload is enabled
+    '''
+    reloader.check()
+
+
+def schema_show(entity_type, object_type):
+    u'''
+    Return a dataset, group or organization schema as JSON, prepared
+    when the schema was loaded. Responses carry an ETag so clients can
+    revalidate with If-None-Match and receive 304 Not Modified.
+
+    :param expanded: true to expand presets (default)
+    '''
+    expanded = asbool(request.args.get(u'expanded', True))
+    payload = schema_payload(entity_type, object_type, expanded)
+    if payload is None:
+        abort(404)
+    return _conditional_response(*payload)
+
+
+def bundle_show():
+    u'''
+    Return the scheming_schema_bundle result as JSON prepared once after
+    the schemas are loaded, with an ETag like schema_show.
+
+    :param expanded: true to expand presets (default)
+    '''
+    expanded = asbool(request.args.get(u'expanded', True))
+    content_hash, bundle, body = schema_bundle(expanded)
+    return _conditional_response(content_hash, body)
+
+
+def choices_show(entity_type, object_type, field_name):
+    u'''
+    Return the choices for a select-from-json or select-process field
+    as [{"value": ..., "label": ...}, ...], fetched from the field's
+    data-module-source on the server and cached. Browsers may reuse the
+    response until the cached choices expire.
+    '''
+    schema = scheming_get_schema(entity_type, object_type)
+    field = schema and remote_choices.find_field(schema, field_name)
+    source = field and remote_choices.field_source(field)
+    if not source:
+        abort(404)
+    try:
+        content_hash, choices, body, expires = remote_choices.get_choices(
+            *source)
+    except remote_choices.ChoicesUnavailable:
+        abort(502)
+    return _conditional_response(
+        content_hash, body, max(0, int(expires - time.time())))
+
+
+def export_show(dataset_type, fmt):
+    u'''
+    Stream all datasets of a type as CSV or JSON lines (sysadmins only)
+    '''
+    if not authz.is_sysadmin(g.user):
+        abort(403)
+    schema = scheming_get_schema(u'dataset', dataset_type)
+    if schema is None:
+        abort(404)
+    response = Response(
+        stream_with_context(export.export_lines(schema, fmt)),
+        mimetype=u'text/csv' if fmt == u'csv' else u'application/x-ndjson')
+    response.headers[u'Content-Disposition'] = (
+        u'attachment; filename="{0}.{1}"'.format(dataset_type, fmt))
+    return response
+
+
+def _conditional_response(content_hash, body, max_age=None):
+    response = Response(body, mimetype=u'application/json')
+    response.set_etag(content_hash)
+    if max_age is None:
+        response.headers[u'Cache-Control'] = u'no-cache'
+    else:
+        response.headers[u'Cache-Control'] = u'public, max-age=%d' % max_age
+    return response.make_conditional(request)
+
+
+scheming.add_url_rule(u'/api/scheming/bundle', view_func=bundle_show)
+scheming.add_url_rule(
+    u'/api/scheming/<any(dataset, group, organization):entity_type>'
+    u'/<object_type>',
+    view_func=schema_show)
+scheming.add_url_rule(
+    u'/api/scheming/choices/<any(dataset, group, organization):entity_type>'
+    u'/<object_type>/<field_name>',
+    view_func=choices_show)
+scheming.add_url_rule(
+    u'/api/scheming/export/<dataset_type>.<any(csv, jsonl):fmt>',
+    view_func=export_show)
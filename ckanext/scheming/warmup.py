@@ -0,0 +1,178 @@
+"""
+Optional warmup when the application is created, so workers serve
+their first requests without building scheming validators, compiling
+snippets or fetching choices. Enable with::
+
+    scheming.warmup = true
+
+Each stage is timed and logged. Errors are logged and don't stop the
+application from starting.
+"""
+import logging
+import threading
+import time
+
+from ckanext.scheming import remote_choices
+from ckanext.scheming.compiler import schema_fields
+
+log = logging.getLogger(__name__)
+
+try:
+    _clock = time.perf_counter
+except AttributeError:  # Python 2
+    _clock = time.time
+
+# templates rendering every scheming field
+FIELD_TEMPLATES = (
+    'scheming/snippets/form_field.html',
+    'scheming/snippets/display_field.html',
+)
+
+_done = {}
+
+
+def run(plugins, app=None):
+    """
+    Warm up the scheming plugin instances given, compiling templates
+    with app's Jinja environment when it has one. Returns
+    [(stage, count, seconds), ...]
+    """
+    timings = []
+    for stage, fn in (
+            ('validators', lambda: build_validators(plugins)),
+            ('templates', lambda: compile_templates(plugins, app)),
+            ('choices', lambda: prefetch_choices(plugins))):
+        start = _clock()
+        try:
+            count = fn()
+        except Exception:
+            log.exception('Scheming warmup of %s failed', stage)
+            count = 0
+        timings.append((stage, count, _clock() - start))
+
+    log.info('Scheming warmup: %s', ', '.join(
+        '{0} {1} in {2:.1f}ms'.format(stage, count, seconds * 1000)
+        for stage, count, seconds in timings))
+    return timings
+
+
+def run_once(plugins, app=None):
+    """
+    run() unless already done in this process
+    """
+    if _done.get('done'):
+        return None
+    _done['done'] = True
+    return run(plugins, app)
+
+
+def build_validators(plugins):
+    """
+    Build the compiled validators of every dataset type for create,
+    update and show, returning the number built
+    """
+    count = 0
+    for plugin in plugins:
+        compiled = getattr(plugin, '_compiled_validators', None)
+        if compiled is None:
+            continue
+        for t, schema in plugin._expanded_schemas.items():
+            for action_type, package_schema in (
+                    ('create', plugin.create_package_schema),
+                    ('update', plugin.update_package_schema),
+                    ('show', plugin.show_package_schema)):
+                names = package_schema()
+                convert = tuple(
+                    f['field_name'] not in names
+                    for f in schema['dataset_fields'])
+                compiled(t, action_type, convert)
+                count += 1
+    return count
+
+
+def snippet_paths(plugins):
+    """
+    Return the sorted template paths used by the fields of all schemas
+    """
+    paths = set(FIELD_TEMPLATES)
+    for plugin in plugins:
+        for schema in plugin._expanded_schemas.values():
+            for name, field in schema_fields(schema):
+                for key in ('form_snippet_path', 'display_snippet_path'):
+                    if field.get(key):
+                        paths.add(field[key])
+    return sorted(paths)
+
+
+def compile_templates(plugins, app):
+    """
+    Load every snippet used by the schemas into app's Jinja environment
+    cache, returning the number loaded. Nothing is done without a Flask
+    app (e.g. the Pylons app of CKAN 2.8).
+    """
+    env = getattr(app, 'jinja_env', None)
+    if env is None:
+        return 0
+    count = 0
+    with app.app_context():
+        for path in snippet_paths(plugins):
+            try:
+                env.get_template(path)
+                count += 1
+            except Exception as e:
+                log.warning('Scheming warmup could not compile %s: %s',
+                            path, e)
+    return count
+
+
+def prefetch_choices(plugins):
+    """
+    Fetch the choices cached by scheming: remote choices of
+    select-from-json and select-process fields, in parallel, also
+    loading the snapshots scheming_registry_uris checks values against,
+    and scheming_datastore_choices when scheming.datastore_choices.ttl
+    enables its cache. Other choices aren't cached, so fetching them
+    here would be wasted. Returns the number of choice lists fetched.
+    """
+    from ckanext.scheming.helpers import (
+        scheming_field_choices, _datastore_choices_cache)
+
+    cache_datastore = _datastore_choices_cache() is not None
+    sources = set()
+    helper_fields = []
+    for plugin in plugins:
+        for schema in plugin._expanded_schemas.values():
+            for name, field in schema_fields(schema):
+                source = remote_choices.field_source(field)
+                if source:
+                    sources.add(source)
+                elif cache_datastore and field.get(
+                        'choices_helper') == 'scheming_datastore_choices':
+                    helper_fields.append(field)
+
+    fetched = []
+
+    def fetch(source):
+        registry = remote_choices.registry(*source)
+        registry.refresh(wait=True)
+        if registry.values is not None:
+            fetched.append(source)
+
+    threads = [threading.Thread(target=fetch, args=(source,))
+               for source in sources]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    count = 0
+    for field in helper_fields:
+        try:
+            scheming_field_choices(field)
+            count += 1
+        except Exception as e:
+            log.warning('Scheming warmup could not get choices for %s: %s',
+                        field['field_name'], e)
+
+    for thread in threads:
+        thread.join()
+    return count + len(fetched)